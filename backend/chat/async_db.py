@@ -0,0 +1,111 @@
+import json
+import os
+from typing import TYPE_CHECKING, Dict, Any, Optional
+
+from db import PREPARED_STATEMENTS, to_positional
+from queries import QUERIES, read_action_payload, read_action_query
+from tracing import span
+
+if TYPE_CHECKING:
+    import asyncio
+
+    import asyncpg
+
+ASYNC_POOL_SIZE = int(os.environ.get('CHAT_ASYNC_POOL_SIZE', '4'))
+# Кэш подготовленных выражений asyncpg на соединение; 0 при CHAT_PREPARED_STATEMENTS=0 (пулер в режиме транзакций)
+STATEMENT_CACHE_SIZE = 100 if PREPARED_STATEMENTS else 0
+
+# Цикл событий тёплого инстанса: пулы asyncpg привязаны к циклу, на котором созданы,
+# поэтому синхронная точка входа выполняет все вызовы на одном и том же цикле.
+# asyncio и asyncpg импортируются и цикл создаётся при первом асинхронном вызове:
+# синхронные действия и холодный старт (benchmarks/cold_start.py) их не оплачивают
+_loop: Optional['asyncio.AbstractEventLoop'] = None
+_pools: Dict[str, 'asyncio.Task'] = {}
+
+
+def run_async(coro) -> Any:
+    '''
+    Выполнение корутины на цикле инстанса из синхронного кода (handler платформы).
+    Из уже работающего цикла вызывать корутину напрямую
+    '''
+    global _loop
+    if _loop is None:
+        import asyncio
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+async def _init_connection(conn) -> None:
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def get_pool(database_url: str) -> 'asyncpg.Pool':
+    '''
+    Пул соединений по DSN, общий для вызовов инстанса. Параллельные первые обращения
+    ждут одно и то же создание пула; неудачное создание не кэшируется
+    '''
+    import asyncio
+
+    import asyncpg
+
+    task = _pools.get(database_url)
+    if task is None or (task.done() and (task.exception() or task.result().is_closing())):
+        task = asyncio.ensure_future(asyncpg.create_pool(
+            database_url, min_size=1, max_size=ASYNC_POOL_SIZE,
+            init=_init_connection, statement_cache_size=STATEMENT_CACHE_SIZE
+        ))
+        _pools[database_url] = task
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        if _pools.get(database_url) is task:
+            del _pools[database_url]
+        raise
+
+
+async def close_pools() -> None:
+    '''
+    Закрытие всех пулов инстанса: соединения завершаются штатно, а не обрывом при выходе процесса
+    '''
+    tasks = list(_pools.values())
+    _pools.clear()
+    for task in tasks:
+        if task.done() and not task.exception():
+            await task.result().close()
+
+
+async def get_replica_pool(replica_url: str, min_lsn: Optional[str] = None) -> Optional['asyncpg.Pool']:
+    '''
+    Пул реплики для чтения; read-your-writes по LSN из токена записи, как db.get_replica_connection.
+    Проверка идёт и без токена: остановленная реплика не должна ронять чтение
+    Returns: пул или None, если реплика недоступна либо ещё не применила min_lsn
+    '''
+    import asyncpg
+
+    try:
+        pool = await get_pool(replica_url)
+        if min_lsn:
+            caught_up = await pool.fetchval('SELECT pg_last_wal_replay_lsn() >= $1::text::pg_lsn', min_lsn)
+        else:
+            caught_up = await pool.fetchval('SELECT true')
+    except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+        return None
+    return pool if caught_up else None
+
+
+async def fetch(pool: 'asyncpg.Pool', sql: str, args: tuple = ()) -> list:
+    '''
+    Строки запроса в стиле psycopg2 (%s) на свободном соединении пула
+    '''
+    return await pool.fetch(to_positional(sql), *args)
+
+
+async def run_read_action_async(pool: 'asyncpg.Pool', action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Чтение из READ_ACTIONS на пуле: те же запросы, аргументы и маппинг строк, что у run_read_action
+    '''
+    name, args = read_action_query(action, params)
+    with span('db.query', query=name):
+        rows = await fetch(pool, QUERIES[name], args)
+    return read_action_payload(action, rows, params)
@@ -0,0 +1,150 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict, Any, Optional, Tuple, List
+from directory import get_employee
+
+PBKDF2_ALGORITHM = 'pbkdf2_sha256'
+PBKDF2_ITERATIONS = 260000
+TOKEN_TTL_SECONDS = 12 * 60 * 60
+ROLES_CACHE_TTL_SECONDS = 60
+ADMIN_ROLES = ('admin',)
+
+_roles_cache: Dict[int, Tuple[float, List[str]]] = {}
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _secret() -> bytes:
+    '''
+    Ключ подписи токенов: AUTH_TOKEN_SECRET, иначе производный от DATABASE_URL,
+    чтобы все тёплые инстансы функции подписывали одинаково
+    '''
+    secret = os.environ.get('AUTH_TOKEN_SECRET')
+    if secret:
+        return secret.encode('utf-8')
+    return hashlib.sha256(b'chat-auth:' + os.environ.get('DATABASE_URL', '').encode('utf-8')).digest()
+
+
+def hash_password(password: str) -> str:
+    '''
+    Солёный PBKDF2-хеш пароля в формате algorithm$iterations$salt$hash
+    '''
+    import secrets
+
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PBKDF2_ITERATIONS)
+    return f'{PBKDF2_ALGORITHM}${PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+def verify_password(password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+    '''
+    Проверка пароля против сохранённого значения
+    Returns: (совпал ли пароль, нужно ли перехешировать)
+    Старые пароли, сохранённые открытым текстом, принимаются и помечаются для перехеширования
+    '''
+    if not stored:
+        return False, False
+
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != PBKDF2_ALGORITHM:
+        matched = hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+        return matched, matched
+
+    # Испорченный хеш в БД - несовпадение пароля, а не ошибка входа (binascii.Error - подкласс ValueError)
+    try:
+        iterations = int(parts[1])
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), _b64decode(parts[2]), iterations)
+        matched = hmac.compare_digest(digest, _b64decode(parts[3]))
+    except (ValueError, OverflowError):
+        return False, False
+    return matched, matched and iterations < PBKDF2_ITERATIONS
+
+
+def issue_token(employee_id: int, now: Optional[float] = None) -> Tuple[str, int]:
+    '''
+    Подписанный HMAC-SHA256 токен сессии
+    Returns: (токен, unix-время истечения)
+    '''
+    issued_at = int(now if now is not None else time.time())
+    expires_at = issued_at + TOKEN_TTL_SECONDS
+    payload = _b64encode(json.dumps({'sub': employee_id, 'iat': issued_at, 'exp': expires_at},
+                                    separators=(',', ':')).encode('utf-8'))
+    signature = _b64encode(hmac.new(_secret(), payload.encode('ascii'), hashlib.sha256).digest())
+    return f'{payload}.{signature}', expires_at
+
+
+def verify_token(token: Optional[str], now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    '''
+    Локальная проверка подписи и срока действия токена без обращения к БД
+    '''
+    if not token or token.count('.') != 1:
+        return None
+
+    payload, signature = token.split('.')
+    try:
+        expected = _b64encode(hmac.new(_secret(), payload.encode('ascii'), hashlib.sha256).digest())
+        if not hmac.compare_digest(signature.encode('ascii'), expected.encode('ascii')):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+
+    if not isinstance(claims, dict) or not isinstance(claims.get('exp', 0), (int, float)):
+        return None
+    if claims.get('exp', 0) < (now if now is not None else time.time()):
+        return None
+    return claims
+
+
+def cache_roles(employee_id: int, roles: List[str]) -> None:
+    _roles_cache[employee_id] = (time.monotonic() + ROLES_CACHE_TTL_SECONDS, list(roles))
+
+
+def invalidate_roles(employee_id: Optional[int] = None) -> None:
+    if employee_id is None:
+        _roles_cache.clear()
+    else:
+        _roles_cache.pop(int(employee_id), None)
+
+
+def get_roles(cur, employee_id: int) -> List[str]:
+    '''
+    Набор ролей сотрудника из TTL-кеша, при промахе - из справочника сотрудников
+    '''
+    cached = _roles_cache.get(employee_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    employee = get_employee(cur, employee_id)
+    roles = (employee['roles'] or [employee['role']]) if employee else []
+    cache_roles(employee_id, roles)
+    return roles
+
+
+def get_auth_token(event: Dict[str, Any]) -> Optional[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'x-auth-token':
+            return value
+    return None
+
+
+def authenticate(event: Dict[str, Any], cur) -> Optional[Dict[str, Any]]:
+    '''
+    Сотрудник из заголовка X-Auth-Token: id и роли, либо None
+    '''
+    claims = verify_token(get_auth_token(event))
+    if not claims:
+        return None
+
+    employee_id = int(claims['sub'])
+    return {'id': employee_id, 'roles': get_roles(cur, employee_id), 'expiresAt': claims['exp']}
@@ -0,0 +1,121 @@
+import base64
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from tracing import span
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '2048'))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+
+def _gzip(data: bytes) -> bytes:
+    import gzip
+
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    import brotli
+
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def _zstd(data: bytes) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def _available(module: str) -> bool:
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+_encoders: Optional[List[Tuple[str, Any]]] = None
+
+
+def get_encoders() -> List[Tuple[str, Any]]:
+    '''
+    Доступные кодировки в порядке предпочтения при равном q; brotli и zstandard
+    ищутся при первом сжатии, а не при импорте - ответы ниже порога их не требуют
+    '''
+    global _encoders
+    if _encoders is None:
+        _encoders = [
+            (name, encoder) for name, encoder, module in (
+                ('zstd', _zstd, 'zstandard'),
+                ('br', _brotli, 'brotli'),
+                ('gzip', _gzip, 'gzip')
+            ) if _available(module)
+        ]
+    return _encoders
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    accepted = {}
+    for part in value.split(','):
+        token, _, params = part.strip().partition(';')
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Tuple[str, Any]:
+    '''
+    Лучшая доступная кодировка из Accept-Encoding с учётом q и '*'
+    Returns: (имя, функция сжатия) или ('', None)
+    '''
+    accepted = parse_accept_encoding(accept_encoding)
+    best = ('', None)
+    best_q = 0.0
+    for name, encoder in get_encoders():
+        q = accepted.get(name, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = (name, encoder), q
+    return best
+
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any],
+                      min_bytes: int = COMPRESSION_MIN_BYTES) -> Dict[str, Any]:
+    '''
+    Сжатие тела ответа выше порога по Accept-Encoding запроса;
+    сжатое тело отдаётся в base64 с isBase64Encoded по контракту шлюза функций
+    '''
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded') or len(body) < min_bytes:
+        return response
+
+    accept_encoding = ''
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'accept-encoding':
+            accept_encoding = value or ''
+    name, encoder = choose_encoding(accept_encoding)
+    if not encoder:
+        return response
+
+    raw = body.encode('utf-8')
+    with span('compress', encoding=name, bytes=len(raw)):
+        compressed = encoder(raw)
+    # Шлюз получает тело в base64, поэтому сравнивается его размер, а не сжатых байтов
+    if 4 * ((len(compressed) + 2) // 3) >= len(raw):
+        return response
+
+    return {
+        **response,
+        'headers': {**response.get('headers', {}), 'Content-Encoding': name, 'Vary': 'Accept-Encoding'},
+        'isBase64Encoded': True,
+        'body': base64.b64encode(compressed).decode('ascii')
+    }
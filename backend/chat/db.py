@@ -0,0 +1,174 @@
+import os
+import re
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+from tracing import span
+
+PREPARED_STATEMENTS = os.environ.get('CHAT_PREPARED_STATEMENTS', '1') != '0'
+
+# Соединения тёплого инстанса по DSN (primary и реплика) и имена выражений, подготовленных на каждом
+_connections: Dict[str, object] = {}
+_prepared: Dict[int, Set[str]] = {}
+
+_PLACEHOLDER = re.compile(r'%s')
+
+
+class ChatConnection(psycopg2.extensions.connection):
+    '''
+    Соединение тёплого инстанса: внутри deferred_commit() commit() не фиксирует транзакцию,
+    в том числе через cursor.connection - её фиксирует тот, кто открыл блок
+    '''
+    commit_deferred = False
+
+    def commit(self) -> None:
+        if not self.commit_deferred:
+            super().commit()
+
+
+@contextmanager
+def deferred_commit(conn, enabled: bool = True) -> Iterator[None]:
+    '''
+    Все фиксации внутри блока становятся одной транзакцией с тем, что вызывающий запишет после него
+    '''
+    if not enabled:
+        yield
+        return
+    conn.commit_deferred = True
+    try:
+        yield
+    finally:
+        conn.commit_deferred = False
+
+
+def get_connection(database_url: str, slot: str = ''):
+    '''
+    Соединение, переиспользуемое между вызовами тёплого инстанса, без запроса к серверу:
+    разорванное соединение отбрасывается в release_connection после ошибки вызова.
+    slot - отдельное соединение с тем же DSN, например для потоков, работающих одновременно с вызовом
+    '''
+    key = f'{slot}:{database_url}' if slot else database_url
+    with span('db.connect') as connect_span:
+        conn = _connections.get(key)
+        if conn is not None and not conn.closed:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                connect_span.set(reused=True)
+                return conn
+            _discard(key)
+
+        connect_span.set(reused=False)
+        conn = psycopg2.connect(database_url, connection_factory=ChatConnection)
+        _connections[key] = conn
+        _prepared[id(conn)] = set()
+        return conn
+
+
+def get_replica_connection(replica_url: str, min_lsn: Optional[str] = None):
+    '''
+    Соединение с репликой для чтения; read-your-writes по LSN из токена записи
+    Returns: соединение или None, если реплика недоступна либо ещё не применила min_lsn
+    '''
+    try:
+        conn = get_connection(replica_url)
+    except psycopg2.Error:
+        return None
+    if not min_lsn:
+        return conn
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn', (min_lsn,))
+            caught_up = cur.fetchone()[0]
+    except psycopg2.DataError:
+        conn.rollback()
+        return None
+    except psycopg2.Error:
+        _discard(replica_url)
+        return None
+    if not caught_up:
+        conn.rollback()
+        return None
+    return conn
+
+
+def current_wal_lsn(cur) -> str:
+    '''
+    Позиция WAL после фиксации записи - токен для последующих чтений с реплики
+    '''
+    cur.execute('SELECT pg_current_wal_lsn()::text AS lsn')
+    return cur.fetchone()['lsn']
+
+
+def release_connection(conn) -> None:
+    '''
+    Возврат соединения после вызова: незавершённая транзакция откатывается,
+    сломанное соединение закрывается и при следующем вызове создаётся заново
+    '''
+    for database_url, pooled in _connections.items():
+        if pooled is conn:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                _discard(database_url)
+            return
+    conn.close()
+
+
+def _discard(database_url: str) -> None:
+    conn = _connections.pop(database_url, None)
+    if conn is None:
+        return
+    _prepared.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def to_positional(sql: str) -> str:
+    counter = iter(range(1, sql.count('%s') + 1))
+    return _PLACEHOLDER.sub(lambda _: f'${next(counter)}', sql)
+
+
+def execute_prepared(cur, name: str, sql: str, args: tuple = ()) -> None:
+    '''
+    EXECUTE по имени вместо текста запроса: PREPARE выполняется один раз на соединение.
+    PREPARE не транзакционен, откат вызова подготовленное выражение не удаляет.
+    Если сервер выражения не знает (DISCARD ALL на стороне пулера), список соединения сбрасывается;
+    в начале транзакции ошибка откатывается и выражение подготавливается заново, иначе она
+    пробрасывается - откат потерял бы уже сделанные в транзакции изменения
+    '''
+    with span('db.query', query=name) as query_span:
+        conn = cur.connection
+        prepared = _prepared.get(id(conn))
+        if not PREPARED_STATEMENTS or prepared is None:
+            cur.execute(sql, args)
+            return
+
+        statement = name.lower()
+        idle = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        try:
+            _execute_prepared(cur, prepared, statement, sql, args, query_span)
+        except psycopg2.errors.InvalidSqlStatementName:
+            prepared.clear()
+            if not idle:
+                raise
+            conn.rollback()
+            query_span.set(reprepared=True)
+            _execute_prepared(cur, prepared, statement, sql, args, query_span)
+
+
+def _execute_prepared(cur, prepared: Set[str], statement: str, sql: str, args: tuple, query_span) -> None:
+    if statement not in prepared:
+        query_span.set(prepared=True)
+        cur.execute(f'PREPARE {statement} AS {to_positional(sql)}')
+        prepared.add(statement)
+
+    if args:
+        cur.execute(f'EXECUTE {statement} ({", ".join(["%s"] * len(args))})', args)
+    else:
+        cur.execute(f'EXECUTE {statement}')
@@ -0,0 +1,110 @@
+import time
+from typing import Dict, Any, Optional, List
+
+DIRECTORY_TTL_SECONDS = 300
+VERSION_CHECK_INTERVAL_SECONDS = 2
+DIRECTORY_CACHE_NAME = 'employees'
+
+_directory: Dict[str, Any] = {
+    'version': None,
+    'loaded_at': 0.0,
+    'checked_at': 0.0,
+    'employees': [],
+    'by_id': {}
+}
+
+
+def _current_version(cur) -> int:
+    cur.execute('''
+        SELECT version FROM cache_versions WHERE name = %s
+    ''', (DIRECTORY_CACHE_NAME,))
+    row = cur.fetchone()
+    return row['version'] if row else 0
+
+
+def _load(cur, version: int) -> None:
+    cur.execute('''
+        SELECT
+            e.id,
+            e.username,
+            e.name,
+            e.role,
+            e.status,
+            e.created_at,
+            e.updated_at,
+            COALESCE(
+                array_agg(er.role ORDER BY er.role) FILTER (WHERE er.role IS NOT NULL),
+                ARRAY[]::text[]
+            ) as roles
+        FROM employees e
+        LEFT JOIN employee_roles er ON e.id = er.employee_id
+        GROUP BY e.id, e.username, e.name, e.role, e.status, e.created_at, e.updated_at
+        ORDER BY e.name ASC
+    ''')
+    employees = [dict(emp) for emp in cur.fetchall()]
+    now = time.monotonic()
+    _directory.update({
+        'version': version,
+        'loaded_at': now,
+        'checked_at': now,
+        'employees': employees,
+        'by_id': {emp['id']: emp for emp in employees}
+    })
+
+
+def _ensure_fresh(cur) -> None:
+    '''
+    Перезагрузка справочника при истечении TTL или смене версии в cache_versions
+    Версия проверяется не чаще раза в VERSION_CHECK_INTERVAL_SECONDS
+    '''
+    now = time.monotonic()
+    if _directory['version'] is not None and now - _directory['checked_at'] < VERSION_CHECK_INTERVAL_SECONDS:
+        return
+
+    version = _current_version(cur)
+    if version == _directory['version'] and now - _directory['loaded_at'] < DIRECTORY_TTL_SECONDS:
+        _directory['checked_at'] = now
+        return
+
+    _load(cur, version)
+
+
+def get_employees(cur) -> List[Dict[str, Any]]:
+    '''
+    Все сотрудники с ролями, отсортированные по имени
+    '''
+    _ensure_fresh(cur)
+    return _directory['employees']
+
+
+def get_employee(cur, employee_id: int) -> Optional[Dict[str, Any]]:
+    '''
+    Сотрудник по id; промах перечитывает справочник, если он создан на другом инстансе
+    '''
+    _ensure_fresh(cur)
+    employee = _directory['by_id'].get(int(employee_id))
+    if employee is None and _directory['loaded_at'] != _directory['checked_at']:
+        _load(cur, _current_version(cur))
+        employee = _directory['by_id'].get(int(employee_id))
+    return employee
+
+
+def get_online_operators(cur) -> List[str]:
+    '''
+    Имена сотрудников со статусом online в порядке имени
+    '''
+    return [emp['name'] for emp in get_employees(cur) if emp['status'] == 'online']
+
+
+def invalidate_directory(cur) -> None:
+    '''
+    Инвалидация справочника: новая версия из последовательности в текущей транзакции
+    и сброс локальной копии. Номера не переиспользуются даже после отката. Вызывать до conn.commit()
+    '''
+    cur.execute('''
+        INSERT INTO cache_versions (name, version, updated_at)
+        VALUES (%s, nextval('cache_versions_seq'), CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE
+        SET version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP
+    ''', (DIRECTORY_CACHE_NAME,))
+    _directory['version'] = None
@@ -0,0 +1,14 @@
+from typing import Any
+
+from psycopg2.extras import Json
+
+from queries import run_query
+
+# chatStarted, messageSent, statusChanged, chatAssigned, chatRequeued, chatExtended, qcRated, clientRated
+
+
+def record_event(cur, event_type: str, chat_id: Any, **payload: Any) -> None:
+    '''
+    Событие в журнал chat_events; вызывать до conn.commit() изменения, которое оно описывает
+    '''
+    run_query(cur, 'insertEvent', (event_type, chat_id, Json(payload)))
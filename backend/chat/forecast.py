@@ -0,0 +1,168 @@
+from datetime import datetime, date, time, timedelta
+from typing import Dict, Any, List
+import numpy as np
+from staffing_coverage import MINUTES_PER_DAY, load_shifts, staffing_counts
+
+FORECAST_SLOT_MINUTES = 30
+FORECAST_HISTORY_WEEKS = 8
+TARGET_WAIT_SECONDS = 60
+TARGET_SERVICE_LEVEL = 0.8
+DEFAULT_HANDLE_SECONDS = 600
+MAX_SERVERS = 500
+
+
+def history_by_slot(cur, start: datetime, end: datetime, slot_minutes: int) -> Dict[str, np.ndarray]:
+    '''
+    Поступления и суммарное время обработки закрытых чатов по слотам [start, end)
+    Время обработки - от assigned_at до закрытия (updated_at), слот - по created_at
+    '''
+    slot_count = max(0, int((end - start).total_seconds() // 60 // slot_minutes))
+    cur.execute('''
+        SELECT
+            floor(extract(epoch FROM created_at - %s) / %s)::int AS slot,
+            COUNT(*) AS arrivals,
+            COUNT(*) FILTER (WHERE status = 'closed' AND updated_at > assigned_at) AS handled,
+            COALESCE(SUM(extract(epoch FROM updated_at - assigned_at))
+                     FILTER (WHERE status = 'closed' AND updated_at > assigned_at), 0) AS handle_seconds
+        FROM chats
+        WHERE created_at >= %s AND created_at < %s
+        GROUP BY 1
+    ''', (start, slot_minutes * 60, start, end))
+    rows = cur.fetchall()
+
+    result = {name: np.zeros(slot_count, dtype=np.float64) for name in ('arrivals', 'handled', 'handle_seconds')}
+    if rows:
+        slots = np.array([r['slot'] for r in rows], dtype=np.int64)
+        mask = (slots >= 0) & (slots < slot_count)
+        for name in result:
+            values = np.array([float(r[name]) for r in rows], dtype=np.float64)
+            result[name][slots[mask]] = values[mask]
+    return result
+
+
+def weekly_profiles(history: Dict[str, np.ndarray], start: datetime, slot_minutes: int) -> Dict[str, np.ndarray]:
+    '''
+    Профили по (день недели, слот суток): средние поступления за слот и
+    среднее время обработки; где закрытых чатов нет - общее среднее
+    '''
+    slots_per_day = MINUTES_PER_DAY // slot_minutes
+    size = 7 * slots_per_day
+    index = np.arange(history['arrivals'].size)
+    key = ((start.weekday() + index // slots_per_day) % 7) * slots_per_day + index % slots_per_day
+
+    samples = np.maximum(np.bincount(key, minlength=size), 1)
+    arrivals = np.bincount(key, weights=history['arrivals'], minlength=size) / samples
+    handled = np.bincount(key, weights=history['handled'], minlength=size)
+    handle_seconds = np.bincount(key, weights=history['handle_seconds'], minlength=size)
+
+    total_handled = handled.sum()
+    overall = handle_seconds.sum() / total_handled if total_handled else DEFAULT_HANDLE_SECONDS
+    aht = np.where(handled > 0, handle_seconds / np.maximum(handled, 1), overall)
+
+    return {
+        'arrivals': arrivals.reshape(7, slots_per_day),
+        'aht': aht.reshape(7, slots_per_day)
+    }
+
+
+def erlang_c_servers(traffic: np.ndarray, aht: np.ndarray, target_wait: float,
+                     service_level: float, max_servers: int = MAX_SERVERS) -> np.ndarray:
+    '''
+    Минимальное число серверов N для каждого слота, при котором
+    P(ожидание <= target_wait) = 1 - C(N, A) * exp(-(N - A) * t / AHT) >= service_level
+    Erlang B считается рекуррентно сразу для всех слотов, C выводится из B
+    '''
+    servers = np.zeros(traffic.shape, dtype=np.int64)
+    pending = traffic > 0
+    erlang_b = np.ones_like(traffic)
+
+    for n in range(1, max_servers + 1):
+        if not pending.any():
+            break
+        erlang_b = traffic * erlang_b / (n + traffic * erlang_b)
+        stable = n > traffic
+        erlang_c = np.where(stable, n * erlang_b / np.maximum(n - traffic * (1 - erlang_b), 1e-12), 1.0)
+        wait_ok = 1 - erlang_c * np.exp(-(n - traffic) * target_wait / np.maximum(aht, 1e-9))
+        done = pending & stable & (wait_ok >= service_level)
+        servers[done] = n
+        pending &= ~done
+
+    servers[pending] = max_servers
+    return servers
+
+
+def _blocks(values: np.ndarray, scheduled: np.ndarray, day: date, slot_minutes: int) -> List[Dict[str, Any]]:
+    '''
+    Склейка подряд идущих слотов с одинаковой потребностью в строки вида shifts
+    '''
+    boundaries = np.flatnonzero(np.diff(values)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [values.size]))
+    rows = []
+    for start, end in zip(starts, ends):
+        if values[start] == 0 and scheduled[start:end].max() == 0:
+            continue
+        start_minutes = int(start) * slot_minutes
+        end_minutes = int(end) * slot_minutes
+        rows.append({
+            'shiftDate': day.isoformat(),
+            'startTime': f'{start_minutes // 60:02d}:{start_minutes % 60:02d}:00',
+            'endTime': f'{(end_minutes // 60) % 24:02d}:{end_minutes % 60:02d}:00',
+            'requiredOperators': int(values[start]),
+            'scheduledOperators': int(scheduled[start:end].min())
+        })
+    return rows
+
+
+def compute_forecast(cur, date_from: date, date_to: date, concurrency: int,
+                     slot_minutes: int = FORECAST_SLOT_MINUTES,
+                     history_weeks: int = FORECAST_HISTORY_WEEKS,
+                     target_wait: float = TARGET_WAIT_SECONDS,
+                     service_level: float = TARGET_SERVICE_LEVEL) -> Dict[str, Any]:
+    '''
+    Прогноз потребности в операторах по слотам [date_from, date_to] на основе
+    истории за history_weeks недель до date_from. Каждый оператор ведёт до
+    concurrency чатов одновременно и считается concurrency серверами модели Erlang C
+    '''
+    range_start = datetime.combine(date_from, time.min)
+    range_end = datetime.combine(date_to + timedelta(days=1), time.min)
+    history_start = range_start - timedelta(weeks=history_weeks)
+    slots_per_day = MINUTES_PER_DAY // slot_minutes
+    slot_seconds = slot_minutes * 60
+
+    profiles = weekly_profiles(history_by_slot(cur, history_start, range_start, slot_minutes),
+                               history_start, slot_minutes)
+    traffic = profiles['arrivals'] / slot_seconds * profiles['aht']
+    servers = erlang_c_servers(traffic.ravel(), profiles['aht'].ravel(), target_wait, service_level)
+    operators = (-(-servers // concurrency)).reshape(7, slots_per_day)
+
+    slot_count = int((range_end - range_start).total_seconds() // 60 // slot_minutes)
+    scheduled = staffing_counts(load_shifts(cur, date_from, date_to), range_start, slot_count, slot_minutes)
+
+    requirements = []
+    operator_slots = 0
+    day = date_from
+    while day <= date_to:
+        offset = (day - date_from).days * slots_per_day
+        requirements.extend(_blocks(operators[day.weekday()], scheduled[offset:offset + slots_per_day],
+                                    day, slot_minutes))
+        operator_slots += int(operators[day.weekday()].sum())
+        day += timedelta(days=1)
+
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'intervalMinutes': slot_minutes,
+        'historyWeeks': history_weeks,
+        'targetWaitSeconds': target_wait,
+        'serviceLevel': service_level,
+        'concurrency': concurrency,
+        'profile': {
+            'arrivalsPerSlot': np.round(profiles['arrivals'], 3).tolist(),
+            'averageHandleSeconds': np.round(profiles['aht'], 1).tolist(),
+            'requiredOperators': operators.tolist()
+        },
+        'requirements': requirements,
+        'peakOperators': int(operators.max()) if operators.size else 0,
+        'totalOperatorHours': round(operator_slots * slot_minutes / 60, 1)
+    }
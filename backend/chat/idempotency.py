@@ -0,0 +1,127 @@
+import hashlib
+import json
+from typing import Dict, Any, Optional
+
+IDEMPOTENT_ACTIONS = {'sendMessage', 'startChat', 'createRating', 'submitClientRating', 'sendCorporateMessage'}
+IDEMPOTENCY_TTL_HOURS = 24
+# Незавершённый захват старше этого срока можно перехватить: ответ пишется в транзакции
+# действия, так что такой захват остаётся, только если действие зафиксировало часть записей раньше
+# (назначение чата на другом шарде) и вызов оборвался
+IDEMPOTENCY_PENDING_TIMEOUT_SECONDS = 30
+
+
+def get_idempotency_key(event: Dict[str, Any], body_data: Dict[str, Any]) -> Optional[str]:
+    '''
+    Ключ из заголовка Idempotency-Key или поля clientMessageId тела,
+    с областью действия по action; хранится как sha256
+    '''
+    action = body_data.get('action', '')
+    if action not in IDEMPOTENT_ACTIONS:
+        return None
+
+    raw_key = body_data.get('clientMessageId')
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            raw_key = value
+    if not raw_key:
+        return None
+
+    return hashlib.sha256(f'{action}:{raw_key}'.encode('utf-8')).hexdigest()
+
+
+def _request_hash(body_data: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(body_data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def claim_idempotency_key(cur, key: str, body_data: Dict[str, Any],
+                          headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    '''
+    Захват ключа в текущей транзакции - строка фиксируется вместе с записями действия и ответом.
+    Истёкший ключ и зависший незавершённый захват перехватываются
+    Returns: сохранённый ответ для повтора, ответ 409/422 при конфликте, None - выполнять действие
+    '''
+    request_hash = _request_hash(body_data)
+    cur.execute('''
+        INSERT INTO idempotency_keys (idem_key, request_hash, expires_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP + make_interval(hours => %s))
+        ON CONFLICT (idem_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at <= CURRENT_TIMESTAMP
+           OR (idempotency_keys.status_code IS NULL
+               AND idempotency_keys.created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s))
+        RETURNING idem_key
+    ''', (key, request_hash, IDEMPOTENCY_TTL_HOURS, IDEMPOTENCY_PENDING_TIMEOUT_SECONDS))
+    if cur.fetchone():
+        return None
+
+    cur.execute('''
+        SELECT request_hash, status_code, response_body FROM idempotency_keys WHERE idem_key = %s
+    ''', (key,))
+    stored = cur.fetchone()
+
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': headers,
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Idempotency key reused with a different request'})
+        }
+
+    if stored['status_code'] is None:
+        return {
+            'statusCode': 409,
+            'headers': headers,
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Request with this idempotency key is in progress'})
+        }
+
+    return _replayed(stored, headers)
+
+
+def find_replay(cur, key: str, body_data: Dict[str, Any], headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    '''
+    Сохранённый ответ завершённого запроса с тем же ключом и телом, без захвата ключа:
+    проверяется до списания лимита запросов, чтобы повторы не расходовали бакет
+    Returns: ответ для повтора или None - дальше лимит и claim_idempotency_key
+    '''
+    cur.execute('''
+        SELECT request_hash, status_code, response_body FROM idempotency_keys
+        WHERE idem_key = %s AND status_code IS NOT NULL AND expires_at > CURRENT_TIMESTAMP
+    ''', (key,))
+    stored = cur.fetchone()
+    if not stored or stored['request_hash'] != _request_hash(body_data):
+        return None
+    return _replayed(stored, headers)
+
+
+def _replayed(stored: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {**headers, 'Idempotent-Replayed': 'true'},
+        'isBase64Encoded': False,
+        'body': stored['response_body']
+    }
+
+
+def complete_idempotency_key(cur, conn, key: str, response: Dict[str, Any]) -> None:
+    '''
+    Сохранение успешного ответа и фиксация вместе с записями действия (route вызывается
+    внутри deferred_commit); при ошибке ключ освобождается для повтора
+    '''
+    if not 200 <= response['statusCode'] < 300:
+        release_idempotency_key(cur, conn, key)
+        return
+
+    cur.execute('''
+        UPDATE idempotency_keys SET status_code = %s, response_body = %s WHERE idem_key = %s
+    ''', (response['statusCode'], response['body'], key))
+    conn.commit()
+
+
+def release_idempotency_key(cur, conn, key: str) -> None:
+    '''
+    Удаление незавершённого ключа, если действие уже успело зафиксировать захват
+    '''
+    cur.execute('DELETE FROM idempotency_keys WHERE idem_key = %s AND status_code IS NULL', (key,))
+    conn.commit()
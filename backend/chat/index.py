@@ -1,9 +1,39 @@
 import json
 import os
-from typing import Dict, Any
-import psycopg2
+import sys
+from typing import Dict, Any, Optional
 from psycopg2.extras import RealDictCursor
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from directory import get_employee, get_employees, get_online_operators, invalidate_directory
+from compression import compress_response
+from auth import ADMIN_ROLES, authenticate, cache_roles, hash_password, invalidate_roles, issue_token, verify_password
+from db import current_wal_lsn, deferred_commit, get_connection, get_replica_connection, release_connection
+from async_db import close_pools, get_pool, get_replica_pool, run_async, run_read_action_async
+from queries import READ_ACTIONS, run_query
+from shards import (request_shard_url, run_sharded_read_action, scatter_read_action_async, shard_cursors,
+                    shard_urls)
+from tracing import annotate, span, start_trace
+
+MAX_ACTIVE_CHATS = 2
+ADMIN_ACTIONS = {'createEmployee', 'updateEmployee', 'addEmployeeRole', 'removeEmployeeRole', 'runRetention',
+                 'flushViews', 'sweepPresence'}
+# GET-действия, которые можно отдавать с реплики при DATABASE_REPLICA_URL
+# events читается только с primary: граница выдачи зависит от снимка активных транзакций
+REPLICA_ACTIONS = (set(READ_ACTIONS) - {'events'}) | {'shifts', 'coverage', 'forecast'}
+READ_AFTER_HEADER = 'X-Read-After-LSN'
+BOOTSTRAP_MAX_ACTIONS = 16
+
+# Заголовки собираются один раз на инстанс и не изменяются по месту
+OPTIONS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, Idempotency-Key, X-Read-After-LSN',
+    'Access-Control-Max-Age': '86400'
+}
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -11,26 +41,128 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Args: event - dict с httpMethod, body, queryStringParameters
           context - объект с атрибутами request_id, function_name
     Returns: HTTP response dict
+    Синхронная точка входа платформы: чтения из READ_ACTIONS - async_handler на цикле событий
+    инстанса, остальные действия - handle_request напрямую, без цикла и импорта asyncio
+    '''
+    if not async_read_actions(event) or not os.environ.get('DATABASE_URL'):
+        with request_trace(event, context) as trace:
+            response = handle_request(event, context)
+            trace.set(status=response.get('statusCode'))
+            return response
+    return run_async(async_handler(event, context))
+
+
+async def async_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Точка входа standalone-сервера (backend/server.py) и handler для чтений
+    '''
+    with request_trace(event, context) as trace:
+        response = await dispatch(event, context)
+        trace.set(status=response.get('statusCode'))
+        return response
+
+
+def request_trace(event: Dict[str, Any], context: Any):
+    '''
+    Трасса вызова с trace id = context.request_id (TRACE_EXPORTER, TRACE_SAMPLE_RATE, TRACE_SLOW_MS)
+    '''
+    method = event.get('httpMethod', 'GET')
+    action = (event.get('queryStringParameters') or {}).get('action', 'list') if method == 'GET' else None
+    return start_trace(context, 'chat', method=method, action=action)
+
+
+async def dispatch(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Чтения из READ_ACTIONS и bootstrap из них выполняются на пулах asyncpg, чтения bootstrap -
+    одновременно на разных соединениях (каждое в своём снимке). Остальные действия -
+    синхронный handle_request в потоке
+    '''
+    import asyncio
+
+    actions = async_read_actions(event)
+    database_url = os.environ.get('DATABASE_URL')
+    if not actions or not database_url:
+        return await asyncio.to_thread(handle_request, event, context)
+    
+    params = event.get('queryStringParameters') or {}
+    headers = JSON_HEADERS
+    try:
+        with span('db.pool'):
+            pool = await read_pool(event, actions, database_url)
+        if params.get('action') == 'bootstrap':
+            results = await asyncio.gather(*(run_bootstrap_read(pool, a, params) for a in actions))
+            payload = {'results': dict(zip(actions, results))}
+        else:
+            payload = await run_read_async(pool, actions[0], params)
+        with span('json.encode'):
+            body = json.dumps(payload)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': str(e)})
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    return compress_response(event, {
+        'statusCode': 200,
+        'headers': headers,
+        'isBase64Encoded': False,
+        'body': body
+    })
+
+
+async def shutdown() -> None:
+    '''
+    Остановка процесса standalone-сервера (backend/server.py): запись буфера просмотров
+    и штатное закрытие пулов asyncpg
+    '''
+    import asyncio
+
+    try:
+        await asyncio.to_thread(write_buffered_views)
+    finally:
+        await close_pools()
+
+
+def write_buffered_views() -> None:
+    from views import write_pending_views
+
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        return
+    conn = get_connection(database_url)
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        write_pending_views(cur, conn)
+    finally:
+        cur.close()
+        release_connection(conn)
+
+
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Синхронная обработка вызова на соединениях psycopg2
+    Returns: HTTP response dict
     '''
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': OPTIONS_HEADERS,
             'body': '',
             'isBase64Encoded': False
         }
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
+    headers = JSON_HEADERS
     
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
@@ -41,1440 +173,1716 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(database_url)
+    try:
+        body_data = json.loads(event.get('body') or '{}') if method in ('POST', 'PUT') else {}
+    except ValueError:
+        body_data = None
+    if not isinstance(body_data, dict):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid JSON body'})
+        }
+    
+    if method in ('POST', 'PUT'):
+        annotate(action=body_data.get('action'))
+    
+    # Повтор с ключом идемпотентности не должен расходовать лимит: для него бакеты
+    # списываются только после проверки сохранённого ответа, уже на соединении
+    idempotency_key = None
+    limit_keys = []
+    if method == 'POST':
+        from idempotency import (claim_idempotency_key, complete_idempotency_key, find_replay,
+                                 get_idempotency_key, release_idempotency_key)
+        from ratelimit import check_local, check_shared, rate_limit_keys
+        idempotency_key = get_idempotency_key(event, body_data)
+        limit_keys = rate_limit_keys(body_data.get('action', ''), body_data, event)
+    if limit_keys and not idempotency_key:
+        retry_after = check_local(limit_keys)
+        if retry_after:
+            return too_many_requests(headers, retry_after)
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        urls = shard_urls()
+    except RuntimeError as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': str(e)})
+        }
+    if method == 'GET':
+        shard_url = request_shard_url(params.get('action', 'list'), params, urls)
+    else:
+        shard_url = request_shard_url(body_data.get('action', ''), body_data, urls)
+    
+    # Реплика повторяет только DATABASE_URL: действия, ушедшие на шард, читают и пишут его primary
+    replica_url = None if shard_url else os.environ.get('DATABASE_REPLICA_URL')
+    conn = None
+    if replica_url and method == 'GET':
+        action = params.get('action', 'list')
+        if action == 'bootstrap':
+            replica_ok = set(bootstrap_actions(params)) <= REPLICA_ACTIONS
+        else:
+            replica_ok = action in REPLICA_ACTIONS
+        if replica_ok:
+            conn = get_replica_connection(replica_url, read_after_lsn(event))
+    if conn is None:
+        conn = get_connection(shard_url or database_url)
     cur = conn.cursor(cursor_factory=RealDictCursor)
+    claimed = False
     
     try:
-        if method == 'GET':
-            action = event.get('queryStringParameters', {}).get('action', 'list')
-            
-            if action == 'list':
-                operator_name = event.get('queryStringParameters', {}).get('operatorName', '')
-                
-                if operator_name:
-                    cur.execute('''
-                        SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
-                               c.assigned_at, c.deadline, c.extension_requested, c.extension_deadline,
-                               cl.name as client_name, cl.email, cl.phone, cl.ip_address
-                        FROM chats c
-                        LEFT JOIN clients cl ON c.client_id = cl.id
-                        WHERE c.assigned_operator = %s OR c.status = 'waiting'
-                        ORDER BY c.updated_at DESC
-                    ''', (operator_name,))
-                else:
-                    cur.execute('''
-                        SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
-                               c.assigned_at, c.deadline, c.extension_requested, c.extension_deadline,
-                               cl.name as client_name, cl.email, cl.phone, cl.ip_address
-                        FROM chats c
-                        LEFT JOIN clients cl ON c.client_id = cl.id
-                        ORDER BY c.updated_at DESC
-                    ''')
-                
-                chats = cur.fetchall()
-                
-                result = []
-                for chat in chats:
-                    result.append({
-                        'id': chat['id'],
-                        'status': chat['status'],
-                        'assignedOperator': chat['assigned_operator'],
-                        'clientName': chat['client_name'] or 'Клиент',
-                        'email': chat['email'] or '',
-                        'phone': chat['phone'] or '',
-                        'ipAddress': chat['ip_address'] or '',
-                        'createdAt': chat['created_at'].isoformat() if chat['created_at'] else None,
-                        'updatedAt': chat['updated_at'].isoformat() if chat['updated_at'] else None,
-                        'assignedAt': chat['assigned_at'].isoformat() if chat['assigned_at'] else None,
-                        'deadline': chat['deadline'].isoformat() if chat['deadline'] else None,
-                        'extensionRequested': chat['extension_requested'] or False,
-                        'extensionDeadline': chat['extension_deadline'].isoformat() if chat['extension_deadline'] else None
-                    })
-                
+        if idempotency_key:
+            replay = find_replay(cur, idempotency_key, body_data, headers)
+            if replay:
+                conn.rollback()
+                return replay
+        
+        if limit_keys:
+            retry_after = check_local(limit_keys) if idempotency_key else None
+            if not retry_after:
+                retry_after = check_shared(cur, conn, limit_keys)
+            if retry_after:
+                return too_many_requests(headers, retry_after)
+        
+        if idempotency_key:
+            replay = claim_idempotency_key(cur, idempotency_key, body_data, headers)
+            if replay:
+                conn.rollback()
+                return replay
+            claimed = True
+        
+        # Под ключом идемпотентности фиксации действия откладываются: записи действия
+        # и сохранённый ответ фиксируются вместе в complete_idempotency_key
+        with span('route'), deferred_commit(conn, enabled=bool(idempotency_key)):
+            response = route(event, method, body_data, cur, conn, headers)
+        
+        if idempotency_key:
+            complete_idempotency_key(cur, conn, idempotency_key, response)
+        
+        if replica_url and method in ('POST', 'PUT') and 200 <= response['statusCode'] < 300:
+            response = {
+                **response,
+                'headers': {
+                    **response['headers'],
+                    READ_AFTER_HEADER: current_wal_lsn(cur),
+                    'Access-Control-Expose-Headers': READ_AFTER_HEADER
+                }
+            }
+        
+        return compress_response(event, response)
+    
+    except Exception as e:
+        conn.rollback()
+        if claimed:
+            release_idempotency_key(cur, conn, idempotency_key)
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    finally:
+        # Буфер просмотров есть, только если инстанс уже импортировал views (trackView)
+        views = sys.modules.get('views')
+        try:
+            if views:
+                views.write_due_views(cur, conn)
+        except Exception as e:
+            print(f'knowledge views write failed: {e}', file=sys.stderr)
+        cur.close()
+        release_connection(conn)
+
+
+def route(event: Dict[str, Any], method: str, body_data: Dict[str, Any], cur, conn,
+          headers: Dict[str, str]) -> Dict[str, Any]:
+    '''
+    Выполнение действия запроса на открытом соединении
+    Returns: HTTP response dict
+    '''
+    if method == 'GET':
+        params = event.get('queryStringParameters') or {}
+        action = params.get('action', 'list')
+        
+        if action in READ_ACTIONS:
+            try:
+                payload = run_sharded_read_action(cur, action, params)
+            except ValueError as e:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'chats': result})
+                    'body': json.dumps({'error': str(e)})
                 }
             
-            elif action == 'messages':
-                chat_id = event.get('queryStringParameters', {}).get('chatId', '')
-                if not chat_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId required'})
-                    }
-                
-                cur.execute('''
-                    SELECT id, sender_type, sender_name, message_text, created_at
-                    FROM messages
-                    WHERE chat_id = %s
-                    ORDER BY created_at ASC
-                ''', (int(chat_id),))
-                messages = cur.fetchall()
-                
-                result = []
-                for msg in messages:
-                    result.append({
-                        'id': msg['id'],
-                        'senderType': msg['sender_type'],
-                        'senderName': msg['sender_name'] or '',
-                        'text': msg['message_text'],
-                        'createdAt': msg['created_at'].isoformat() if msg['created_at'] else None
-                    })
-                
+            with span('json.encode'):
+                body = json.dumps(payload)
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': body
+            }
+        
+        elif action == 'bootstrap':
+            actions = bootstrap_actions(params)
+            if not actions or len(actions) > BOOTSTRAP_MAX_ACTIONS or 'bootstrap' in actions:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'messages': result})
+                    'body': json.dumps({'error': f'include must list 1-{BOOTSTRAP_MAX_ACTIONS} actions'})
                 }
             
-            elif action == 'employees':
-                cur.execute('''
-                    SELECT 
-                        e.id, 
-                        e.username, 
-                        e.name, 
-                        e.role, 
-                        e.status, 
-                        e.created_at, 
-                        e.updated_at,
-                        COALESCE(
-                            array_agg(er.role) FILTER (WHERE er.role IS NOT NULL),
-                            ARRAY[]::text[]
-                        ) as roles
-                    FROM employees e
-                    LEFT JOIN employee_roles er ON e.id = er.employee_id
-                    GROUP BY e.id, e.username, e.name, e.role, e.status, e.created_at, e.updated_at
-                    ORDER BY e.name ASC
-                ''')
-                employees = cur.fetchall()
-                
-                result = []
-                for emp in employees:
-                    result.append({
-                        'id': emp['id'],
-                        'username': emp['username'],
-                        'name': emp['name'],
-                        'role': emp['role'],
-                        'roles': emp['roles'] if emp['roles'] else [emp['role']],
-                        'status': emp['status'] or 'offline',
-                        'createdAt': emp['created_at'].isoformat() if emp['created_at'] else None,
-                        'updatedAt': emp['updated_at'].isoformat() if emp['updated_at'] else None
-                    })
-                
+            results = {}
+            for sub_action in actions:
+                with span('bootstrap.action', action=sub_action):
+                    results[sub_action] = run_bootstrap_action(event, sub_action, params, cur, conn, headers)
+            
+            with span('json.encode'):
+                body = json.dumps({'results': results})
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': body
+            }
+        
+        elif action == 'suggest':
+            from suggest import SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, suggest
+            try:
+                limit = max(1, min(int(params.get('limit') or SUGGEST_LIMIT), SUGGEST_MAX_LIMIT))
+            except ValueError:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'employees': result})
+                    'body': json.dumps({'error': 'limit must be an integer'})
                 }
+            types = [t for t in (params.get('types') or '').split(',') if t]
             
-            elif action == 'shifts':
-                cur.execute('''
-                    SELECT id, employee_name, shift_date, start_time, end_time, shift_type, created_at
-                    FROM shifts
-                    ORDER BY shift_date DESC, start_time ASC
-                ''')
-                shifts = cur.fetchall()
-                
-                result = []
-                for shift in shifts:
-                    result.append({
-                        'id': shift['id'],
-                        'employeeName': shift['employee_name'],
-                        'shiftDate': shift['shift_date'].isoformat() if shift['shift_date'] else None,
-                        'startTime': str(shift['start_time']) if shift['start_time'] else None,
-                        'endTime': str(shift['end_time']) if shift['end_time'] else None,
-                        'shiftType': shift['shift_type'],
-                        'createdAt': shift['created_at'].isoformat() if shift['created_at'] else None
-                    })
-                
+            with span('suggest'):
+                result = suggest(cur, params.get('q', ''), limit, types)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'suggestions': result})
+            }
+        
+        elif action == 'employees':
+            employees = get_employees(cur)
+            
+            result = []
+            for emp in employees:
+                result.append({
+                    'id': emp['id'],
+                    'username': emp['username'],
+                    'name': emp['name'],
+                    'role': emp['role'],
+                    'roles': emp['roles'] if emp['roles'] else [emp['role']],
+                    'status': emp['status'] or 'offline',
+                    'createdAt': emp['created_at'].isoformat() if emp['created_at'] else None,
+                    'updatedAt': emp['updated_at'].isoformat() if emp['updated_at'] else None
+                })
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'employees': result})
+            }
+        
+        elif action == 'shifts':
+            try:
+                date_from = date.fromisoformat(params['from']) if params.get('from') else None
+                date_to = date.fromisoformat(params['to']) if params.get('to') else None
+            except ValueError:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'shifts': result})
+                    'body': json.dumps({'error': 'from and to must be dates in YYYY-MM-DD format'})
                 }
             
-            elif action == 'clients':
-                cur.execute('''
-                    SELECT id, ip_address, name, email, phone, created_at, last_seen
-                    FROM clients
-                    ORDER BY last_seen DESC
-                ''')
-                clients = cur.fetchall()
-                
-                result = []
-                for client in clients:
-                    result.append({
-                        'id': client['id'],
-                        'ipAddress': client['ip_address'],
-                        'name': client['name'] or 'Не указано',
-                        'email': client['email'] or '',
-                        'phone': client['phone'] or '',
-                        'createdAt': client['created_at'].isoformat() if client['created_at'] else None,
-                        'lastSeen': client['last_seen'].isoformat() if client['last_seen'] else None
-                    })
-                
+            conditions = []
+            values = []
+            if date_from:
+                conditions.append('shift_date >= %s')
+                values.append(date_from)
+            if date_to:
+                conditions.append('shift_date <= %s')
+                values.append(date_to)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            
+            cur.execute(f'''
+                SELECT id, employee_name, shift_date, start_time, end_time, shift_type, created_at
+                FROM shifts
+                {where}
+                ORDER BY shift_date DESC, start_time ASC
+            ''', values)
+            shifts = cur.fetchall()
+            
+            result = []
+            for shift in shifts:
+                result.append({
+                    'id': shift['id'],
+                    'employeeName': shift['employee_name'],
+                    'shiftDate': shift['shift_date'].isoformat() if shift['shift_date'] else None,
+                    'startTime': str(shift['start_time']) if shift['start_time'] else None,
+                    'endTime': str(shift['end_time']) if shift['end_time'] else None,
+                    'shiftType': shift['shift_type'],
+                    'createdAt': shift['created_at'].isoformat() if shift['created_at'] else None
+                })
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'shifts': result})
+            }
+        
+        elif action == 'coverage':
+            from staffing_coverage import ARRIVALS_LOOKBACK_WEEKS, SLOT_MINUTES, compute_coverage, parse_date
+            
+            today = datetime.utcnow().date()
+            try:
+                date_from = parse_date(params.get('from'), today)
+                date_to = parse_date(params.get('to'), date_from + timedelta(days=6))
+                interval = int(params.get('interval') or SLOT_MINUTES)
+                history_weeks = int(params.get('weeks') or ARRIVALS_LOOKBACK_WEEKS)
+            except ValueError:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'clients': result})
+                    'body': json.dumps({'error': 'from and to must be YYYY-MM-DD dates, interval and weeks integers'})
                 }
             
-            elif action == 'knowledge':
-                cur.execute('''
-                    SELECT id, title, category, content, views, created_at, updated_at, author
-                    FROM knowledge_articles
-                    ORDER BY created_at DESC
-                ''')
-                articles = cur.fetchall()
-                
-                result = []
-                for article in articles:
-                    result.append({
-                        'id': article['id'],
-                        'title': article['title'],
-                        'category': article['category'],
-                        'content': article['content'],
-                        'views': article['views'] or 0,
-                        'createdAt': article['created_at'].isoformat() if article['created_at'] else None,
-                        'updatedAt': article['updated_at'].isoformat() if article['updated_at'] else None,
-                        'author': article['author'] or ''
-                    })
-                
+            if date_to < date_from or (date_to - date_from).days > 92 or not 1 <= history_weeks <= 104:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'articles': result})
+                    'body': json.dumps({'error': 'to must be within 92 days after from, weeks between 1 and 104'})
                 }
             
-            elif action == 'closedChats':
-                cur.execute('''
-                    SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
-                           cl.name as client_name, cl.email, cl.phone, cl.ip_address,
-                           r.id as rating_id, r.score as rating_score
-                    FROM chats c
-                    LEFT JOIN clients cl ON c.client_id = cl.id
-                    LEFT JOIN ratings r ON c.id = r.chat_id
-                    WHERE c.status = 'closed'
-                    ORDER BY c.updated_at DESC
-                ''')
-                chats = cur.fetchall()
-                
-                result = []
-                for chat in chats:
-                    result.append({
-                        'id': chat['id'],
-                        'status': chat['status'],
-                        'assignedOperator': chat['assigned_operator'],
-                        'clientName': chat['client_name'] or 'Клиент',
-                        'email': chat['email'] or '',
-                        'phone': chat['phone'] or '',
-                        'ipAddress': chat['ip_address'] or '',
-                        'createdAt': chat['created_at'].isoformat() if chat['created_at'] else None,
-                        'updatedAt': chat['updated_at'].isoformat() if chat['updated_at'] else None,
-                        'hasRating': chat['rating_id'] is not None,
-                        'ratingScore': chat['rating_score']
-                    })
-                
+            if interval <= 0 or 1440 % interval != 0:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'chats': result})
+                    'body': json.dumps({'error': 'interval must divide 1440 minutes'})
                 }
             
-            elif action == 'ratings':
-                operator_name = event.get('queryStringParameters', {}).get('operatorName', '')
-                
-                if not operator_name:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'operatorName required'})
-                    }
-                
-                cur.execute('''
-                    SELECT id, chat_id, operator_name, rated_by, score, comment, created_at
-                    FROM ratings
-                    WHERE operator_name = %s
-                    ORDER BY created_at DESC
-                ''', (operator_name,))
-                ratings = cur.fetchall()
-                
-                result = []
-                for rating in ratings:
-                    result.append({
-                        'id': rating['id'],
-                        'chatId': rating['chat_id'],
-                        'operatorName': rating['operator_name'],
-                        'ratedBy': rating['rated_by'],
-                        'score': rating['score'],
-                        'comment': rating['comment'] or '',
-                        'createdAt': rating['created_at'].isoformat() if rating['created_at'] else None
-                    })
-                
+            result = compute_coverage(cur, date_from, date_to, interval, history_weeks)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'coverage': result})
+            }
+        
+        elif action == 'forecast':
+            from staffing_coverage import parse_date
+            from forecast import (FORECAST_HISTORY_WEEKS, FORECAST_SLOT_MINUTES, TARGET_SERVICE_LEVEL,
+                                  TARGET_WAIT_SECONDS, compute_forecast)
+            
+            today = datetime.utcnow().date()
+            try:
+                date_from = parse_date(params.get('from'), today)
+                date_to = parse_date(params.get('to'), date_from + timedelta(days=6))
+                interval = int(params.get('interval') or FORECAST_SLOT_MINUTES)
+                history_weeks = int(params.get('weeks') or FORECAST_HISTORY_WEEKS)
+                target_wait = float(params.get('targetWait') or TARGET_WAIT_SECONDS)
+                service_level = float(params.get('serviceLevel') or TARGET_SERVICE_LEVEL)
+            except ValueError:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'ratings': result})
+                    'body': json.dumps({'error': 'from and to must be YYYY-MM-DD dates, interval, weeks, targetWait and serviceLevel numbers'})
                 }
             
-            elif action == 'login':
-                username = event.get('queryStringParameters', {}).get('username', '')
-                password = event.get('queryStringParameters', {}).get('password', '')
-                
-                if not username or not password:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'username and password required'})
-                    }
-                
-                cur.execute('''
-                    SELECT id, username, name, role, status
-                    FROM employees
-                    WHERE username = %s AND password_hash = %s
-                ''', (username, password))
-                employee = cur.fetchone()
-                
-                if not employee:
-                    return {
-                        'statusCode': 401,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Invalid username or password'})
-                    }
-                
-                cur.execute('''
-                    SELECT role FROM employee_roles WHERE employee_id = %s
-                ''', (employee['id'],))
-                roles_rows = cur.fetchall()
-                roles = [r['role'] for r in roles_rows] if roles_rows else [employee['role']]
-                
+            if not (0 < target_wait < float('inf') and 0 < service_level <= 1):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'success': True,
-                        'employee': {
-                            'id': employee['id'],
-                            'username': employee['username'],
-                            'name': employee['name'],
-                            'role': employee['role'],
-                            'roles': roles,
-                            'status': employee['status']
-                        }
-                    })
+                    'body': json.dumps({'error': 'targetWait must be positive, serviceLevel in (0, 1]'})
                 }
             
-            elif action == 'corporateChats':
-                employee_name = event.get('queryStringParameters', {}).get('employeeName', '')
-                
-                if not employee_name:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'employeeName required'})
-                    }
-                
-                cur.execute('''
-                    SELECT id, title, created_by, created_at, updated_at
-                    FROM corporate_chats
-                    WHERE created_by = %s OR id IN (
-                        SELECT DISTINCT chat_id FROM corporate_messages WHERE sender_name = %s
-                    )
-                    ORDER BY updated_at DESC
-                ''', (employee_name, employee_name))
-                chats = cur.fetchall()
-                
-                result = []
-                for chat in chats:
-                    result.append({
-                        'id': chat['id'],
-                        'title': chat['title'],
-                        'createdBy': chat['created_by'],
-                        'createdAt': chat['created_at'].isoformat() if chat['created_at'] else None,
-                        'updatedAt': chat['updated_at'].isoformat() if chat['updated_at'] else None
-                    })
-                
+            if date_to < date_from or (date_to - date_from).days > 92 or not 1 <= history_weeks <= 104:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'chats': result})
+                    'body': json.dumps({'error': 'to must be within 92 days after from, weeks between 1 and 104'})
                 }
             
-            elif action == 'corporateMessages':
-                chat_id = event.get('queryStringParameters', {}).get('chatId', '')
-                
-                if not chat_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId required'})
-                    }
-                
-                cur.execute('''
-                    SELECT id, sender_name, message_text, created_at
-                    FROM corporate_messages
-                    WHERE chat_id = %s
-                    ORDER BY created_at ASC
-                ''', (int(chat_id),))
-                messages = cur.fetchall()
-                
-                result = []
-                for msg in messages:
-                    result.append({
-                        'id': msg['id'],
-                        'senderName': msg['sender_name'],
-                        'text': msg['message_text'],
-                        'createdAt': msg['created_at'].isoformat() if msg['created_at'] else None
-                    })
-                
+            if interval <= 0 or 1440 % interval != 0:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'messages': result})
+                    'body': json.dumps({'error': 'interval must divide 1440 minutes'})
                 }
             
-            elif action == 'jiraTemplates':
-                cur.execute('''
-                    SELECT id, title, category, content, created_by, created_at, updated_at
-                    FROM jira_templates
-                    ORDER BY category, title
-                ''')
-                templates = cur.fetchall()
-                
-                result = []
-                for tpl in templates:
-                    result.append({
-                        'id': tpl['id'],
-                        'title': tpl['title'],
-                        'category': tpl['category'],
-                        'content': tpl['content'],
-                        'createdBy': tpl['created_by'],
-                        'createdAt': tpl['created_at'].isoformat() if tpl['created_at'] else None,
-                        'updatedAt': tpl['updated_at'].isoformat() if tpl['updated_at'] else None
-                    })
-                
+            result = compute_forecast(cur, date_from, date_to, MAX_ACTIVE_CHATS, interval, history_weeks,
+                                      target_wait, service_level)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'forecast': result})
+            }
+        
+        elif action == 'session':
+            principal = authenticate(event, cur)
+            
+            if not principal:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 401,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'templates': result})
+                    'body': json.dumps({'error': 'Invalid or expired token'})
                 }
             
-            elif action == 'employeeRoles':
-                employee_id = event.get('queryStringParameters', {}).get('employeeId', '')
-                
-                if employee_id:
-                    cur.execute('''
-                        SELECT role FROM employee_roles WHERE employee_id = %s
-                    ''', (employee_id,))
-                else:
-                    cur.execute('''
-                        SELECT er.employee_id, er.role, e.name, e.username
-                        FROM employee_roles er
-                        JOIN employees e ON er.employee_id = e.id
-                        ORDER BY e.name, er.role
-                    ''')
-                
-                roles = cur.fetchall()
-                result = [dict(r) for r in roles]
-                
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'employeeId': principal['id'], 'roles': principal['roles'], 'expiresAt': principal['expiresAt']})
+            }
+        
+        elif action == 'employeeRoles':
+            try:
+                employee_id = int(params['employeeId']) if params.get('employeeId') else None
+            except ValueError:
+                employee_id = 0
+            
+            if employee_id is not None and employee_id <= 0:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'roles': result})
+                    'body': json.dumps({'error': 'employeeId must be a positive integer'})
                 }
             
-            elif action == 'qcArchive':
-                cur.execute('''
-                    SELECT qa.*, c.status as chat_status
-                    FROM qc_archive qa
-                    LEFT JOIN chats c ON qa.chat_id = c.id
-                    ORDER BY qa.archived_at DESC
-                ''')
-                archive = cur.fetchall()
-                
-                result = []
-                for item in archive:
-                    result.append({
-                        'id': item['id'],
-                        'chatId': item['chat_id'],
-                        'operatorName': item['operator_name'],
-                        'qcName': item['qc_name'],
-                        'ratingScore': item['rating_score'],
-                        'ratingComment': item['rating_comment'],
-                        'archivedAt': item['archived_at'].isoformat() if item['archived_at'] else None,
-                        'chatStatus': item.get('chat_status')
-                    })
-                
+            if employee_id:
+                employee = get_employee(cur, employee_id)
+                result = [{'role': role} for role in employee['roles']] if employee else []
+            else:
+                result = [
+                    {'employee_id': emp['id'], 'role': role, 'name': emp['name'], 'username': emp['username']}
+                    for emp in get_employees(cur)
+                    for role in emp['roles']
+                ]
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'roles': result})
+            }
+        
+    elif method == 'POST':
+        action = body_data.get('action', '')
+        
+        if action in ADMIN_ACTIONS:
+            denied = require_admin(event, cur, headers)
+            if denied:
+                return denied
+        
+        if action == 'login':
+            username = body_data.get('username', '')
+            password = body_data.get('password', '')
+            
+            if not username or not password:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'archive': result})
+                    'body': json.dumps({'error': 'username and password required'})
                 }
             
-            elif action == 'news':
-                cur.execute('''
-                    SELECT id, title, content, author, created_at, published_at
-                    FROM news
-                    ORDER BY published_at DESC, created_at DESC
-                ''')
-                news_items = cur.fetchall()
-                
-                result = []
-                for item in news_items:
-                    result.append({
-                        'id': item['id'],
-                        'title': item['title'],
-                        'content': item['content'],
-                        'author': item['author'],
-                        'createdAt': item['created_at'].isoformat() if item['created_at'] else None,
-                        'publishedAt': item['published_at'].isoformat() if item['published_at'] else None
-                    })
-                
+            cur.execute('''
+                SELECT id, password_hash FROM employees WHERE username = %s
+            ''', (username,))
+            credentials = cur.fetchone()
+            
+            password_ok, needs_rehash = verify_password(password, credentials['password_hash'] if credentials else None)
+            
+            if not password_ok:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 401,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'news': result})
+                    'body': json.dumps({'error': 'Invalid username or password'})
                 }
             
-            elif action == 'allChats':
+            if needs_rehash:
                 cur.execute('''
-                    SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
-                           c.assigned_at, c.deadline, c.extension_requested, c.extension_deadline,
-                           cl.name as client_name, cl.email, cl.phone, cl.ip_address,
-                           cr.score as client_rating_score, cr.comment as client_rating_comment
-                    FROM chats c
-                    LEFT JOIN clients cl ON c.client_id = cl.id
-                    LEFT JOIN client_ratings cr ON c.id = cr.chat_id
-                    ORDER BY c.updated_at DESC
-                ''')
-                chats = cur.fetchall()
-                
-                result = []
-                for chat in chats:
-                    result.append({
-                        'id': chat['id'],
-                        'status': chat['status'],
-                        'assignedOperator': chat['assigned_operator'],
-                        'clientName': chat['client_name'] or 'Клиент',
-                        'email': chat['email'] or '',
-                        'phone': chat['phone'] or '',
-                        'ipAddress': chat['ip_address'] or '',
-                        'createdAt': chat['created_at'].isoformat() if chat['created_at'] else None,
-                        'updatedAt': chat['updated_at'].isoformat() if chat['updated_at'] else None,
-                        'assignedAt': chat['assigned_at'].isoformat() if chat['assigned_at'] else None,
-                        'deadline': chat['deadline'].isoformat() if chat['deadline'] else None,
-                        'extensionRequested': chat['extension_requested'] or False,
-                        'extensionDeadline': chat['extension_deadline'].isoformat() if chat['extension_deadline'] else None,
-                        'clientRatingScore': chat['client_rating_score'],
-                        'clientRatingComment': chat['client_rating_comment'] or ''
-                    })
-                
+                    UPDATE employees SET password_hash = %s WHERE id = %s
+                ''', (hash_password(password), credentials['id']))
+                conn.commit()
+            
+            employee = get_employee(cur, credentials['id'])
+            roles = employee['roles'] if employee['roles'] else [employee['role']]
+            cache_roles(employee['id'], roles)
+            token, expires_at = issue_token(employee['id'])
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'success': True,
+                    'token': token,
+                    'expiresAt': expires_at,
+                    'employee': {
+                        'id': employee['id'],
+                        'username': employee['username'],
+                        'name': employee['name'],
+                        'role': employee['role'],
+                        'roles': roles,
+                        'status': employee['status']
+                    }
+                })
+            }
+        
+        elif action == 'startChat':
+            from events import record_event
+            ip_address = body_data.get('ipAddress', '')
+            client_name = body_data.get('name')
+            email = body_data.get('email')
+            phone = body_data.get('phone')
+            
+            if not ip_address:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'chats': result})
+                    'body': json.dumps({'error': 'ipAddress required'})
                 }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            action = body_data.get('action', '')
-            
-            if action == 'startChat':
-                ip_address = body_data.get('ipAddress', '')
-                client_name = body_data.get('name')
-                email = body_data.get('email')
-                phone = body_data.get('phone')
-                
-                if not ip_address:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'ipAddress required'})
-                    }
-                
+            
+            cur.execute('''
+                SELECT id FROM clients WHERE ip_address = %s
+            ''', (ip_address,))
+            existing_client = cur.fetchone()
+            
+            if existing_client:
+                client_id = existing_client['id']
                 cur.execute('''
-                    SELECT id FROM clients WHERE ip_address = %s
-                ''', (ip_address,))
-                existing_client = cur.fetchone()
-                
-                if existing_client:
-                    client_id = existing_client['id']
-                    cur.execute('''
-                        UPDATE clients 
-                        SET name = %s, email = %s, phone = %s, last_seen = CURRENT_TIMESTAMP
-                        WHERE id = %s
-                    ''', (client_name, email, phone, client_id))
-                else:
-                    cur.execute('''
-                        INSERT INTO clients (ip_address, name, email, phone, last_seen)
-                        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-                        RETURNING id
-                    ''', (ip_address, client_name, email, phone))
-                    client_id = cur.fetchone()['id']
-                
+                    UPDATE clients 
+                    SET name = %s, email = %s, phone = %s, last_seen = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                ''', (client_name, email, phone, client_id))
+            else:
                 cur.execute('''
-                    SELECT id FROM chats 
-                    WHERE client_id = %s AND status IN ('waiting', 'active')
-                    ORDER BY created_at DESC LIMIT 1
-                ''', (client_id,))
-                existing_chat = cur.fetchone()
-                
-                if existing_chat:
-                    chat_id = existing_chat['id']
-                else:
-                    cur.execute('''
-                        INSERT INTO chats (client_id, status)
-                        VALUES (%s, 'waiting')
-                        RETURNING id
-                    ''', (client_id,))
-                    chat_id = cur.fetchone()['id']
-                    
-                    assign_chat_to_operator(cur, conn)
-                
-                conn.commit()
+                    INSERT INTO clients (ip_address, name, email, phone, last_seen)
+                    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    RETURNING id
+                ''', (ip_address, client_name, email, phone))
+                client_id = cur.fetchone()['id']
+            
+            # Копия данных клиента в чатах - листинги читают её без JOIN clients
+            cur.execute('''
+                UPDATE chats 
+                SET client_name = %s, email = %s, phone = %s, ip_address = %s
+                WHERE client_id = %s
+                  AND (client_name, email, phone, ip_address) IS DISTINCT FROM (%s, %s, %s, %s)
+            ''', (client_name, email, phone, ip_address, client_id, client_name, email, phone, ip_address))
+            
+            cur.execute('''
+                SELECT id FROM chats 
+                WHERE client_id = %s AND status IN ('waiting', 'active')
+                ORDER BY created_at DESC LIMIT 1
+            ''', (client_id,))
+            existing_chat = cur.fetchone()
+            
+            if existing_chat:
+                chat_id = existing_chat['id']
+            else:
+                cur.execute('''
+                    INSERT INTO chats (client_id, status, client_name, email, phone, ip_address)
+                    VALUES (%s, 'waiting', %s, %s, %s, %s)
+                    RETURNING id
+                ''', (client_id, client_name, email, phone, ip_address))
+                chat_id = cur.fetchone()['id']
+                record_event(cur, 'chatStarted', chat_id, clientId=client_id)
                 
+                assign_chat_to_operator(cur, conn)
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'chatId': chat_id, 'clientId': client_id})
+            }
+        
+        elif action == 'sendMessage':
+            from events import record_event
+            chat_id = body_data.get('chatId')
+            sender_type = body_data.get('senderType', '')
+            sender_name = body_data.get('senderName')
+            message_text = body_data.get('message', '')
+            
+            if not chat_id or not message_text:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'chatId': chat_id, 'clientId': client_id})
+                    'body': json.dumps({'error': 'chatId and message required'})
                 }
             
-            elif action == 'sendMessage':
-                chat_id = body_data.get('chatId')
-                sender_type = body_data.get('senderType', '')
-                sender_name = body_data.get('senderName')
-                message_text = body_data.get('message', '')
-                
-                if not chat_id or not message_text:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId and message required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO messages (chat_id, sender_type, sender_name, message_text)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id, created_at
-                ''', (chat_id, sender_type, sender_name, message_text))
-                result = cur.fetchone()
-                
-                cur.execute('''
-                    UPDATE chats SET updated_at = CURRENT_TIMESTAMP WHERE id = %s
-                ''', (chat_id,))
-                
-                conn.commit()
-                
+            run_query(cur, 'insertMessage', (chat_id, sender_type, sender_name, message_text))
+            result = cur.fetchone()
+            
+            run_query(cur, 'touchChat', (chat_id,))
+            record_event(cur, 'messageSent', chat_id, messageId=result['id'], senderType=sender_type)
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'messageId': result['id'],
+                    'createdAt': result['created_at'].isoformat()
+                })
+            }
+        
+        elif action == 'updateOperatorStatus':
+            from presence import clear_presence, heartbeat
+            operator_name = body_data.get('operatorName', '')
+            status = body_data.get('status', '')
+            
+            if not operator_name or not status:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'messageId': result['id'],
-                        'createdAt': result['created_at'].isoformat()
-                    })
+                    'body': json.dumps({'error': 'operatorName and status required'})
                 }
             
-            elif action == 'updateOperatorStatus':
-                operator_name = body_data.get('operatorName', '')
-                status = body_data.get('status', '')
-                
-                if not operator_name or not status:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'operatorName and status required'})
-                    }
-                
-                cur.execute('''
-                    UPDATE employees 
-                    SET status = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE name = %s
-                ''', (status, operator_name))
-                
-                if status not in ['online']:
-                    cur.execute('''
-                        SELECT id FROM chats 
-                        WHERE assigned_operator = %s AND status = 'active'
-                    ''', (operator_name,))
-                    active_chats = cur.fetchall()
-                    
-                    for chat in active_chats:
-                        cur.execute('''
-                            UPDATE chats 
-                            SET assigned_operator = NULL, status = 'waiting', deadline = NULL
-                            WHERE id = %s
-                        ''', (chat['id'],))
-                    
-                    assign_chat_to_operator(cur, conn)
-                
-                conn.commit()
-                
+            cur.execute('''
+                UPDATE employees 
+                SET status = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE name = %s
+            ''', (status, operator_name))
+            invalidate_directory(cur)
+            
+            if status == 'online':
+                heartbeat(cur, operator_name)
+            else:
+                clear_presence(cur, operator_name)
+            
+            if status not in ['online']:
+                requeue_operator_chats(cur, conn, operator_name)
+                assign_chat_to_operator(cur, conn)
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'heartbeat':
+            from presence import heartbeat
+            operator_name = body_data.get('operatorName', '')
+            
+            if not operator_name:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'operatorName required'})
                 }
             
-            elif action == 'createShift':
-                employee_name = body_data.get('employeeName', '')
-                shift_date = body_data.get('shiftDate', '')
-                start_time = body_data.get('startTime', '')
-                end_time = body_data.get('endTime', '')
-                shift_type = body_data.get('shiftType', 'day')
-                
-                if not all([employee_name, shift_date, start_time, end_time]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'All fields required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO shifts (employee_name, shift_date, start_time, end_time, shift_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id
-                ''', (employee_name, shift_date, start_time, end_time, shift_type))
-                shift_id = cur.fetchone()['id']
-                
-                conn.commit()
-                
+            principal = authenticate(event, cur)
+            if not principal:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 401,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'shiftId': shift_id})
+                    'body': json.dumps({'error': 'Authorization required'})
                 }
             
-            elif action == 'createKnowledge':
-                title = body_data.get('title', '')
-                category = body_data.get('category', '')
-                content = body_data.get('content', '')
-                author = body_data.get('author', '')
-                
-                if not all([title, category, content]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'title, category, content required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO knowledge_articles (title, category, content, author, views)
-                    VALUES (%s, %s, %s, %s, 0)
-                    RETURNING id
-                ''', (title, category, content, author))
-                article_id = cur.fetchone()['id']
-                
-                conn.commit()
-                
+            employee = get_employee(cur, principal['id'])
+            if not employee or employee['name'] != operator_name:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 403,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'articleId': article_id})
+                    'body': json.dumps({'error': 'operatorName does not match the token'})
                 }
             
-            elif action == 'createRating':
-                chat_id = body_data.get('chatId')
-                operator_name = body_data.get('operatorName', '')
-                rated_by = body_data.get('ratedBy', '')
-                score = body_data.get('score')
-                comment = body_data.get('comment', '')
-                
-                if not all([chat_id, operator_name, rated_by, score is not None]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId, operatorName, ratedBy, score required'})
-                    }
-                
-                if score < 1 or score > 5:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'score must be between 1 and 5'})
-                    }
-                
-                cur.execute('''
-                    SELECT id FROM ratings WHERE chat_id = %s
-                ''', (chat_id,))
-                existing_rating = cur.fetchone()
-                
-                if existing_rating:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Chat already rated by QC'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO ratings (chat_id, operator_name, rated_by, score, comment)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id
-                ''', (chat_id, operator_name, rated_by, score, comment))
-                rating_id = cur.fetchone()['id']
-                
-                conn.commit()
-                
+            recorded = heartbeat(cur, operator_name)
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True, 'recorded': recorded})
+            }
+        
+        elif action == 'sweepPresence':
+            from presence import sweep_stale_operators
+            swept = sweep_stale_operators(cur, conn)
+            if swept['operators'] and shard_urls():
+                requeued = sum(requeue_operator_chats(cur, conn, name) for name in swept['operators'])
+                swept = {**swept, 'requeuedChats': swept['requeuedChats'] + requeued}
+            if swept['requeuedChats']:
+                assign_chat_to_operator(cur, conn)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'swept': swept})
+            }
+        
+        elif action == 'runRetention':
+            from retention import RETENTION_BATCH_SIZE, run_retention
+            try:
+                result = run_retention(
+                    cur, conn,
+                    dry_run=body_data.get('dryRun', True) is not False,
+                    policies=body_data.get('policies'),
+                    days=body_data.get('days'),
+                    batch_size=int(body_data.get('batchSize') or RETENTION_BATCH_SIZE)
+                )
+            except ValueError as e:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'ratingId': rating_id})
+                    'body': json.dumps({'error': str(e)})
                 }
             
-            elif action == 'createEmployee':
-                username = body_data.get('username', '')
-                name = body_data.get('name', '')
-                role = body_data.get('role', 'operator')
-                password = body_data.get('password', '')
-                
-                if not all([username, name, password]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'username, name, password required'})
-                    }
-                
-                cur.execute('''
-                    SELECT id FROM employees WHERE username = %s
-                ''', (username,))
-                existing_employee = cur.fetchone()
-                
-                if existing_employee:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Username already exists'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO employees (username, name, role, password, status)
-                    VALUES (%s, %s, %s, %s, 'offline')
-                    RETURNING id
-                ''', (username, name, role, password))
-                employee_id = cur.fetchone()['id']
-                
-                conn.commit()
-                
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps(result)
+            }
+        
+        elif action == 'flushViews':
+            from views import flush_views, write_pending_views
+            write_pending_views(cur, conn)
+            result = flush_views(cur, conn)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps(result)
+            }
+        
+        elif action == 'claimQcItems':
+            from qc import QC_CLAIM_LIMIT, claim_qc_items, claim_qc_items_sharded
+            qc_name = body_data.get('qcName', '')
+            
+            if not qc_name:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'employeeId': employee_id})
+                    'body': json.dumps({'error': 'qcName required'})
                 }
             
-            elif action == 'submitClientRating':
-                chat_id = body_data.get('chatId')
-                score = body_data.get('score')
-                comment = body_data.get('comment', '')
-                
-                if not all([chat_id, score is not None]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId and score required'})
-                    }
-                
-                if score < 1 or score > 5:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'score must be between 1 and 5'})
-                    }
-                
-                cur.execute('''
-                    SELECT id FROM client_ratings WHERE chat_id = %s
-                ''', (chat_id,))
-                existing_rating = cur.fetchone()
-                
-                if existing_rating:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Chat already rated by client'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO client_ratings (chat_id, score, comment)
-                    VALUES (%s, %s, %s)
-                    RETURNING id
-                ''', (chat_id, score, comment))
-                rating_id = cur.fetchone()['id']
-                
-                conn.commit()
-                
+            limit = max(1, min(int(body_data.get('limit') or QC_CLAIM_LIMIT), 50))
+            urls = shard_urls()
+            if urls:
+                with shard_cursors(urls, conn) as shard_curs:
+                    result = claim_qc_items_sharded(shard_curs, qc_name, limit)
+            else:
+                result = claim_qc_items(cur, conn, qc_name, limit)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps(result)
+            }
+        
+        elif action == 'createShift':
+            employee_name = body_data.get('employeeName', '')
+            shift_date = body_data.get('shiftDate', '')
+            start_time = body_data.get('startTime', '')
+            end_time = body_data.get('endTime', '')
+            shift_type = body_data.get('shiftType', 'day')
+            
+            if not all([employee_name, shift_date, start_time, end_time]):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'ratingId': rating_id})
+                    'body': json.dumps({'error': 'All fields required'})
                 }
             
-            elif action == 'createCorporateChat':
-                title = body_data.get('title', '')
-                created_by = body_data.get('createdBy', '')
-                
-                if not all([title, created_by]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'title and createdBy required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO corporate_chats (title, created_by)
-                    VALUES (%s, %s)
-                    RETURNING id
-                ''', (title, created_by))
-                chat_id = cur.fetchone()['id']
-                
-                conn.commit()
-                
+            cur.execute('''
+                INSERT INTO shifts (employee_name, shift_date, start_time, end_time, shift_type)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (employee_name, shift_date, start_time, end_time, shift_type))
+            shift_id = cur.fetchone()['id']
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'shiftId': shift_id})
+            }
+        
+        elif action == 'createKnowledge':
+            from suggest import touch_suggest, update_suggest
+            title = body_data.get('title', '')
+            category = body_data.get('category', '')
+            content = body_data.get('content', '')
+            author = body_data.get('author', '')
+            
+            if not all([title, category, content]):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'chatId': chat_id})
+                    'body': json.dumps({'error': 'title, category, content required'})
                 }
             
-            elif action == 'sendCorporateMessage':
-                chat_id = body_data.get('chatId')
-                sender_name = body_data.get('senderName', '')
-                message_text = body_data.get('message', '')
-                
-                if not all([chat_id, sender_name, message_text]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId, senderName, message required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO corporate_messages (chat_id, sender_name, message_text)
-                    VALUES (%s, %s, %s)
-                    RETURNING id, created_at
-                ''', (chat_id, sender_name, message_text))
-                result = cur.fetchone()
-                
-                cur.execute('''
-                    UPDATE corporate_chats SET updated_at = CURRENT_TIMESTAMP WHERE id = %s
-                ''', (chat_id,))
-                
-                conn.commit()
-                
+            cur.execute('''
+                INSERT INTO knowledge_articles (title, category, content, author, views)
+                VALUES (%s, %s, %s, %s, 0)
+                RETURNING id
+            ''', (title, category, content, author))
+            article_id = cur.fetchone()['id']
+            suggest_versions = touch_suggest(cur)
+            
+            conn.commit()
+            update_suggest(suggest_versions, 'article', article_id, title, category)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'articleId': article_id})
+            }
+        
+        elif action == 'trackView':
+            from views import article_exists, track_view
+            try:
+                article_id = int(body_data.get('articleId'))
+            except (TypeError, ValueError):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'messageId': result['id'],
-                        'createdAt': result['created_at'].isoformat()
-                    })
+                    'body': json.dumps({'error': 'articleId required'})
                 }
             
-            elif action == 'createNews':
-                title = body_data.get('title', '')
-                content = body_data.get('content', '')
-                author = body_data.get('author', '')
-                
-                if not all([title, content, author]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'title, content, author required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO news (title, content, author, published_at)
-                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                    RETURNING id
-                ''', (title, content, author))
-                news_id = cur.fetchone()['id']
-                
-                conn.commit()
-                
+            if not article_exists(cur, article_id):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'newsId': news_id})
+                    'body': json.dumps({'error': 'Article not found'})
                 }
+            
+            track_view(cur, conn, article_id)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'createRating':
+            from events import record_event
+            chat_id = body_data.get('chatId')
+            operator_name = body_data.get('operatorName', '')
+            rated_by = body_data.get('ratedBy', '')
+            score = body_data.get('score')
+            comment = body_data.get('comment', '')
+            
+            if not all([chat_id, operator_name, rated_by, score is not None]):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'chatId, operatorName, ratedBy, score required'})
+                }
+            
+            if score < 1 or score > 5:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'score must be between 1 and 5'})
+                }
+            
+            cur.execute('''
+                SELECT id FROM ratings WHERE chat_id = %s
+            ''', (chat_id,))
+            existing_rating = cur.fetchone()
+            
+            if existing_rating:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Chat already rated by QC'})
+                }
+            
+            cur.execute('''
+                INSERT INTO ratings (chat_id, operator_name, rated_by, score, comment)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (chat_id, operator_name, rated_by, score, comment))
+            rating_id = cur.fetchone()['id']
+            record_event(cur, 'qcRated', chat_id, ratingId=rating_id, score=score, ratedBy=rated_by)
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'ratingId': rating_id})
+            }
+        
+        elif action == 'createEmployee':
+            username = body_data.get('username', '')
+            name = body_data.get('name', '')
+            role = body_data.get('role', 'operator')
+            password = body_data.get('password', '')
+            
+            if not all([username, name, password]):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'username, name, password required'})
+                }
+            
+            cur.execute('''
+                SELECT id FROM employees WHERE username = %s
+            ''', (username,))
+            existing_employee = cur.fetchone()
+            
+            if existing_employee:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Username already exists'})
+                }
+            
+            cur.execute('''
+                INSERT INTO employees (username, name, role, password_hash, status)
+                VALUES (%s, %s, %s, %s, 'offline')
+                RETURNING id
+            ''', (username, name, role, hash_password(password)))
+            employee_id = cur.fetchone()['id']
+            invalidate_directory(cur)
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'employeeId': employee_id})
+            }
+        
+        elif action == 'submitClientRating':
+            from events import record_event
+            from qc import enqueue_low_rating
+            chat_id = body_data.get('chatId')
+            score = body_data.get('score')
+            comment = body_data.get('comment', '')
+            
+            if not all([chat_id, score is not None]):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'chatId and score required'})
+                }
+            
+            if score < 1 or score > 5:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'score must be between 1 and 5'})
+                }
+            
+            cur.execute('''
+                SELECT id FROM client_ratings WHERE chat_id = %s
+            ''', (chat_id,))
+            existing_rating = cur.fetchone()
+            
+            if existing_rating:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Chat already rated by client'})
+                }
+            
+            cur.execute('''
+                INSERT INTO client_ratings (chat_id, score, comment)
+                VALUES (%s, %s, %s)
+                RETURNING id
+            ''', (chat_id, score, comment))
+            rating_id = cur.fetchone()['id']
+            record_event(cur, 'clientRated', chat_id, ratingId=rating_id, score=score)
+            enqueue_low_rating(cur, chat_id, score)
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'ratingId': rating_id})
+            }
+        
+        elif action == 'createCorporateChat':
+            title = body_data.get('title', '')
+            created_by = body_data.get('createdBy', '')
+            
+            if not all([title, created_by]):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'title and createdBy required'})
+                }
+            
+            cur.execute('''
+                INSERT INTO corporate_chats (title, created_by)
+                VALUES (%s, %s)
+                RETURNING id
+            ''', (title, created_by))
+            chat_id = cur.fetchone()['id']
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'chatId': chat_id})
+            }
+        
+        elif action == 'sendCorporateMessage':
+            chat_id = body_data.get('chatId')
+            sender_name = body_data.get('senderName', '')
+            message_text = body_data.get('message', '')
+            
+            if not all([chat_id, sender_name, message_text]):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'chatId, senderName, message required'})
+                }
+            
+            cur.execute('''
+                INSERT INTO corporate_messages (chat_id, sender_name, message_text)
+                VALUES (%s, %s, %s)
+                RETURNING id, created_at
+            ''', (chat_id, sender_name, message_text))
+            result = cur.fetchone()
+            
+            cur.execute('''
+                UPDATE corporate_chats SET updated_at = CURRENT_TIMESTAMP WHERE id = %s
+            ''', (chat_id,))
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'messageId': result['id'],
+                    'createdAt': result['created_at'].isoformat()
+                })
+            }
+        
+        elif action == 'createNews':
+            title = body_data.get('title', '')
+            content = body_data.get('content', '')
+            author = body_data.get('author', '')
+            
+            if not all([title, content, author]):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'title, content, author required'})
+                }
+            
+            cur.execute('''
+                INSERT INTO news (title, content, author, published_at)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                RETURNING id
+            ''', (title, content, author))
+            news_id = cur.fetchone()['id']
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'newsId': news_id})
+            }
+    
+    elif method == 'PUT':
+        action = body_data.get('action', '')
         
-        elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
-            action = body_data.get('action', '')
-            
-            if action == 'updateStatus':
-                chat_id = body_data.get('chatId')
-                status = body_data.get('status', '')
-                assigned_operator = body_data.get('assignedOperator', '')
-                
-                if not chat_id or not status:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId and status required'})
-                    }
-                
-                if status == 'active':
-                    cur.execute('''
-                        SELECT COUNT(*) as count FROM chats 
-                        WHERE assigned_operator = %s AND status = 'active'
-                    ''', (assigned_operator,))
-                    active_count = cur.fetchone()['count']
-                    
-                    if active_count >= 2:
-                        return {
-                            'statusCode': 400,
-                            'headers': headers,
-                            'isBase64Encoded': False,
-                            'body': json.dumps({'error': 'Maximum 2 active chats per operator'})
-                        }
-                    
-                    deadline = datetime.utcnow() + timedelta(minutes=15)
-                    cur.execute('''
-                        UPDATE chats 
-                        SET status = %s, assigned_operator = %s, assigned_at = CURRENT_TIMESTAMP, 
-                            deadline = %s, updated_at = CURRENT_TIMESTAMP
-                        WHERE id = %s
-                    ''', (status, assigned_operator, deadline, chat_id))
-                else:
-                    cur.execute('''
-                        UPDATE chats 
-                        SET status = %s, updated_at = CURRENT_TIMESTAMP
-                        WHERE id = %s
-                    ''', (status, chat_id))
-                
-                conn.commit()
-                
-                if status in ['closed', 'postponed', 'escalated']:
-                    assign_chat_to_operator(cur, conn)
-                    conn.commit()
-                
+        if action in ADMIN_ACTIONS:
+            denied = require_admin(event, cur, headers)
+            if denied:
+                return denied
+        
+        if action == 'updateStatus':
+            from events import record_event
+            from qc import enqueue_closed_chat
+            chat_id = body_data.get('chatId')
+            status = body_data.get('status', '')
+            assigned_operator = body_data.get('assignedOperator', '')
+            
+            if not chat_id or not status:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'chatId and status required'})
                 }
             
-            elif action == 'extendChat':
-                chat_id = body_data.get('chatId')
+            if status == 'active':
+                run_query(cur, 'activeChatCount', (assigned_operator,))
+                active_count = cur.fetchone()['count']
                 
-                if not chat_id:
+                if active_count >= MAX_ACTIVE_CHATS:
                     return {
                         'statusCode': 400,
                         'headers': headers,
                         'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId required'})
+                        'body': json.dumps({'error': 'Maximum 2 active chats per operator'})
                     }
                 
-                new_deadline = datetime.utcnow() + timedelta(minutes=15)
+                deadline = datetime.utcnow() + timedelta(minutes=15)
+                cur.execute('''
+                    UPDATE chats 
+                    SET status = %s, assigned_operator = %s, assigned_at = CURRENT_TIMESTAMP, 
+                        deadline = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                ''', (status, assigned_operator, deadline, chat_id))
+                record_event(cur, 'statusChanged', chat_id, status=status, assignedOperator=assigned_operator)
+            else:
                 cur.execute('''
                     UPDATE chats 
-                    SET deadline = %s, extension_requested = FALSE, extension_deadline = NULL,
-                        updated_at = CURRENT_TIMESTAMP
+                    SET status = %s, updated_at = CURRENT_TIMESTAMP
                     WHERE id = %s
-                ''', (new_deadline, chat_id))
+                ''', (status, chat_id))
+                record_event(cur, 'statusChanged', chat_id, status=status)
                 
+                if status == 'closed':
+                    enqueue_closed_chat(cur, chat_id)
+            
+            conn.commit()
+            
+            if status in ['closed', 'postponed', 'escalated']:
+                assign_chat_to_operator(cur, conn)
                 conn.commit()
-                
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'extendChat':
+            from events import record_event
+            chat_id = body_data.get('chatId')
+            
+            if not chat_id:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'chatId required'})
                 }
             
-            elif action == 'updateShift':
-                shift_id = body_data.get('shiftId')
-                employee_name = body_data.get('employeeName', '')
-                shift_date = body_data.get('shiftDate', '')
-                start_time = body_data.get('startTime', '')
-                end_time = body_data.get('endTime', '')
-                shift_type = body_data.get('shiftType', 'day')
-                
-                if not shift_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'shiftId required'})
-                    }
-                
-                cur.execute('''
-                    UPDATE shifts 
-                    SET employee_name = %s, shift_date = %s, start_time = %s, 
-                        end_time = %s, shift_type = %s
-                    WHERE id = %s
-                ''', (employee_name, shift_date, start_time, end_time, shift_type, shift_id))
-                
-                conn.commit()
-                
+            new_deadline = datetime.utcnow() + timedelta(minutes=15)
+            cur.execute('''
+                UPDATE chats 
+                SET deadline = %s, extension_requested = FALSE, extension_deadline = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (new_deadline, chat_id))
+            record_event(cur, 'chatExtended', chat_id, deadline=new_deadline.isoformat())
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'updateShift':
+            shift_id = body_data.get('shiftId')
+            employee_name = body_data.get('employeeName', '')
+            shift_date = body_data.get('shiftDate', '')
+            start_time = body_data.get('startTime', '')
+            end_time = body_data.get('endTime', '')
+            shift_type = body_data.get('shiftType', 'day')
+            
+            if not shift_id:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'shiftId required'})
                 }
             
-            elif action == 'updateKnowledge':
-                article_id = body_data.get('articleId')
-                title = body_data.get('title', '')
-                category = body_data.get('category', '')
-                content = body_data.get('content', '')
-                
-                if not article_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'articleId required'})
-                    }
-                
-                cur.execute('''
-                    UPDATE knowledge_articles 
-                    SET title = %s, category = %s, content = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                ''', (title, category, content, article_id))
-                
-                conn.commit()
-                
+            cur.execute('''
+                UPDATE shifts 
+                SET employee_name = %s, shift_date = %s, start_time = %s, 
+                    end_time = %s, shift_type = %s
+                WHERE id = %s
+            ''', (employee_name, shift_date, start_time, end_time, shift_type, shift_id))
+            
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'updateKnowledge':
+            from suggest import touch_suggest, update_suggest
+            article_id = body_data.get('articleId')
+            title = body_data.get('title', '')
+            category = body_data.get('category', '')
+            content = body_data.get('content', '')
+            
+            if not article_id:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'articleId required'})
                 }
             
-            elif action == 'updateEmployee':
-                employee_id = body_data.get('employeeId')
-                username = body_data.get('username')
-                name = body_data.get('name')
-                role = body_data.get('role')
-                password = body_data.get('password')
-                
-                if not employee_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'employeeId required'})
-                    }
-                
-                update_fields = []
-                update_values = []
-                
-                if username:
-                    update_fields.append('username = %s')
-                    update_values.append(username)
-                if name:
-                    update_fields.append('name = %s')
-                    update_values.append(name)
-                if role:
-                    update_fields.append('role = %s')
-                    update_values.append(role)
-                if password:
-                    update_fields.append('password = %s')
-                    update_values.append(password)
-                
-                if not update_fields:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'At least one field to update required'})
-                    }
-                
-                update_fields.append('updated_at = CURRENT_TIMESTAMP')
-                update_values.append(employee_id)
-                
-                query = f'''
-                    UPDATE employees 
-                    SET {', '.join(update_fields)}
-                    WHERE id = %s
-                '''
-                
-                cur.execute(query, update_values)
-                conn.commit()
-                
+            cur.execute('''
+                UPDATE knowledge_articles 
+                SET title = %s, category = %s, content = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (title, category, content, article_id))
+            updated = cur.rowcount
+            suggest_versions = touch_suggest(cur)
+            
+            conn.commit()
+            update_suggest(suggest_versions, 'article', article_id, title if updated else None, category)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'updateEmployee':
+            employee_id = body_data.get('employeeId')
+            username = body_data.get('username')
+            name = body_data.get('name')
+            role = body_data.get('role')
+            password = body_data.get('password')
+            
+            if not employee_id:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'employeeId required'})
                 }
-        
-            elif action == 'createJiraTemplate':
-                title = body_data.get('title', '')
-                category = body_data.get('category', '')
-                content = body_data.get('content', '')
-                created_by = body_data.get('createdBy', '')
-                
-                if not all([title, category, content]):
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'title, category, content required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO jira_templates (title, category, content, created_by)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id
-                ''', (title, category, content, created_by))
-                template_id = cur.fetchone()['id']
-                conn.commit()
-                
+            
+            update_fields = []
+            update_values = []
+            
+            if username:
+                update_fields.append('username = %s')
+                update_values.append(username)
+            if name:
+                update_fields.append('name = %s')
+                update_values.append(name)
+            if role:
+                update_fields.append('role = %s')
+                update_values.append(role)
+            if password:
+                update_fields.append('password_hash = %s')
+                update_values.append(hash_password(password))
+            
+            if not update_fields:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'templateId': template_id, 'success': True})
+                    'body': json.dumps({'error': 'At least one field to update required'})
                 }
             
-            elif action == 'updateJiraTemplate':
-                template_id = body_data.get('templateId')
-                title = body_data.get('title', '')
-                category = body_data.get('category', '')
-                content = body_data.get('content', '')
-                
-                if not template_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'templateId required'})
-                    }
-                
-                cur.execute('''
-                    UPDATE jira_templates 
-                    SET title = %s, category = %s, content = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                ''', (title, category, content, template_id))
-                conn.commit()
-                
+            update_fields.append('updated_at = CURRENT_TIMESTAMP')
+            update_values.append(employee_id)
+            
+            query = f'''
+                UPDATE employees 
+                SET {', '.join(update_fields)}
+                WHERE id = %s
+            '''
+            
+            cur.execute(query, update_values)
+            invalidate_directory(cur)
+            conn.commit()
+            invalidate_roles(employee_id)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+    
+        elif action == 'createJiraTemplate':
+            from suggest import touch_suggest, update_suggest
+            title = body_data.get('title', '')
+            category = body_data.get('category', '')
+            content = body_data.get('content', '')
+            created_by = body_data.get('createdBy', '')
+            
+            if not all([title, category, content]):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'title, category, content required'})
                 }
             
-            elif action == 'deleteJiraTemplate':
-                template_id = body_data.get('templateId')
-                
-                if not template_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'templateId required'})
-                    }
-                
-                cur.execute('DELETE FROM jira_templates WHERE id = %s', (template_id,))
-                conn.commit()
-                
+            cur.execute('''
+                INSERT INTO jira_templates (title, category, content, created_by)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id
+            ''', (title, category, content, created_by))
+            template_id = cur.fetchone()['id']
+            suggest_versions = touch_suggest(cur)
+            conn.commit()
+            update_suggest(suggest_versions, 'template', template_id, title, category)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'templateId': template_id, 'success': True})
+            }
+        
+        elif action == 'updateJiraTemplate':
+            from suggest import touch_suggest, update_suggest
+            template_id = body_data.get('templateId')
+            title = body_data.get('title', '')
+            category = body_data.get('category', '')
+            content = body_data.get('content', '')
+            
+            if not template_id:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'templateId required'})
                 }
             
-            elif action == 'addEmployeeRole':
-                employee_id = body_data.get('employeeId')
-                role = body_data.get('role', '')
-                
-                if not employee_id or not role:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'employeeId and role required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO employee_roles (employee_id, role)
-                    VALUES (%s, %s)
-                    ON CONFLICT (employee_id, role) DO NOTHING
-                    RETURNING id
-                ''', (employee_id, role))
-                
-                result = cur.fetchone()
-                conn.commit()
-                
+            cur.execute('''
+                UPDATE jira_templates 
+                SET title = %s, category = %s, content = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (title, category, content, template_id))
+            updated = cur.rowcount
+            suggest_versions = touch_suggest(cur)
+            conn.commit()
+            update_suggest(suggest_versions, 'template', template_id, title if updated else None, category)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'deleteJiraTemplate':
+            from suggest import touch_suggest, update_suggest
+            template_id = body_data.get('templateId')
+            
+            if not template_id:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True, 'roleId': result['id'] if result else None})
+                    'body': json.dumps({'error': 'templateId required'})
                 }
             
-            elif action == 'removeEmployeeRole':
-                employee_id = body_data.get('employeeId')
-                role = body_data.get('role', '')
-                
-                if not employee_id or not role:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'employeeId and role required'})
-                    }
-                
-                cur.execute('''
-                    DELETE FROM employee_roles 
-                    WHERE employee_id = %s AND role = %s
-                ''', (employee_id, role))
-                conn.commit()
-                
+            cur.execute('DELETE FROM jira_templates WHERE id = %s', (template_id,))
+            suggest_versions = touch_suggest(cur)
+            conn.commit()
+            update_suggest(suggest_versions, 'template', template_id)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        elif action == 'addEmployeeRole':
+            employee_id = body_data.get('employeeId')
+            role = body_data.get('role', '')
+            
+            if not employee_id or not role:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
+                    'body': json.dumps({'error': 'employeeId and role required'})
                 }
             
-            elif action == 'archiveQcRating':
-                chat_id = body_data.get('chatId')
-                operator_name = body_data.get('operatorName', '')
-                qc_name = body_data.get('qcName', '')
-                rating_score = body_data.get('ratingScore')
-                rating_comment = body_data.get('ratingComment', '')
-                
-                if not chat_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'chatId required'})
-                    }
-                
-                cur.execute('''
-                    INSERT INTO qc_archive (chat_id, operator_name, qc_name, rating_score, rating_comment)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id
-                ''', (chat_id, operator_name, qc_name, rating_score, rating_comment))
-                archive_id = cur.fetchone()['id']
-                conn.commit()
-                
+            cur.execute('''
+                INSERT INTO employee_roles (employee_id, role)
+                VALUES (%s, %s)
+                ON CONFLICT (employee_id, role) DO NOTHING
+                RETURNING id
+            ''', (employee_id, role))
+            
+            result = cur.fetchone()
+            invalidate_directory(cur)
+            conn.commit()
+            invalidate_roles(employee_id)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True, 'roleId': result['id'] if result else None})
+            }
+        
+        elif action == 'removeEmployeeRole':
+            employee_id = body_data.get('employeeId')
+            role = body_data.get('role', '')
+            
+            if not employee_id or not role:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'archiveId': archive_id, 'success': True})
+                    'body': json.dumps({'error': 'employeeId and role required'})
                 }
+            
+            cur.execute('''
+                DELETE FROM employee_roles 
+                WHERE employee_id = %s AND role = %s
+            ''', (employee_id, role))
+            invalidate_directory(cur)
+            conn.commit()
+            invalidate_roles(employee_id)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
         
+        elif action == 'archiveQcRating':
+            from qc import complete_qc_item
+            chat_id = body_data.get('chatId')
+            operator_name = body_data.get('operatorName', '')
+            qc_name = body_data.get('qcName', '')
+            rating_score = body_data.get('ratingScore')
+            rating_comment = body_data.get('ratingComment', '')
+            
+            if not chat_id:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'chatId required'})
+                }
+            
+            cur.execute('''
+                INSERT INTO qc_archive (chat_id, operator_name, qc_name, rating_score, rating_comment)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (chat_id, operator_name, qc_name, rating_score, rating_comment))
+            archive_id = cur.fetchone()['id']
+            complete_qc_item(cur, chat_id)
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'isBase64Encoded': False,
+                'body': json.dumps({'archiveId': archive_id, 'success': True})
+            }
+    
+    return {
+        'statusCode': 404,
+        'headers': headers,
+        'isBase64Encoded': False,
+        'body': json.dumps({'error': 'Action not found'})
+    }
+
+
+def bootstrap_actions(params: Dict[str, Any]) -> list:
+    return [a for a in (params.get('include') or '').split(',') if a]
+
+
+def bootstrap_params(params: Dict[str, Any], action: str) -> Dict[str, Any]:
+    '''
+    Параметры одного действия bootstrap: общие для всех, "<action>.<param>" переопределяет
+    параметр для одного действия
+    '''
+    sub_params = {k: v for k, v in params.items() if '.' not in k and k != 'include'}
+    prefix = action + '.'
+    sub_params.update({k[len(prefix):]: v for k, v in params.items() if k.startswith(prefix)})
+    sub_params['action'] = action
+    return sub_params
+
+
+def run_bootstrap_action(event: Dict[str, Any], action: str, params: Dict[str, Any], cur, conn,
+                         headers: Dict[str, str]) -> Dict[str, Any]:
+    '''
+    Одно GET-действие из bootstrap на общем соединении
+    Returns: {statusCode, body} с разобранным телом ответа действия
+    '''
+    sub_params = bootstrap_params(params, action)
+    
+    try:
+        if action in READ_ACTIONS:
+            return {'statusCode': 200, 'body': run_sharded_read_action(cur, action, sub_params)}
+        response = route({**event, 'queryStringParameters': sub_params}, 'GET', {}, cur, conn, headers)
+        return {'statusCode': response['statusCode'], 'body': json.loads(response['body'])}
+    except ValueError as e:
+        return {'statusCode': 400, 'body': {'error': str(e)}}
+    except Exception as e:
+        conn.rollback()
+        return {'statusCode': 500, 'body': {'error': str(e)}}
+
+
+async def run_bootstrap_read(pool, action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        with span('bootstrap.action', action=action):
+            return {'statusCode': 200, 'body': await run_read_async(pool, action, bootstrap_params(params, action))}
+    except ValueError as e:
+        return {'statusCode': 400, 'body': {'error': str(e)}}
+    except Exception as e:
+        return {'statusCode': 500, 'body': {'error': str(e)}}
+
+
+def async_read_actions(event: Dict[str, Any]) -> list:
+    '''
+    Действия GET-вызова, если все они из READ_ACTIONS и вызов можно выполнить на asyncpg
+    Returns: список действий или пустой список - вызов обрабатывает handle_request
+    '''
+    if event.get('httpMethod', 'GET') != 'GET':
+        return []
+    params = event.get('queryStringParameters') or {}
+    action = params.get('action', 'list')
+    actions = bootstrap_actions(params) if action == 'bootstrap' else [action]
+    if not actions or len(actions) > BOOTSTRAP_MAX_ACTIONS or not set(actions) <= set(READ_ACTIONS):
+        return []
+    return actions
+
+
+async def read_pool(event: Dict[str, Any], actions: list, database_url: str):
+    '''
+    Пул для чтений вызова: реплика по тем же правилам, что в handle_request, иначе primary
+    '''
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url and set(actions) <= REPLICA_ACTIONS:
+        pool = await get_replica_pool(replica_url, read_after_lsn(event))
+        if pool is not None:
+            return pool
+    return await get_pool(database_url)
+
+
+async def run_read_async(pool, action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Чтение из READ_ACTIONS с учётом шардов: слияние со всех шардов или пул шарда чата
+    '''
+    urls = shard_urls()
+    if urls and 'merge' in READ_ACTIONS[action]:
+        return await scatter_read_action_async(action, params, urls)
+    shard_url = request_shard_url(action, params, urls)
+    if shard_url:
+        pool = await get_pool(shard_url)
+    return await run_read_action_async(pool, action, params)
+
+
+def read_after_lsn(event: Dict[str, Any]) -> Optional[str]:
+    '''
+    LSN последней записи клиента: чтение уходит на реплику, только если она его уже применила.
+    Параметр readAfterLsn - для браузерных GET без preflight из-за нестандартного заголовка
+    '''
+    params = event.get('queryStringParameters') or {}
+    if params.get('readAfterLsn'):
+        return params['readAfterLsn']
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == READ_AFTER_HEADER.lower() and value:
+            return value
+    return None
+
+
+def too_many_requests(headers: Dict[str, str], retry_after: int) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {**headers, 'Retry-After': str(retry_after), 'Access-Control-Expose-Headers': 'Retry-After'},
+        'isBase64Encoded': False,
+        'body': json.dumps({'error': 'Too many requests', 'retryAfter': retry_after})
+    }
+
+
+def require_admin(event: Dict[str, Any], cur, headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    '''
+    Проверка токена администратора для управления сотрудниками
+    Returns: HTTP response dict с ошибкой или None, если доступ разрешён
+    '''
+    principal = authenticate(event, cur)
+    
+    if not principal:
         return {
-            'statusCode': 404,
+            'statusCode': 401,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Action not found'})
+            'body': json.dumps({'error': 'Authorization required'})
         }
     
-    except Exception as e:
-        conn.rollback()
+    if not any(role in ADMIN_ROLES for role in principal['roles']):
         return {
-            'statusCode': 500,
+            'statusCode': 403,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps({'error': str(e)})
+            'body': json.dumps({'error': 'Admin role required'})
         }
     
-    finally:
-        cur.close()
-        conn.close()
+    return None
 
 
-def assign_chat_to_operator(cur, conn):
+def requeue_operator_chats(cur, conn, operator_name: str) -> int:
     '''
-    Автоматическое назначение ожидающих чатов операторам онлайн
-    Максимум 2 активных чата на оператора
+    Возврат активных чатов оператора в очередь; при шардировании - на каждом шарде
+    с фиксацией по шардам
+    Returns: число возвращённых чатов
     '''
+    urls = shard_urls()
+    if not urls:
+        return requeue_chats(cur, operator_name)
+    
+    requeued = 0
+    with shard_cursors(urls, conn) as shard_curs:
+        for shard_cur in shard_curs:
+            requeued += requeue_chats(shard_cur, operator_name)
+            shard_cur.connection.commit()
+    return requeued
+
+
+def requeue_chats(cur, operator_name: str) -> int:
+    from events import record_event
+
     cur.execute('''
-        SELECT name FROM employees 
-        WHERE status = 'online'
-        ORDER BY name ASC
-    ''')
-    online_operators = cur.fetchall()
+        SELECT id FROM chats 
+        WHERE assigned_operator = %s AND status = 'active'
+    ''', (operator_name,))
+    active_chats = cur.fetchall()
+    
+    for chat in active_chats:
+        cur.execute('''
+            UPDATE chats 
+            SET assigned_operator = NULL, status = 'waiting', deadline = NULL
+            WHERE id = %s
+        ''', (chat['id'],))
+        record_event(cur, 'chatRequeued', chat['id'], operator=operator_name)
+    return len(active_chats)
+
+
+def assign_chat_to_operator(cur, conn):
+    '''
+    Автоматическое назначение ожидающих чатов операторам онлайн со свежим heartbeat
+    Максимум 2 активных чата на оператора. При шардировании операторы берутся из DATABASE_URL,
+    нагрузка оператора суммируется по шардам, из очереди берётся самый старый чат среди шардов
+    '''
+    urls = shard_urls()
+    with span('assign_chat_to_operator', shards=len(urls)):
+        if not urls:
+            assign_waiting_chat(cur, [cur])
+            return
+        
+        with shard_cursors([os.environ['DATABASE_URL'], *urls], conn) as (directory_cur, *shard_curs):
+            assign_waiting_chat(directory_cur, shard_curs)
+
+
+def assign_waiting_chat(directory_cur, chat_curs: list) -> None:
+    from events import record_event
+    from presence import fresh_operators
+
+    online_operators = fresh_operators(directory_cur, get_online_operators(directory_cur))
     
     if not online_operators:
         return
     
-    for operator in online_operators:
-        operator_name = operator['name']
+    for operator_name in online_operators:
         
-        cur.execute('''
-            SELECT COUNT(*) as count FROM chats 
-            WHERE assigned_operator = %s AND status = 'active'
-        ''', (operator_name,))
-        active_count = cur.fetchone()['count']
+        active_count = 0
+        for chat_cur in chat_curs:
+            run_query(chat_cur, 'activeChatCount', (operator_name,))
+            active_count += chat_cur.fetchone()['count']
         
-        if active_count < 2:
-            cur.execute('''
-                SELECT id FROM chats 
-                WHERE status = 'waiting' 
-                ORDER BY created_at ASC 
-                LIMIT 1
-            ''')
-            waiting_chat = cur.fetchone()
+        if active_count < MAX_ACTIVE_CHATS:
+            waiting = []
+            for chat_cur in chat_curs:
+                run_query(chat_cur, 'nextWaitingChat')
+                waiting_chat = chat_cur.fetchone()
+                if waiting_chat:
+                    waiting.append((waiting_chat['created_at'], waiting_chat['id'], chat_cur))
             
-            if waiting_chat:
+            if waiting:
+                _, chat_id, chat_cur = min(waiting, key=lambda item: (item[0] or datetime.max, item[1]))
                 deadline = datetime.utcnow() + timedelta(minutes=15)
-                cur.execute('''
-                    UPDATE chats 
-                    SET status = 'active', assigned_operator = %s, 
-                        assigned_at = CURRENT_TIMESTAMP, deadline = %s,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                ''', (operator_name, deadline, waiting_chat['id']))
-                conn.commit()
+                run_query(chat_cur, 'assignChat', (operator_name, deadline, chat_id))
+                record_event(chat_cur, 'chatAssigned', chat_id, operator=operator_name)
+                chat_cur.connection.commit()
                 return
\ No newline at end of file
@@ -0,0 +1,90 @@
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+from directory import invalidate_directory
+
+PRESENCE_TTL_SECONDS = int(os.environ.get('PRESENCE_TTL_SECONDS', '45'))
+PRESENCE_SWEEP_INTERVAL_SECONDS = 15
+
+_last_sweep = {'at': 0.0}
+
+
+def heartbeat(cur, operator_name: str) -> bool:
+    '''
+    Отметка присутствия оператора, только существующего сотрудника в статусе online.
+    last_seen_at не индексирован - обновление остаётся HOT и не трогает employees
+    Returns: True, если отметка записана
+    '''
+    cur.execute('''
+        INSERT INTO operator_presence (operator_name, last_seen_at)
+        SELECT name, clock_timestamp() FROM employees WHERE name = %s AND status = 'online'
+        ON CONFLICT (operator_name) DO UPDATE SET last_seen_at = EXCLUDED.last_seen_at
+    ''', (operator_name,))
+    return cur.rowcount > 0
+
+
+def clear_presence(cur, operator_name: str) -> None:
+    cur.execute('DELETE FROM operator_presence WHERE operator_name = %s', (operator_name,))
+
+
+def fresh_operators(cur, operator_names: List[str]) -> List[str]:
+    '''
+    Операторы из списка со свежим heartbeat, в исходном порядке
+    '''
+    if not operator_names:
+        return []
+    cur.execute('''
+        SELECT operator_name FROM operator_presence
+        WHERE operator_name = ANY(%s)
+          AND last_seen_at > clock_timestamp() - make_interval(secs => %s)
+    ''', (operator_names, PRESENCE_TTL_SECONDS))
+    fresh = {row['operator_name'] for row in cur.fetchall()}
+    return [name for name in operator_names if name in fresh]
+
+
+def sweep_stale_operators(cur, conn, now: Optional[float] = None) -> Dict[str, Any]:
+    '''
+    Пропавшие операторы: записи присутствия старше TTL удаляются, сотрудники online
+    с устаревшей или отсутствующей записью переводятся в offline, их активные чаты возвращаются в очередь с записью в журнал событий - одним запросом.
+    Запускается администратором или по расписанию (sweepPresence), не чаще раза
+    в PRESENCE_SWEEP_INTERVAL_SECONDS на инстанс
+    Returns: {'operators': [имена], 'requeuedChats': число} или пустой результат, если рано
+    '''
+    now = now if now is not None else time.monotonic()
+    if now - _last_sweep['at'] < PRESENCE_SWEEP_INTERVAL_SECONDS:
+        return {'operators': [], 'requeuedChats': 0}
+    _last_sweep['at'] = now
+
+    cur.execute('''
+        WITH stale AS (
+            DELETE FROM operator_presence
+            WHERE last_seen_at <= clock_timestamp() - make_interval(secs => %s)
+            RETURNING operator_name
+        ), offline AS (
+            UPDATE employees SET status = 'offline', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'online' AND (
+                name IN (SELECT operator_name FROM stale)
+                OR NOT EXISTS (SELECT 1 FROM operator_presence p WHERE p.operator_name = employees.name)
+            )
+            RETURNING name
+        ), requeued AS (
+            UPDATE chats SET assigned_operator = NULL, status = 'waiting', deadline = NULL
+            FROM offline
+            WHERE chats.status = 'active' AND chats.assigned_operator = offline.name
+            RETURNING chats.id, offline.name AS operator_name
+        ), requeued_events AS (
+            INSERT INTO chat_events (event_type, chat_id, payload)
+            SELECT 'chatRequeued', id, jsonb_build_object('operator', operator_name, 'reason', 'presenceExpired')
+            FROM requeued
+        )
+        SELECT
+            ARRAY(SELECT name FROM offline) AS operators,
+            (SELECT COUNT(*) FROM requeued) AS requeued_chats
+    ''', (PRESENCE_TTL_SECONDS,))
+    row = cur.fetchone()
+
+    if row['operators']:
+        invalidate_directory(cur)
+    conn.commit()
+    return {'operators': row['operators'], 'requeuedChats': row['requeued_chats']}
@@ -0,0 +1,189 @@
+import json
+import os
+import sys
+import zlib
+from typing import Dict, Any, List, Set, Tuple
+
+QC_SAMPLE_RATE = float(os.environ.get('QC_SAMPLE_RATE', '0.1'))
+
+
+def _load_operator_rates(value: str) -> Dict[str, float]:
+    '''
+    Ошибка в переменной окружения не должна ронять импорт функции: она логируется,
+    и для всех операторов действует общая доля
+    '''
+    try:
+        rates = json.loads(value or '{}')
+        if not isinstance(rates, dict):
+            raise ValueError('expected a JSON object')
+        return {str(name): float(rate) for name, rate in rates.items()}
+    except (TypeError, ValueError) as e:
+        print(f'QC_OPERATOR_SAMPLE_RATES ignored: {e}', file=sys.stderr)
+        return {}
+
+
+# Доля выборки по операторам поверх общей, например {"Иван Петров": 0.5}
+QC_OPERATOR_SAMPLE_RATES: Dict[str, float] = _load_operator_rates(os.environ.get('QC_OPERATOR_SAMPLE_RATES', ''))
+QC_LOW_RATING_MAX = 2
+QC_CLAIM_TTL_MINUTES = 30
+QC_CLAIM_LIMIT = 10
+
+PRIORITY_SAMPLE = 0
+PRIORITY_LOW_RATING = 10
+
+
+def is_sampled(chat_id: int, operator_name: str) -> bool:
+    '''
+    Детерминированная выборка по id чата: повторное закрытие даёт то же решение
+    '''
+    rate = QC_OPERATOR_SAMPLE_RATES.get(operator_name or '', QC_SAMPLE_RATE)
+    return zlib.crc32(str(chat_id).encode('utf-8')) % 10000 < rate * 10000
+
+
+def enqueue_closed_chat(cur, chat_id: int) -> None:
+    '''
+    Закрытый чат попадает в очередь QC, если уже есть низкая оценка клиента или он попал в выборку
+    '''
+    cur.execute('''
+        SELECT c.assigned_operator, cr.score AS client_score
+        FROM chats c
+        LEFT JOIN client_ratings cr ON cr.chat_id = c.id
+        WHERE c.id = %s
+    ''', (chat_id,))
+    chat = cur.fetchone()
+    if not chat:
+        return
+
+    if chat['client_score'] is not None and chat['client_score'] <= QC_LOW_RATING_MAX:
+        reason, priority = 'lowRating', PRIORITY_LOW_RATING
+    elif is_sampled(chat_id, chat['assigned_operator']):
+        reason, priority = 'sample', PRIORITY_SAMPLE
+    else:
+        return
+
+    cur.execute('''
+        INSERT INTO qc_queue (chat_id, operator_name, reason, priority)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (chat_id) DO NOTHING
+    ''', (chat_id, chat['assigned_operator'], reason, priority))
+
+
+def enqueue_low_rating(cur, chat_id: int, score: int) -> None:
+    '''
+    Низкая оценка клиента по закрытому чату поднимает его в очереди или добавляет вне выборки
+    '''
+    if score > QC_LOW_RATING_MAX:
+        return
+    cur.execute('''
+        INSERT INTO qc_queue (chat_id, operator_name, reason, priority)
+        SELECT id, assigned_operator, 'lowRating', %s FROM chats WHERE id = %s AND status = 'closed'
+        ON CONFLICT (chat_id) DO UPDATE SET reason = EXCLUDED.reason, priority = EXCLUDED.priority
+        WHERE qc_queue.status = 'pending'
+    ''', (PRIORITY_LOW_RATING, chat_id))
+
+
+def claim_qc_items(cur, conn, qc_name: str, limit: int = QC_CLAIM_LIMIT) -> Dict[str, Any]:
+    '''
+    Выдача проверяющему до limit элементов: уже взятые им плюс новые из очереди.
+    Параллельные проверяющие не получают одни и те же чаты (FOR UPDATE SKIP LOCKED),
+    брошенные дольше QC_CLAIM_TTL_MINUTES возвращаются в очередь
+    Returns: {'items': [...], 'pending': число оставшихся в очереди}
+    '''
+    items, _, pending = _claim(cur, qc_name, limit)
+    conn.commit()
+    return {'items': [_item_row(item) for item in items], 'pending': pending}
+
+
+def claim_qc_items_sharded(shard_curs: List[Any], qc_name: str, limit: int = QC_CLAIM_LIMIT) -> Dict[str, Any]:
+    '''
+    claim_qc_items при шардировании: очередь чата лежит на его шарде. Каждый шард выдаёт до limit,
+    из новых оставляются лучшие по приоритету сверх уже взятых, лишние возвращаются в очередь
+    до фиксации - другие проверяющие их не теряют
+    '''
+    held, fresh, pending = [], [], 0
+    for cur in shard_curs:
+        items, new_ids, shard_pending = _claim(cur, qc_name, limit)
+        pending += shard_pending
+        for item in items:
+            (fresh if item['chat_id'] in new_ids else held).append((item, cur))
+
+    fresh.sort(key=lambda entry: (-entry[0]['priority'], entry[0]['chat_id']))
+    kept = fresh[:max(0, limit - len(held))]
+    for cur in shard_curs:
+        extra = [item['chat_id'] for item, item_cur in fresh[len(kept):] if item_cur is cur]
+        if extra:
+            cur.execute('''
+                UPDATE qc_queue SET status = 'pending', claimed_by = NULL, claimed_at = NULL
+                WHERE chat_id = ANY(%s)
+            ''', (extra,))
+            pending += len(extra)
+    for cur in shard_curs:
+        cur.connection.commit()
+
+    items = sorted((item for item, _ in held + kept), key=lambda item: (-item['priority'], item['chat_id']))
+    return {'items': [_item_row(item) for item in items], 'pending': pending}
+
+
+def _claim(cur, qc_name: str, limit: int) -> Tuple[List[Dict[str, Any]], Set[int], int]:
+    '''
+    Захват без фиксации
+    Returns: (взятые проверяющим элементы, chat_id взятых этим вызовом, число оставшихся в очереди)
+    '''
+    cur.execute('''
+        UPDATE qc_queue SET status = 'pending', claimed_by = NULL, claimed_at = NULL
+        WHERE status = 'claimed' AND claimed_at < CURRENT_TIMESTAMP - make_interval(mins => %s)
+    ''', (QC_CLAIM_TTL_MINUTES,))
+
+    cur.execute('''
+        UPDATE qc_queue SET status = 'claimed', claimed_by = %s, claimed_at = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT id FROM qc_queue
+            WHERE status = 'pending'
+            ORDER BY priority DESC, id
+            LIMIT GREATEST(0, %s - (
+                SELECT COUNT(*) FROM qc_queue WHERE status = 'claimed' AND claimed_by = %s
+            ))
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING chat_id
+    ''', (qc_name, limit, qc_name))
+    new_ids = {row['chat_id'] for row in cur.fetchall()}
+
+    cur.execute('''
+        SELECT q.chat_id, q.reason, q.priority, q.claimed_at,
+               c.status, c.assigned_operator, c.created_at, c.updated_at,
+               c.client_name, c.email, c.phone, c.ip_address
+        FROM qc_queue q
+        JOIN chats c ON c.id = q.chat_id
+        WHERE q.status = 'claimed' AND q.claimed_by = %s
+        ORDER BY q.priority DESC, q.id
+    ''', (qc_name,))
+    items = cur.fetchall()
+
+    cur.execute("SELECT COUNT(*) AS count FROM qc_queue WHERE status = 'pending'")
+    return items, new_ids, cur.fetchone()['count']
+
+
+def complete_qc_item(cur, chat_id: int) -> None:
+    '''
+    Проверенный чат уходит из очереди - её размер остаётся равным объёму непроверенной работы
+    '''
+    cur.execute('DELETE FROM qc_queue WHERE chat_id = %s', (chat_id,))
+
+
+def _item_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': item['chat_id'],
+        'status': item['status'],
+        'assignedOperator': item['assigned_operator'],
+        'clientName': item['client_name'] or 'Клиент',
+        'email': item['email'] or '',
+        'phone': item['phone'] or '',
+        'ipAddress': item['ip_address'] or '',
+        'createdAt': item['created_at'].isoformat() if item['created_at'] else None,
+        'updatedAt': item['updated_at'].isoformat() if item['updated_at'] else None,
+        'reason': item['reason'],
+        'claimedAt': item['claimed_at'].isoformat() if item['claimed_at'] else None,
+        'hasRating': False,
+        'ratingScore': None
+    }
@@ -0,0 +1,523 @@
+import re
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional
+
+from db import execute_prepared
+from tracing import span
+
+CLIENTS_PAGE_SIZE = 50
+CLIENTS_MAX_PAGE_SIZE = 200
+EVENTS_PAGE_SIZE = 500
+EVENTS_MAX_PAGE_SIZE = 1000
+POPULAR_ARTICLES_LIMIT = 10
+POPULAR_ARTICLES_MAX_LIMIT = 50
+
+# Страница клиентов по (last_seen, id) с числом незакрытых чатов; LIMIT на 1 больше страницы
+CLIENTS_SQL = '''
+        SELECT cl.id, cl.ip_address, cl.name, cl.email, cl.phone, cl.created_at, cl.last_seen,
+               (SELECT COUNT(*) FROM chats c WHERE c.client_id = cl.id AND c.status <> 'closed') AS open_chats
+        FROM clients cl
+        {where}
+        ORDER BY cl.last_seen DESC, cl.id DESC
+        LIMIT %s
+    '''
+# Подстрока без учёта регистра по четырём полям, каждое под своим триграммным индексом
+CLIENTS_MATCH = '''(cl.name ILIKE %s OR cl.email ILIKE %s OR cl.phone ILIKE %s OR cl.ip_address ILIKE %s)'''
+
+# Именованные SQL-запросы горячего пути; имя служит и ключом подготовленного выражения
+QUERIES: Dict[str, str] = {
+    'listAll': '''
+        SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
+               c.assigned_at, c.deadline, c.extension_requested, c.extension_deadline,
+               c.client_name, c.email, c.phone, c.ip_address
+        FROM chats c
+        ORDER BY c.updated_at DESC
+    ''',
+    'listForOperator': '''
+        SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
+               c.assigned_at, c.deadline, c.extension_requested, c.extension_deadline,
+               c.client_name, c.email, c.phone, c.ip_address
+        FROM chats c
+        WHERE c.assigned_operator = %s OR c.status = 'waiting'
+        ORDER BY c.updated_at DESC
+    ''',
+    'messages': '''
+        SELECT id, sender_type, sender_name, message_text, created_at
+        FROM messages
+        WHERE chat_id = %s
+        ORDER BY created_at ASC
+    ''',
+    'clients': CLIENTS_SQL.format(where=''),
+    'clientsAfter': CLIENTS_SQL.format(where='WHERE (cl.last_seen, cl.id) < (%s, %s)'),
+    'clientsSearch': CLIENTS_SQL.format(where='WHERE ' + CLIENTS_MATCH),
+    'clientsSearchAfter': CLIENTS_SQL.format(
+        where='WHERE ' + CLIENTS_MATCH + ' AND (cl.last_seen, cl.id) < (%s, %s)'
+    ),
+    'knowledge': '''
+        SELECT id, title, category, content, views, created_at, updated_at, author
+        FROM knowledge_articles
+        ORDER BY created_at DESC
+    ''',
+    'popularArticles': '''
+        SELECT id, title, category, COALESCE(views, 0) AS views
+        FROM knowledge_articles
+        ORDER BY COALESCE(views, 0) DESC, id DESC
+        LIMIT %s
+    ''',
+    'closedChats': '''
+        SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
+               c.client_name, c.email, c.phone, c.ip_address,
+               r.id as rating_id, r.score as rating_score
+        FROM chats c
+        LEFT JOIN ratings r ON c.id = r.chat_id
+        WHERE c.status = 'closed'
+        ORDER BY c.updated_at DESC
+    ''',
+    'ratings': '''
+        SELECT id, chat_id, operator_name, rated_by, score, comment, created_at
+        FROM ratings
+        WHERE operator_name = %s
+        ORDER BY created_at DESC
+    ''',
+    'corporateChats': '''
+        SELECT id, title, created_by, created_at, updated_at
+        FROM corporate_chats
+        WHERE created_by = %s OR id IN (
+            SELECT DISTINCT chat_id FROM corporate_messages WHERE sender_name = %s
+        )
+        ORDER BY updated_at DESC
+    ''',
+    'corporateMessages': '''
+        SELECT id, sender_name, message_text, created_at
+        FROM corporate_messages
+        WHERE chat_id = %s
+        ORDER BY created_at ASC
+    ''',
+    'jiraTemplates': '''
+        SELECT id, title, category, content, created_by, created_at, updated_at
+        FROM jira_templates
+        ORDER BY category, title
+    ''',
+    'qcArchive': '''
+        SELECT qa.*, c.status as chat_status
+        FROM qc_archive qa
+        LEFT JOIN chats c ON qa.chat_id = c.id
+        ORDER BY qa.archived_at DESC
+    ''',
+    'news': '''
+        SELECT id, title, content, author, created_at, published_at
+        FROM news
+        ORDER BY published_at DESC, created_at DESC
+    ''',
+    'allChats': '''
+        SELECT c.id, c.status, c.assigned_operator, c.created_at, c.updated_at,
+               c.assigned_at, c.deadline, c.extension_requested, c.extension_deadline,
+               c.client_name, c.email, c.phone, c.ip_address,
+               cr.score as client_rating_score, cr.comment as client_rating_comment
+        FROM chats c
+        LEFT JOIN client_ratings cr ON c.id = cr.chat_id
+        ORDER BY c.updated_at DESC
+    ''',
+    'activeChatCount': '''
+        SELECT COUNT(*) as count FROM chats
+        WHERE assigned_operator = %s AND status = 'active'
+    ''',
+    'nextWaitingChat': '''
+        SELECT id, created_at FROM chats
+        WHERE status = 'waiting'
+        ORDER BY created_at ASC
+        LIMIT 1
+    ''',
+    'assignChat': '''
+        UPDATE chats
+        SET status = 'active', assigned_operator = %s,
+            assigned_at = CURRENT_TIMESTAMP, deadline = %s,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    ''',
+    'insertMessage': '''
+        INSERT INTO messages (chat_id, sender_type, sender_name, message_text)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id, created_at
+    ''',
+    'touchChat': '''
+        UPDATE chats SET updated_at = CURRENT_TIMESTAMP WHERE id = %s
+    ''',
+    'insertEvent': '''
+        INSERT INTO chat_events (event_type, chat_id, payload) VALUES (%s, %s, %s)
+    ''',
+    'events': '''
+        SELECT seq, tx_id::text AS tx_id, event_type, chat_id, payload, created_at
+        FROM chat_events
+        WHERE (tx_id, seq) > (%s::text::xid8, %s)
+          AND tx_id < pg_snapshot_xmin(pg_current_snapshot())
+        ORDER BY tx_id, seq
+        LIMIT %s
+    '''
+}
+
+
+def run_query(cur, name: str, args: tuple = ()) -> None:
+    execute_prepared(cur, name, QUERIES[name], args)
+
+
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def chat_row(chat: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': chat['id'],
+        'status': chat['status'],
+        'assignedOperator': chat['assigned_operator'],
+        'clientName': chat['client_name'] or 'Клиент',
+        'email': chat['email'] or '',
+        'phone': chat['phone'] or '',
+        'ipAddress': chat['ip_address'] or '',
+        'createdAt': _iso(chat['created_at']),
+        'updatedAt': _iso(chat['updated_at']),
+        'assignedAt': _iso(chat['assigned_at']),
+        'deadline': _iso(chat['deadline']),
+        'extensionRequested': chat['extension_requested'] or False,
+        'extensionDeadline': _iso(chat['extension_deadline'])
+    }
+
+
+def all_chats_row(chat: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **chat_row(chat),
+        'clientRatingScore': chat['client_rating_score'],
+        'clientRatingComment': chat['client_rating_comment'] or ''
+    }
+
+
+def closed_chat_row(chat: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': chat['id'],
+        'status': chat['status'],
+        'assignedOperator': chat['assigned_operator'],
+        'clientName': chat['client_name'] or 'Клиент',
+        'email': chat['email'] or '',
+        'phone': chat['phone'] or '',
+        'ipAddress': chat['ip_address'] or '',
+        'createdAt': _iso(chat['created_at']),
+        'updatedAt': _iso(chat['updated_at']),
+        'hasRating': chat['rating_id'] is not None,
+        'ratingScore': chat['rating_score']
+    }
+
+
+def message_row(msg: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': msg['id'],
+        'senderType': msg['sender_type'],
+        'senderName': msg['sender_name'] or '',
+        'text': msg['message_text'],
+        'createdAt': _iso(msg['created_at'])
+    }
+
+
+def client_row(client: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': client['id'],
+        'ipAddress': client['ip_address'],
+        'name': client['name'] or 'Не указано',
+        'email': client['email'] or '',
+        'phone': client['phone'] or '',
+        'createdAt': _iso(client['created_at']),
+        'lastSeen': _iso(client['last_seen']),
+        'openChats': client['open_chats']
+    }
+
+
+def article_row(article: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': article['id'],
+        'title': article['title'],
+        'category': article['category'],
+        'content': article['content'],
+        'views': article['views'] or 0,
+        'createdAt': _iso(article['created_at']),
+        'updatedAt': _iso(article['updated_at']),
+        'author': article['author'] or ''
+    }
+
+
+def popular_article_row(article: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': article['id'],
+        'title': article['title'],
+        'category': article['category'],
+        'views': article['views']
+    }
+
+
+def rating_row(rating: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': rating['id'],
+        'chatId': rating['chat_id'],
+        'operatorName': rating['operator_name'],
+        'ratedBy': rating['rated_by'],
+        'score': rating['score'],
+        'comment': rating['comment'] or '',
+        'createdAt': _iso(rating['created_at'])
+    }
+
+
+def corporate_chat_row(chat: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': chat['id'],
+        'title': chat['title'],
+        'createdBy': chat['created_by'],
+        'createdAt': _iso(chat['created_at']),
+        'updatedAt': _iso(chat['updated_at'])
+    }
+
+
+def corporate_message_row(msg: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': msg['id'],
+        'senderName': msg['sender_name'],
+        'text': msg['message_text'],
+        'createdAt': _iso(msg['created_at'])
+    }
+
+
+def template_row(tpl: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': tpl['id'],
+        'title': tpl['title'],
+        'category': tpl['category'],
+        'content': tpl['content'],
+        'createdBy': tpl['created_by'],
+        'createdAt': _iso(tpl['created_at']),
+        'updatedAt': _iso(tpl['updated_at'])
+    }
+
+
+def archive_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': item['id'],
+        'chatId': item['chat_id'],
+        'operatorName': item['operator_name'],
+        'qcName': item['qc_name'],
+        'ratingScore': item['rating_score'],
+        'ratingComment': item['rating_comment'],
+        'archivedAt': _iso(item['archived_at']),
+        'chatStatus': item.get('chat_status')
+    }
+
+
+def news_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': item['id'],
+        'title': item['title'],
+        'content': item['content'],
+        'author': item['author'],
+        'createdAt': _iso(item['created_at']),
+        'publishedAt': _iso(item['published_at'])
+    }
+
+
+def page_size(params: Dict[str, Any], default: int = CLIENTS_PAGE_SIZE, maximum: int = CLIENTS_MAX_PAGE_SIZE) -> int:
+    try:
+        size = int(params.get('limit') or default)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(size, maximum))
+
+
+def parse_cursor(cursor: str) -> tuple:
+    '''
+    Курсор "<last_seen ISO>|<id>" из nextCursor предыдущей страницы
+    '''
+    try:
+        last_seen, client_id = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(last_seen), int(client_id)
+    except ValueError:
+        raise ValueError('invalid cursor')
+
+
+def client_cursor(client: Dict[str, Any]) -> str:
+    return f"{client['last_seen'].isoformat()}|{client['id']}"
+
+
+def clients_query(params: Dict[str, Any]) -> str:
+    search = 'Search' if params.get('q') else ''
+    after = 'After' if params.get('cursor') else ''
+    return f'clients{search}{after}'
+
+
+def clients_args(params: Dict[str, Any]) -> tuple:
+    args = ()
+    if params.get('q'):
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', params['q'].strip()) + '%'
+        args += (pattern,) * 4
+    if params.get('cursor'):
+        args += parse_cursor(params['cursor'])
+    return args + (page_size(params) + 1,)
+
+
+def event_row(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'seq': event['seq'],
+        'cursor': event_cursor(event),
+        'type': event['event_type'],
+        'chatId': event['chat_id'],
+        'payload': event['payload'],
+        'createdAt': _iso(event['created_at'])
+    }
+
+
+def event_cursor(event: Dict[str, Any]) -> str:
+    return f"{event['tx_id']}:{event['seq']}"
+
+
+def events_page_size(params: Dict[str, Any]) -> int:
+    return page_size(params, EVENTS_PAGE_SIZE, EVENTS_MAX_PAGE_SIZE)
+
+
+def events_args(params: Dict[str, Any]) -> tuple:
+    '''
+    Курсор after - "<tx_id>:<seq>" из поля cursor последнего прочитанного события; пусто - с начала
+    '''
+    after = params.get('after') or '0:0'
+    try:
+        tx_id, seq = after.split(':')
+        position = (str(int(tx_id)), int(seq))
+    except ValueError:
+        raise ValueError('invalid after cursor')
+    return position + (events_page_size(params) + 1,)
+
+
+def order_key(*columns: str) -> Callable[[Dict[str, Any]], tuple]:
+    '''
+    Ключ слияния строк, отсортированных запросом по columns DESC: NULL в PostgreSQL идут первыми
+    '''
+    return lambda row: tuple((row[c] is None, row[c] if row[c] is not None else datetime.min) for c in columns)
+
+
+# Чтения GET вида "запрос -> строки -> {key: [...]}"
+# query: имя в QUERIES или функция params -> имя; args: params -> кортеж аргументов;
+# merge: ключ порядка строк - чтение идёт по всем шардам со слиянием (shards.py)
+READ_ACTIONS: Dict[str, Dict[str, Any]] = {
+    'list': {
+        'query': lambda p: 'listForOperator' if p.get('operatorName') else 'listAll',
+        'args': lambda p: (p['operatorName'],) if p.get('operatorName') else (),
+        'key': 'chats',
+        'row': chat_row,
+        'merge': order_key('updated_at')
+    },
+    'messages': {
+        'query': 'messages',
+        'required': 'chatId',
+        'args': lambda p: (int(p['chatId']),),
+        'key': 'messages',
+        'row': message_row
+    },
+    'clients': {
+        'query': clients_query,
+        'args': clients_args,
+        'key': 'clients',
+        'row': client_row,
+        'page': page_size,
+        'cursor': client_cursor,
+        'merge': order_key('last_seen', 'id')
+    },
+    'knowledge': {'query': 'knowledge', 'key': 'articles', 'row': article_row},
+    'popularArticles': {
+        'query': 'popularArticles',
+        'args': lambda p: (page_size(p, POPULAR_ARTICLES_LIMIT, POPULAR_ARTICLES_MAX_LIMIT),),
+        'key': 'articles',
+        'row': popular_article_row
+    },
+    'closedChats': {
+        'query': 'closedChats',
+        'key': 'chats',
+        'row': closed_chat_row,
+        'merge': order_key('updated_at')
+    },
+    'ratings': {
+        'query': 'ratings',
+        'required': 'operatorName',
+        'args': lambda p: (p['operatorName'],),
+        'key': 'ratings',
+        'row': rating_row,
+        'merge': order_key('created_at')
+    },
+    'corporateChats': {
+        'query': 'corporateChats',
+        'required': 'employeeName',
+        'args': lambda p: (p['employeeName'], p['employeeName']),
+        'key': 'chats',
+        'row': corporate_chat_row
+    },
+    'corporateMessages': {
+        'query': 'corporateMessages',
+        'required': 'chatId',
+        'args': lambda p: (int(p['chatId']),),
+        'key': 'messages',
+        'row': corporate_message_row
+    },
+    'jiraTemplates': {'query': 'jiraTemplates', 'key': 'templates', 'row': template_row},
+    'qcArchive': {
+        'query': 'qcArchive',
+        'key': 'archive',
+        'row': archive_row,
+        'merge': order_key('archived_at')
+    },
+    'news': {'query': 'news', 'key': 'news', 'row': news_row},
+    'allChats': {
+        'query': 'allChats',
+        'key': 'chats',
+        'row': all_chats_row,
+        'merge': order_key('updated_at')
+    },
+    'events': {
+        'query': 'events',
+        'args': events_args,
+        'key': 'events',
+        'row': event_row,
+        'page': events_page_size,
+        'cursor': event_cursor
+    }
+}
+
+
+def read_action_query(action: str, params: Dict[str, Any]) -> tuple:
+    '''
+    Имя запроса и аргументы для чтения
+    Returns: (имя запроса, аргументы); ValueError с текстом ошибки, если нет обязательного параметра
+    '''
+    spec = READ_ACTIONS[action]
+    required = spec.get('required')
+    if required and not params.get(required):
+        raise ValueError(f'{required} required')
+
+    query = spec['query']
+    name = query(params) if callable(query) else query
+    args_builder: Optional[Callable] = spec.get('args')
+    return name, args_builder(params) if args_builder else ()
+
+
+def read_action_payload(action: str, rows: list, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Ответ чтения; для постраничных чтений запрос выбирает на строку больше страницы,
+    её наличие даёт nextCursor
+    '''
+    spec = READ_ACTIONS[action]
+    row = spec['row']
+    with span('serialize', action=action, rows=len(rows)):
+        if 'page' not in spec:
+            return {spec['key']: [row(r) for r in rows]}
+
+        size = spec['page'](params)
+        page = rows[:size]
+        next_cursor = spec['cursor'](page[-1]) if len(rows) > size else None
+        return {spec['key']: [row(r) for r in page], 'nextCursor': next_cursor}
+
+
+def run_read_action(cur, action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    name, args = read_action_query(action, params)
+    run_query(cur, name, args)
+    return read_action_payload(action, cur.fetchall(), params)
@@ -0,0 +1,94 @@
+import hashlib
+import math
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# action -> [(scope, capacity, refill tokens per second)]
+RATE_LIMITS: Dict[str, List[Tuple[str, float, float]]] = {
+    'startChat': [('ip', 10, 10 / 600)],
+    'sendMessage': [('chat', 30, 0.5), ('ip', 60, 1.0)]
+}
+LOCAL_BUCKETS_MAX = 10000
+# Значения длиннее в ключе заменяются на sha256: bucket_key - VARCHAR(200)
+KEY_VALUE_MAX_LENGTH = 64
+
+_local_buckets: Dict[str, Tuple[float, float]] = {}
+
+
+def source_ip(event: Dict[str, Any]) -> str:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    return identity.get('sourceIp', '')
+
+
+def rate_limit_keys(action: str, body_data: Dict[str, Any], event: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+    '''
+    Ключи бакетов для действия: IP только из requestContext - ipAddress тела задаёт клиент,
+    и случайное значение в нём обходило бы лимит
+    '''
+    keys = []
+    for scope, capacity, rate in RATE_LIMITS.get(action, []):
+        if scope == 'ip':
+            value = source_ip(event)
+        else:
+            value = body_data.get('chatId')
+        if value:
+            value = str(value)
+            if len(value) > KEY_VALUE_MAX_LENGTH:
+                value = hashlib.sha256(value.encode('utf-8')).hexdigest()
+            keys.append((f'{action}:{scope}:{value}', capacity, rate))
+    return keys
+
+
+def check_local(keys: List[Tuple[str, float, float]], now: Optional[float] = None) -> Optional[int]:
+    '''
+    Быстрый путь в памяти инстанса, до подключения к БД
+    Returns: Retry-After в секундах, если лимит исчерпан, иначе None (токен списан)
+    '''
+    now = now if now is not None else time.monotonic()
+    if len(_local_buckets) > LOCAL_BUCKETS_MAX:
+        _local_buckets.clear()
+
+    refilled = []
+    for key, capacity, rate in keys:
+        tokens, updated = _local_buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens < 1:
+            return max(1, math.ceil((1 - tokens) / rate))
+        refilled.append((key, tokens))
+
+    for key, tokens in refilled:
+        _local_buckets[key] = (tokens - 1, now)
+    return None
+
+
+def check_shared(cur, conn, keys: List[Tuple[str, float, float]]) -> Optional[int]:
+    '''
+    Общий для всех инстансов бакет в rate_limit_buckets: пополнение и списание
+    одним атомарным UPSERT на ключ, фиксируется сразу, чтобы не держать блокировку строки
+    Returns: Retry-After в секундах, если лимит исчерпан, иначе None
+    '''
+    retry_after = None
+    for key, capacity, rate in keys:
+        cur.execute('''
+            INSERT INTO rate_limit_buckets AS b (bucket_key, tokens, updated_at)
+            VALUES (%s, %s - 1, clock_timestamp())
+            ON CONFLICT (bucket_key) DO UPDATE
+            SET tokens = LEAST(%s, b.tokens + extract(epoch FROM clock_timestamp() - b.updated_at) * %s) - 1,
+                updated_at = clock_timestamp()
+            WHERE LEAST(%s, b.tokens + extract(epoch FROM clock_timestamp() - b.updated_at) * %s) >= 1
+            RETURNING tokens
+        ''', (key, capacity, capacity, rate, capacity, rate))
+        if cur.fetchone():
+            continue
+
+        cur.execute('''
+            SELECT LEAST(%s, tokens + extract(epoch FROM clock_timestamp() - updated_at) * %s) AS tokens
+            FROM rate_limit_buckets WHERE bucket_key = %s
+        ''', (capacity, rate, key))
+        row = cur.fetchone()
+        tokens = float(row['tokens']) if row else 0.0
+        retry_after = max(1, math.ceil((1 - tokens) / rate))
+        break
+
+    conn.commit()
+    return retry_after
@@ -0,0 +1,161 @@
+import time
+from typing import Dict, Any, List, Optional
+
+RETENTION_BATCH_SIZE = 500
+RETENTION_BATCH_PAUSE_SECONDS = 0.05
+RETENTION_TIME_BUDGET_SECONDS = 20
+RETENTION_LOCK_TIMEOUT = '1s'
+DRY_RUN_SAMPLE_SIZE = 10
+
+# Политики хранения: строки table.key, подходящие под where (единственный %s - срок в днях),
+# обрабатываются запросом apply (единственный %s - массив ключей пачки)
+RETENTION_POLICIES: Dict[str, Dict[str, Any]] = {
+    'closeStaleWaitingChats': {
+        'days': 2,
+        'table': 'chats',
+        'key': 'id',
+        'where': "status = 'waiting' AND updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+        'apply': '''
+            WITH closed AS (
+                UPDATE chats SET status = 'closed', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ANY(%s)
+                RETURNING id
+            )
+            INSERT INTO chat_events (event_type, chat_id, payload)
+            SELECT 'statusChanged', id, '{"status": "closed", "reason": "retention"}'::jsonb FROM closed
+        '''
+    },
+    'purgeClosedChatMessages': {
+        'days': 365,
+        'table': 'messages',
+        'key': 'id',
+        'where': '''chat_id IN (
+            SELECT id FROM chats
+            WHERE status = 'closed' AND updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        )''',
+        'apply': 'DELETE FROM messages WHERE id = ANY(%s)'
+    },
+    'purgeCorporateMessages': {
+        'days': 365,
+        'table': 'corporate_messages',
+        'key': 'id',
+        'where': 'created_at < CURRENT_TIMESTAMP - make_interval(days => %s)',
+        'apply': 'DELETE FROM corporate_messages WHERE id = ANY(%s)'
+    },
+    'anonymizeClients': {
+        'days': 180,
+        'table': 'clients',
+        'key': 'id',
+        'where': '''last_seen < CURRENT_TIMESTAMP - make_interval(days => %s)
+            AND ip_address NOT LIKE 'anonymized-%%'
+            AND NOT EXISTS (SELECT 1 FROM chats c WHERE c.client_id = clients.id AND c.status <> 'closed')''',
+        'apply': '''
+            WITH anonymized AS (
+                UPDATE clients SET name = NULL, email = NULL, phone = NULL, ip_address = 'anonymized-' || id
+                WHERE id = ANY(%s)
+                RETURNING id
+            )
+            UPDATE chats SET client_name = NULL, email = NULL, phone = NULL, ip_address = NULL
+            WHERE client_id IN (SELECT id FROM anonymized)
+        '''
+    },
+    'purgeExpiredIdempotencyKeys': {
+        'days': 0,
+        'table': 'idempotency_keys',
+        'key': 'idem_key',
+        'where': 'expires_at <= CURRENT_TIMESTAMP - make_interval(days => %s)',
+        'apply': 'DELETE FROM idempotency_keys WHERE idem_key = ANY(%s)'
+    },
+    # Бакет, не менявшийся дольше времени полного пополнения, равен новому - удаление ничего не меняет
+    'purgeIdleRateLimitBuckets': {
+        'days': 1,
+        'table': 'rate_limit_buckets',
+        'key': 'bucket_key',
+        'where': 'updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)',
+        'apply': 'DELETE FROM rate_limit_buckets WHERE bucket_key = ANY(%s)'
+    }
+}
+
+
+def _count(cur, policy: Dict[str, Any], days: int) -> Dict[str, Any]:
+    cur.execute(f"SELECT COUNT(*) AS count FROM {policy['table']} WHERE {policy['where']}", (days,))
+    matched = cur.fetchone()['count']
+    cur.execute(
+        f"SELECT {policy['key']} AS key FROM {policy['table']} WHERE {policy['where']} "
+        f"ORDER BY {policy['key']} LIMIT %s",
+        (days, DRY_RUN_SAMPLE_SIZE)
+    )
+    return {'days': days, 'matched': matched, 'sample': [row['key'] for row in cur.fetchall()]}
+
+
+def _apply(cur, conn, policy: Dict[str, Any], days: int, batch_size: int, deadline: float) -> Dict[str, Any]:
+    '''
+    Пачки по batch_size с фиксацией после каждой. Строки, заблокированные рабочими
+    запросами, пропускаются (SKIP LOCKED), прочие ожидания ограничены lock_timeout
+    '''
+    select_batch = (
+        f"SELECT {policy['key']} AS key FROM {policy['table']} WHERE {policy['where']} "
+        f"ORDER BY {policy['key']} LIMIT %s FOR UPDATE SKIP LOCKED"
+    )
+    affected = 0
+    batches = 0
+    complete = False
+    error: Optional[str] = None
+
+    while time.monotonic() < deadline:
+        try:
+            cur.execute(f"SET LOCAL lock_timeout = '{RETENTION_LOCK_TIMEOUT}'")
+            cur.execute(select_batch, (days, batch_size))
+            keys = [row['key'] for row in cur.fetchall()]
+            if keys:
+                cur.execute(policy['apply'], (keys,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            error = str(e)
+            break
+
+        affected += len(keys)
+        batches += 1 if keys else 0
+        if len(keys) < batch_size:
+            complete = True
+            break
+        time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+
+    result = {'days': days, 'affected': affected, 'batches': batches, 'complete': complete}
+    if error:
+        result['error'] = error
+    return result
+
+
+def run_retention(cur, conn, dry_run: bool = True, policies: Optional[List[str]] = None,
+                  days: Optional[Dict[str, int]] = None, batch_size: int = RETENTION_BATCH_SIZE) -> Dict[str, Any]:
+    '''
+    Прогон политик хранения; dry_run только считает подходящие строки
+    Args: policies - имена политик (по умолчанию все), days - переопределение сроков по имени
+    Returns: {'dryRun': bool, 'policies': {имя: результат}}
+    '''
+    names = policies or list(RETENTION_POLICIES)
+    unknown = [name for name in names if name not in RETENTION_POLICIES]
+    if unknown:
+        raise ValueError(f"unknown retention policies: {', '.join(unknown)}")
+
+    if days is not None and not isinstance(days, dict):
+        raise ValueError('days must be an object of policy name to days')
+    policy_days = {name: (days or {}).get(name, RETENTION_POLICIES[name]['days']) for name in names}
+    invalid = [name for name, value in policy_days.items()
+               if not isinstance(value, int) or isinstance(value, bool) or value < 0]
+    if invalid:
+        raise ValueError(f"days must be non-negative integers: {', '.join(invalid)}")
+
+    deadline = time.monotonic() + RETENTION_TIME_BUDGET_SECONDS
+    results = {}
+    for name in names:
+        policy = RETENTION_POLICIES[name]
+        if dry_run:
+            results[name] = _count(cur, policy, policy_days[name])
+        else:
+            results[name] = _apply(cur, conn, policy, policy_days[name], batch_size, deadline)
+    if dry_run:
+        conn.rollback()
+    return {'dryRun': dry_run, 'policies': results}
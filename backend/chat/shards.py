@@ -0,0 +1,204 @@
+import os
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from db import get_connection, release_connection
+from queries import QUERIES, READ_ACTIONS, read_action_payload, read_action_query, run_query, run_read_action
+from tracing import span
+
+# Данные чатов по шардам: каждый шард - полная схема (все миграции), на шарде живут клиенты
+# своей доли IP, их чаты, сообщения и оценки. Справочники (сотрудники, смены, база знаний,
+# присутствие) остаются в DATABASE_URL, он может быть и одним из шардов.
+# concurrent.futures, asyncio и async_db импортируются только при чтении со всех шардов:
+# без шардов их импорт - лишнее время холодного старта
+SHARD_URLS_ENV = 'DATABASE_SHARD_URLS'
+
+# Действия над одним чатом: шард по chatId из тела или параметров запроса
+CHAT_ACTIONS = {'messages', 'sendMessage', 'updateStatus', 'extendChat', 'submitClientRating',
+                'createRating', 'archiveQcRating'}
+# Действия клиента: шард по ipAddress
+CLIENT_ACTIONS = {'startChat'}
+
+# Таблицы, чьи id выдаются шардом с шагом N и остатком, равным номеру шарда:
+# id уникальны между шардами, а шард чата вычисляется по самому chat_id
+STRIDED_TABLES = ('clients', 'chats', 'messages', 'ratings', 'client_ratings', 'qc_archive')
+
+# Списки шардов, чьи последовательности уже проверены этим инстансом
+_verified: set = set()
+
+
+def parse_shard_urls() -> List[str]:
+    '''
+    DSN шардов из DATABASE_SHARD_URLS через запятую; порядок задаёт номера шардов и менять его нельзя
+    '''
+    return [url.strip() for url in os.environ.get(SHARD_URLS_ENV, '').split(',') if url.strip()]
+
+
+def shard_urls() -> List[str]:
+    '''
+    Шарды из DATABASE_SHARD_URLS; при первом обращении инстанса - с проверкой verify_shards
+    Returns: пустой список, если шардирование не включено
+    Raises: RuntimeError, если шарды не настроены configure_shard
+    '''
+    urls = parse_shard_urls()
+    if urls and tuple(urls) not in _verified:
+        verify_shards(urls)
+        _verified.add(tuple(urls))
+    return urls
+
+
+def chat_shard(chat_id: int, count: int) -> int:
+    return chat_id % count
+
+
+def client_shard(ip_address: str, count: int) -> int:
+    import zlib
+
+    return zlib.crc32(ip_address.encode('utf-8')) % count
+
+
+def request_shard_url(action: str, data: Dict[str, Any], urls: List[str]) -> Optional[str]:
+    '''
+    Шард для действия над одним чатом или клиентом
+    Args: data - тело POST/PUT или параметры GET
+    Returns: DSN шарда или None - действие идёт в DATABASE_URL либо по всем шардам
+    '''
+    if not urls:
+        return None
+    if action in CLIENT_ACTIONS and data.get('ipAddress'):
+        return urls[client_shard(str(data['ipAddress']), len(urls))]
+    if action in CHAT_ACTIONS:
+        try:
+            return urls[chat_shard(int(data.get('chatId')), len(urls))]
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def configure_shard(cur, index: int, count: int) -> None:
+    '''
+    Однократная настройка шарда после миграций: последовательности STRIDED_TABLES
+    продолжают выдачу с шагом count и остатком index по модулю count
+    '''
+    for table in STRIDED_TABLES:
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id') AS seq", (table,))
+        sequence = cur.fetchone()['seq']
+        cur.execute(f'SELECT COALESCE(MAX(id), 0) AS max_id FROM {table}')
+        max_id = cur.fetchone()['max_id']
+        start = max_id + 1 + (index - max_id - 1) % count
+        cur.execute(f'ALTER SEQUENCE {sequence} INCREMENT BY {int(count)} RESTART WITH {int(start)}')
+
+
+def verify_shards(urls: List[str]) -> None:
+    '''
+    Отказ шардировать без configure_shard: иначе id чатов разных шардов совпадают,
+    и chat_id % N ведёт не на тот шард. Проверяется шаг и остаток последовательностей STRIDED_TABLES;
+    отдельное соединение - проверка не трогает соединения вызова
+    Raises: RuntimeError со списком ненастроенных шардов
+    '''
+    misconfigured = []
+    for index, url in enumerate(urls):
+        conn = psycopg2.connect(url)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                for table in STRIDED_TABLES:
+                    cur.execute("SELECT pg_get_serial_sequence(%s, 'id') AS seq", (table,))
+                    sequence = cur.fetchone()['seq']
+                    cur.execute(f'''
+                        SELECT last_value, (SELECT seqincrement FROM pg_sequence WHERE seqrelid = %s::regclass) AS step
+                        FROM {sequence}
+                    ''', (sequence,))
+                    row = cur.fetchone()
+                    if row['step'] != len(urls) or row['last_value'] % len(urls) != index:
+                        misconfigured.append(f'{index}:{table}')
+        finally:
+            conn.close()
+    if misconfigured:
+        raise RuntimeError(f"{SHARD_URLS_ENV} is set but shard sequences are not strided ({', '.join(misconfigured)}); "
+                           f"run backend/configure_shards.py before enabling sharding")
+
+
+@contextmanager
+def shard_cursors(urls: List[str], request_conn) -> Iterator[List[Any]]:
+    '''
+    Курсоры на соединениях из пула по списку DSN. Соединение текущего вызова не освобождается:
+    его транзакцию завершает сам вызов; остальные после выхода откатываются, фиксировать нужно явно
+    '''
+    conns = [get_connection(url) for url in urls]
+    cursors = [conn.cursor(cursor_factory=RealDictCursor) for conn in conns]
+    try:
+        yield cursors
+    finally:
+        for cur in cursors:
+            cur.close()
+        for conn in {id(conn): conn for conn in conns}.values():
+            if conn is not request_conn:
+                release_connection(conn)
+
+
+def _shard_rows(index: int, url: str, name: str, args: tuple) -> list:
+    # Своё соединение потока на номер шарда: DSN шарда может совпадать с соединением
+    # текущего вызова, которое нельзя ни использовать параллельно, ни откатывать посреди вызова
+    conn = get_connection(url, slot=f'scatter{index}')
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        run_query(cur, name, args)
+        return cur.fetchall()
+    finally:
+        cur.close()
+        release_connection(conn)
+
+
+def scatter_read_action(action: str, params: Dict[str, Any], urls: List[str]) -> Dict[str, Any]:
+    '''
+    Чтение со всех шардов параллельно: ответы уже отсортированы каждым шардом,
+    слияние по ключу merge сохраняет общий порядок по убыванию.
+    Постраничное чтение берёт с каждого шарда страницу + 1 и обрезает слияние до того же размера,
+    поэтому курсор последней строки годится для следующего запроса ко всем шардам
+    '''
+    import heapq
+    from concurrent.futures import ThreadPoolExecutor
+
+    spec = READ_ACTIONS[action]
+    name, args = read_action_query(action, params)
+    # Потоки не наследуют контекст трассы: запросы шардов видны одним интервалом scatter
+    with span('scatter', query=name, shards=len(urls)), ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        results = list(pool.map(lambda shard: _shard_rows(*shard, name, args), enumerate(urls)))
+
+    rows = list(heapq.merge(*results, key=spec['merge'], reverse=True))
+    if 'page' in spec:
+        rows = rows[:spec['page'](params) + 1]
+    return read_action_payload(action, rows, params)
+
+
+def run_sharded_read_action(cur, action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Чтение из READ_ACTIONS: по всем шардам для действий с merge, иначе на соединении вызова
+    '''
+    urls = shard_urls()
+    if urls and 'merge' in READ_ACTIONS[action]:
+        return scatter_read_action(action, params, urls)
+    return run_read_action(cur, action, params)
+
+
+async def scatter_read_action_async(action: str, params: Dict[str, Any], urls: List[str]) -> Dict[str, Any]:
+    '''
+    scatter_read_action на пулах asyncpg: запросы ко всем шардам идут одновременно в цикле событий
+    '''
+    import asyncio
+    import heapq
+    from async_db import fetch, get_pool
+
+    spec = READ_ACTIONS[action]
+    name, args = read_action_query(action, params)
+    with span('scatter', query=name, shards=len(urls)):
+        pools = await asyncio.gather(*(get_pool(url) for url in urls))
+        results = await asyncio.gather(*(fetch(pool, QUERIES[name], args) for pool in pools))
+
+    rows = list(heapq.merge(*results, key=spec['merge'], reverse=True))
+    if 'page' in spec:
+        rows = rows[:spec['page'](params) + 1]
+    return read_action_payload(action, rows, params)
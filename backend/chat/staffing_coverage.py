@@ -0,0 +1,137 @@
+from datetime import datetime, date, time, timedelta
+from typing import Dict, Any, List, Optional
+import numpy as np
+
+SLOT_MINUTES = 15
+ARRIVALS_LOOKBACK_WEEKS = 4
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_date(value: Optional[str], default: date) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else default
+
+
+def _minutes(value: Any) -> int:
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def staffing_counts(shifts: List[Dict[str, Any]], range_start: datetime, slot_count: int,
+                    slot_minutes: int = SLOT_MINUTES) -> np.ndarray:
+    '''
+    Количество сотрудников на смене в начале каждого слота
+    Смены переводятся в интервалы [start, end) в минутах от начала диапазона,
+    ночные смены (end <= start) переносятся на следующие сутки, затем
+    разностный массив и cumsum дают покрытие без цикла по слотам
+    '''
+    if not shifts:
+        return np.zeros(slot_count, dtype=np.int32)
+
+    day_offsets = np.fromiter(((s['shift_date'] - range_start.date()).days for s in shifts),
+                              dtype=np.int64, count=len(shifts))
+    starts = np.fromiter((_minutes(s['start_time']) for s in shifts), dtype=np.int64, count=len(shifts))
+    ends = np.fromiter((_minutes(s['end_time']) for s in shifts), dtype=np.int64, count=len(shifts))
+    ends = np.where(ends <= starts, ends + MINUTES_PER_DAY, ends)
+
+    base = day_offsets * MINUTES_PER_DAY
+    start_slots = np.clip(-(-(base + starts) // slot_minutes), 0, slot_count)
+    end_slots = np.clip(-(-(base + ends) // slot_minutes), 0, slot_count)
+
+    diff = np.zeros(slot_count + 1, dtype=np.int32)
+    np.add.at(diff, start_slots, 1)
+    np.add.at(diff, end_slots, -1)
+    return np.cumsum(diff[:-1], dtype=np.int32)
+
+
+def load_shifts(cur, date_from: date, date_to: date) -> List[Dict[str, Any]]:
+    '''
+    Смены диапазона плюс предыдущий день, чтобы учесть ночные смены
+    '''
+    cur.execute('''
+        SELECT employee_name, shift_date, start_time, end_time
+        FROM shifts
+        WHERE shift_date BETWEEN %s AND %s
+    ''', (date_from - timedelta(days=1), date_to))
+    return cur.fetchall()
+
+
+def arrivals_by_slot(cur, start: datetime, end: datetime, slot_minutes: int = SLOT_MINUTES) -> np.ndarray:
+    '''
+    Число новых чатов по слотам [start, end); группировка на стороне БД
+    '''
+    slot_count = max(0, int((end - start).total_seconds() // 60 // slot_minutes))
+    cur.execute('''
+        SELECT floor(extract(epoch FROM created_at - %s) / %s)::int AS slot, COUNT(*) AS count
+        FROM chats
+        WHERE created_at >= %s AND created_at < %s
+        GROUP BY 1
+    ''', (start, slot_minutes * 60, start, end))
+    rows = cur.fetchall()
+
+    counts = np.zeros(slot_count, dtype=np.int64)
+    if rows:
+        slots = np.array([r['slot'] for r in rows], dtype=np.int64)
+        values = np.array([r['count'] for r in rows], dtype=np.int64)
+        mask = (slots >= 0) & (slots < slot_count)
+        counts[slots[mask]] = values[mask]
+    return counts
+
+
+def weekly_profile(counts: np.ndarray, start: datetime, slot_minutes: int = SLOT_MINUTES) -> np.ndarray:
+    '''
+    Средние поступления по (день недели, слот суток) - матрица 7 x slots_per_day
+    '''
+    slots_per_day = MINUTES_PER_DAY // slot_minutes
+    index = np.arange(counts.size)
+    weekday = (start.weekday() + index // slots_per_day) % 7
+    key = weekday * slots_per_day + index % slots_per_day
+    totals = np.bincount(key, weights=counts, minlength=7 * slots_per_day)
+    samples = np.bincount(key, minlength=7 * slots_per_day)
+    return (totals / np.maximum(samples, 1)).reshape(7, slots_per_day)
+
+
+def compute_coverage(cur, date_from: date, date_to: date, slot_minutes: int = SLOT_MINUTES,
+                     lookback_weeks: int = ARRIVALS_LOOKBACK_WEEKS) -> Dict[str, Any]:
+    '''
+    Покрытие сменами по слотам диапазона [date_from, date_to] в сравнении
+    с ожидаемыми (средние за lookback_weeks недель до диапазона) и фактическими поступлениями чатов
+    '''
+    range_start = datetime.combine(date_from, time.min)
+    range_end = datetime.combine(date_to + timedelta(days=1), time.min)
+    slot_count = int((range_end - range_start).total_seconds() // 60 // slot_minutes)
+    slots_per_day = MINUTES_PER_DAY // slot_minutes
+
+    staff = staffing_counts(load_shifts(cur, date_from, date_to), range_start, slot_count, slot_minutes)
+
+    history_start = range_start - timedelta(weeks=lookback_weeks)
+    profile = weekly_profile(arrivals_by_slot(cur, history_start, range_start, slot_minutes),
+                             history_start, slot_minutes)
+    index = np.arange(slot_count)
+    expected = profile[(range_start.weekday() + index // slots_per_day) % 7, index % slots_per_day]
+
+    actual = arrivals_by_slot(cur, range_start, min(range_end, datetime.utcnow()), slot_minutes)
+    actual = np.pad(actual, (0, slot_count - actual.size))
+
+    gap_slots = np.flatnonzero((expected > 0) & (staff == 0))
+    slot_delta = timedelta(minutes=slot_minutes)
+
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'intervalMinutes': slot_minutes,
+        'lookbackWeeks': lookback_weeks,
+        'slotStarts': [(range_start + slot_delta * int(i)).isoformat() for i in index],
+        'staff': staff.tolist(),
+        'expectedArrivals': np.round(expected, 3).tolist(),
+        'actualArrivals': actual.tolist(),
+        'arrivalsPerOperator': np.round(expected / np.maximum(staff, 1), 3).tolist(),
+        'gaps': [
+            {
+                'slotStart': (range_start + slot_delta * int(i)).isoformat(),
+                'expectedArrivals': round(float(expected[i]), 3)
+            }
+            for i in gap_slots
+        ]
+    }
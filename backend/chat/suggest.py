@@ -0,0 +1,232 @@
+import re
+import time
+from bisect import bisect_left, insort
+from typing import Dict, Any, List, Optional, Tuple
+
+SUGGEST_TTL_SECONDS = 300
+VERSION_CHECK_INTERVAL_SECONDS = 2
+SUGGEST_CACHE_NAME = 'suggest'
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+# Префиксы слов длиннее индексируются по первым MAX_PREFIX_LENGTH символам и дофильтровываются
+MAX_PREFIX_LENGTH = 12
+
+# Ранги совпадения префикса: начало заголовка, другое слово заголовка, слово категории
+TIER_TITLE_START = 0
+TIER_TITLE = 1
+TIER_CATEGORY = 2
+
+# Запрос из нескольких слов ранжирует пересечение напрямую, если оно не больше этого числа,
+# иначе просматривает список первого слова
+DIRECT_RANK_MAX_CANDIDATES = 256
+
+_WORD = re.compile(r'\w+')
+
+# postings: префикс -> отсортированный список (ранг, -просмотры, длина заголовка, тип, id);
+# первые записи списка - лучшие подсказки для запроса из одного слова.
+# keys: префикс -> множество (тип, id) для пересечения слов запроса
+_suggest: Dict[str, Any] = {
+    'version': None,
+    'loaded_at': 0.0,
+    'checked_at': 0.0,
+    'docs': {},
+    'postings': {},
+    'keys': {}
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall((text or '').lower().replace('ё', 'е'))
+
+
+def _prefix_tiers(doc: Dict[str, Any]) -> Dict[str, int]:
+    tiers: Dict[str, int] = {}
+    words = [(word, TIER_TITLE_START if i == 0 else TIER_TITLE) for i, word in enumerate(doc['title_words'])]
+    words += [(word, TIER_CATEGORY) for word in doc['category_words']]
+    for word, tier in words:
+        for length in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1):
+            prefix = word[:length]
+            if tiers.get(prefix, TIER_CATEGORY + 1) > tier:
+                tiers[prefix] = tier
+    return tiers
+
+
+def _make_doc(doc_type: str, doc_id: int, title: str, category: str, views: int = 0) -> Dict[str, Any]:
+    doc = {
+        'key': (doc_type, doc_id),
+        'title': title or '',
+        'category': category or '',
+        'views': views or 0,
+        'title_words': tokenize(title),
+        'category_words': tokenize(category)
+    }
+    doc['words'] = doc['title_words'] + doc['category_words']
+    doc['tiers'] = _prefix_tiers(doc)
+    doc['rank'] = (-doc['views'], len(doc['title']), doc_type, doc_id)
+    return doc
+
+
+def _add(doc: Dict[str, Any]) -> None:
+    _suggest['docs'][doc['key']] = doc
+    postings, keys = _suggest['postings'], _suggest['keys']
+    for prefix, tier in doc['tiers'].items():
+        insort(postings.setdefault(prefix, []), (tier, *doc['rank']))
+        keys.setdefault(prefix, set()).add(doc['key'])
+
+
+def _remove(doc_type: str, doc_id: int) -> None:
+    doc = _suggest['docs'].pop((doc_type, doc_id), None)
+    if doc is None:
+        return
+    postings, keys = _suggest['postings'], _suggest['keys']
+    for prefix, tier in doc['tiers'].items():
+        entries = postings.get(prefix, [])
+        entry = (tier, *doc['rank'])
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+        keys.get(prefix, set()).discard(doc['key'])
+        if not entries:
+            postings.pop(prefix, None)
+            keys.pop(prefix, None)
+
+
+def _current_version(cur) -> int:
+    cur.execute('''
+        SELECT version FROM cache_versions WHERE name = %s
+    ''', (SUGGEST_CACHE_NAME,))
+    row = cur.fetchone()
+    return row['version'] if row else 0
+
+
+def _load(cur, version: int) -> None:
+    cur.execute('''
+        SELECT 'article' AS type, id, title, category, COALESCE(views, 0) AS views FROM knowledge_articles
+        UNION ALL
+        SELECT 'template', id, title, category, 0 FROM jira_templates
+    ''')
+    docs = [_make_doc(row['type'], row['id'], row['title'], row['category'], row['views']) for row in cur.fetchall()]
+
+    postings: Dict[str, list] = {}
+    keys: Dict[str, set] = {}
+    for doc in docs:
+        for prefix, tier in doc['tiers'].items():
+            postings.setdefault(prefix, []).append((tier, *doc['rank']))
+            keys.setdefault(prefix, set()).add(doc['key'])
+    for entries in postings.values():
+        entries.sort()
+
+    now = time.monotonic()
+    _suggest.update({
+        'version': version,
+        'loaded_at': now,
+        'checked_at': now,
+        'docs': {doc['key']: doc for doc in docs},
+        'postings': postings,
+        'keys': keys
+    })
+
+
+def _ensure_fresh(cur) -> None:
+    '''
+    Построение индекса при первом обращении, перестроение при смене версии в cache_versions
+    (изменение на другом инстансе) или по TTL - для свежих просмотров статей.
+    Версия проверяется не чаще раза в VERSION_CHECK_INTERVAL_SECONDS
+    '''
+    now = time.monotonic()
+    if _suggest['version'] is not None and now - _suggest['checked_at'] < VERSION_CHECK_INTERVAL_SECONDS:
+        return
+
+    version = _current_version(cur)
+    if version == _suggest['version'] and now - _suggest['loaded_at'] < SUGGEST_TTL_SECONDS:
+        _suggest['checked_at'] = now
+        return
+
+    _load(cur, version)
+
+
+def suggest(cur, query: str, limit: int = SUGGEST_LIMIT, types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    '''
+    Подсказки по началу слов заголовка и категории; каждое слово запроса должно совпасть
+    с началом какого-либо слова. Порядок - по рангу первого слова запроса, затем по просмотрам
+    Returns: [{'type': 'article'|'template', 'id', 'title', 'category'}]
+    '''
+    _ensure_fresh(cur)
+    words = tokenize(query)
+    if not words:
+        return []
+
+    docs, keys = _suggest['docs'], _suggest['keys']
+    first = words[0][:MAX_PREFIX_LENGTH]
+    long_words = [word for word in words if len(word) > MAX_PREFIX_LENGTH]
+
+    def matches(doc: Dict[str, Any]) -> bool:
+        if types and doc['key'][0] not in types:
+            return False
+        return all(any(w.startswith(word) for w in doc['words']) for word in long_words)
+
+    candidates = None
+    if len(words) > 1:
+        sets = sorted((keys.get(word[:MAX_PREFIX_LENGTH], set()) for word in words), key=len)
+        candidates = sets[0].intersection(*sets[1:])
+        if len(candidates) <= DIRECT_RANK_MAX_CANDIDATES:
+            found = [doc for doc in (docs[key] for key in candidates) if matches(doc)]
+            found.sort(key=lambda doc: (doc['tiers'][first], doc['rank']))
+            return [_suggestion(doc) for doc in found[:limit]]
+
+    results = []
+    for _, _, _, doc_type, doc_id in _suggest['postings'].get(first, ()):
+        key = (doc_type, doc_id)
+        if candidates is not None and key not in candidates:
+            continue
+        doc = docs[key]
+        if not matches(doc):
+            continue
+        results.append(_suggestion(doc))
+        if len(results) >= limit:
+            break
+    return results
+
+
+def _suggestion(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {'type': doc['key'][0], 'id': doc['key'][1], 'title': doc['title'], 'category': doc['category']}
+
+
+def touch_suggest(cur) -> Tuple[Optional[int], int]:
+    '''
+    Новая версия индекса подсказок в текущей транзакции, вызывать до conn.commit().
+    Строка версии блокируется до фиксации, так что изменения разных инстансов упорядочены
+    Returns: (предыдущая версия, новая версия) для update_suggest после фиксации
+    '''
+    cur.execute('''
+        WITH previous AS (
+            SELECT version FROM cache_versions WHERE name = %s FOR UPDATE
+        )
+        INSERT INTO cache_versions (name, version, updated_at)
+        VALUES (%s, nextval('cache_versions_seq'), CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE
+        SET version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP
+        RETURNING version, (SELECT version FROM previous) AS previous
+    ''', (SUGGEST_CACHE_NAME, SUGGEST_CACHE_NAME))
+    row = cur.fetchone()
+    return row['previous'] or 0, row['version']
+
+
+def update_suggest(versions: Tuple[Optional[int], int], doc_type: str, doc_id: int,
+                   title: Optional[str] = None, category: Optional[str] = None) -> None:
+    '''
+    Изменение одного документа в индексе инстанса после фиксации; title=None - удаление.
+    Если индекс ещё не построен, пропустил чужое изменение (версия не совпала) - он будет перестроен
+    '''
+    previous, version = versions
+    if _suggest['version'] is None:
+        return
+    if _suggest['version'] != previous:
+        _suggest['version'] = None
+        return
+
+    old = _suggest['docs'].get((doc_type, int(doc_id)))
+    _remove(doc_type, int(doc_id))
+    if title is not None:
+        _add(_make_doc(doc_type, int(doc_id), title, category, old['views'] if old else 0))
+    _suggest['version'] = version
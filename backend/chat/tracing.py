@@ -0,0 +1,190 @@
+import contextvars
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+
+def _env_float(name: str, default: float) -> float:
+    '''
+    Ошибка в переменной окружения не должна ронять импорт функции: она логируется,
+    и действует значение по умолчанию
+    '''
+    value = os.environ.get(name, '')
+    if not value:
+        return default
+    try:
+        result = float(value)
+    except ValueError:
+        result = None
+    if result is None or not math.isfinite(result):
+        print(f'{name} ignored: {value!r} is not a number', file=sys.stderr)
+        return default
+    return result
+
+
+# Экспорт: stdout или file (строка JSON на трассу в TRACE_FILE); пусто - трассировка выключена
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', '')
+TRACE_FILE = os.environ.get('TRACE_FILE', '/tmp/chat-traces.jsonl')
+# Доля трасс, экспортируемых всегда (по trace id, детерминированно)
+TRACE_SAMPLE_RATE = _env_float('TRACE_SAMPLE_RATE', 0.0)
+# Трассы медленнее порога экспортируются независимо от доли - разбор хвоста задержек
+TRACE_SLOW_MS = _env_float('TRACE_SLOW_MS', 0.0)
+
+_trace: contextvars.ContextVar = contextvars.ContextVar('trace', default=None)
+_parent: contextvars.ContextVar = contextvars.ContextVar('span_parent', default=None)
+
+
+def _stdout_exporter(trace: Dict[str, Any]) -> None:
+    print(json.dumps(trace, ensure_ascii=False, default=str), file=sys.stdout, flush=True)
+
+
+def _file_exporter(trace: Dict[str, Any]) -> None:
+    with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(trace, ensure_ascii=False, default=str) + '\n')
+
+
+EXPORTERS: Dict[str, Callable[[Dict[str, Any]], None]] = {
+    'stdout': _stdout_exporter,
+    'file': _file_exporter
+}
+
+
+def register_exporter(name: str, exporter: Callable[[Dict[str, Any]], None]) -> None:
+    '''
+    Свой экспортёр трасс; включается TRACE_EXPORTER=<name>
+    '''
+    EXPORTERS[name] = exporter
+
+
+def tracing_enabled() -> bool:
+    return TRACE_EXPORTER in EXPORTERS and (TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_MS > 0)
+
+
+def is_sampled(trace_id: str) -> bool:
+    import zlib
+
+    return zlib.crc32(trace_id.encode('utf-8')) % 10000 < TRACE_SAMPLE_RATE * 10000
+
+
+class Span:
+    '''
+    Интервал внутри трассы; вне трассы не создаётся - span() возвращает пустой NOOP_SPAN
+    '''
+    __slots__ = ('trace', 'record', 'started', 'token')
+
+    def __init__(self, trace: Dict[str, Any], name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.record = {'spanId': os.urandom(8).hex(), 'parentId': _parent.get(), 'name': name, 'attrs': attrs}
+
+    def set(self, **attrs: Any) -> None:
+        self.record['attrs'].update(attrs)
+
+    def __enter__(self) -> 'Span':
+        self.record['startMs'] = round((time.perf_counter() - self.trace['started']) * 1000, 3)
+        self.started = time.perf_counter()
+        self.token = _parent.set(self.record['spanId'])
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _parent.reset(self.token)
+        self.record['durationMs'] = round((time.perf_counter() - self.started) * 1000, 3)
+        if exc_type is not None:
+            self.record['attrs']['error'] = exc_type.__name__
+        self.trace['spans'].append(self.record)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attrs: Any):
+    '''
+    with span('db.query', query=name): ... - интервал в текущей трассе, без трассы ничего не стоит
+    '''
+    trace = _trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return Span(trace, name, attrs)
+
+
+class Trace:
+    '''
+    Корень трассы вызова: trace id - request_id из context платформы.
+    Экспорт по окончании, если трасса попала в выборку или медленнее TRACE_SLOW_MS
+    '''
+    __slots__ = ('trace', 'root', 'token')
+
+    def __init__(self, context: Any, name: str, **attrs: Any):
+        trace_id = getattr(context, 'request_id', None) or os.urandom(16).hex()
+        self.trace = {'traceId': trace_id, 'started': 0.0, 'spans': [], 'attrs': attrs}
+        self.root = Span(self.trace, name, attrs)
+
+    def set(self, **attrs: Any) -> None:
+        self.root.set(**attrs)
+
+    def __enter__(self) -> 'Trace':
+        self.trace['started'] = time.perf_counter()
+        self.trace['wallStart'] = time.time()
+        self.token = _trace.set(self.trace)
+        self.root.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.root.__exit__(exc_type, exc, tb)
+        _trace.reset(self.token)
+        export_trace(self.trace, self.root.record)
+
+
+def start_trace(context: Any, name: str, **attrs: Any):
+    '''
+    with start_trace(context, 'chat', method=...): ... - корень трассы вызова или NOOP_SPAN, если выключено
+    '''
+    if not tracing_enabled() or _trace.get() is not None:
+        return NOOP_SPAN
+    return Trace(context, name, **attrs)
+
+
+def export_trace(trace: Dict[str, Any], root: Dict[str, Any]) -> None:
+    if not (is_sampled(trace['traceId']) or (TRACE_SLOW_MS > 0 and root['durationMs'] >= TRACE_SLOW_MS)):
+        return
+    spans: List[Dict[str, Any]] = sorted(trace['spans'], key=lambda s: s['startMs'])
+    try:
+        EXPORTERS[TRACE_EXPORTER]({
+            'traceId': trace['traceId'],
+            'name': root['name'],
+            'start': trace['wallStart'],
+            'durationMs': root['durationMs'],
+            'attrs': root['attrs'],
+            'spans': spans
+        })
+    except Exception as e:
+        print(f'trace export failed: {e}', file=sys.stderr)
+
+
+def annotate(**attrs: Any) -> None:
+    '''
+    Атрибуты корня текущей трассы (действие, статус), известные только внутри обработки
+    '''
+    trace = _trace.get()
+    if trace is not None:
+        trace['attrs'].update(attrs)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace['traceId'] if trace else None
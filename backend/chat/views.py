@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+from typing import Dict, Any, Optional
+
+import psycopg2
+
+# Просмотры копятся в памяти инстанса и пишутся в knowledge_article_views одной вставкой
+# в конце первого вызова функции после VIEW_BUFFER_SECONDS; 0 - каждый просмотр сразу.
+# На платформе инстанс без вызовов замораживается и уничтожается вместе с буфером, поэтому
+# по умолчанию буфера нет; standalone-сервер (backend/server.py) пишет буфер при остановке,
+# и для него имеет смысл VIEW_BUFFER_SECONDS=5
+VIEW_BUFFER_SECONDS = float(os.environ.get('VIEW_BUFFER_SECONDS', '0'))
+VIEW_BUFFER_MAX_ARTICLES = 1000
+# Сброс журнала в knowledge_articles.views не чаще раза в интервал на инстанс
+VIEW_FLUSH_INTERVAL_SECONDS = 60
+VIEW_FLUSH_BATCH_SIZE = 5000
+VIEW_FLUSH_MAX_BATCHES = 20
+# Один сбрасывающий на всю БД: параллельные UPDATE одних статей в разном порядке дают deadlock
+VIEW_FLUSH_LOCK_KEY = 'knowledge_article_views_flush'
+INT4_MAX = 2 ** 31 - 1
+KNOWN_ARTICLES_MAX = 10000
+
+_pending: Dict[int, int] = {}
+# Статьи, существование которых уже проверено; статьи не удаляются, так что кэш не устаревает
+_known_articles: set = set()
+_buffer = {'since': 0.0}
+_last_flush = {'at': 0.0}
+
+
+def _is_int4(value: int) -> bool:
+    return 0 < value <= INT4_MAX
+
+
+def article_exists(cur, article_id: int) -> bool:
+    '''
+    Проверка id статьи до буферизации: несуществующие и вне диапазона INTEGER в буфер не попадают
+    '''
+    if not _is_int4(article_id):
+        return False
+    if article_id in _known_articles:
+        return True
+    cur.execute('SELECT 1 FROM knowledge_articles WHERE id = %s', (article_id,))
+    if not cur.fetchone():
+        return False
+    if len(_known_articles) >= KNOWN_ARTICLES_MAX:
+        _known_articles.clear()
+    _known_articles.add(article_id)
+    return True
+
+
+def track_view(cur, conn, article_id: int, now: Optional[float] = None) -> None:
+    '''
+    Учёт просмотра статьи без обращения к строке статьи: в буфер инстанса,
+    при его заполнении или по времени - в журнал; по интервалу заодно сброс журнала
+    '''
+    now = now if now is not None else time.monotonic()
+    if not _pending:
+        _buffer['since'] = now
+    _pending[article_id] = _pending.get(article_id, 0) + 1
+
+    if now - _buffer['since'] >= VIEW_BUFFER_SECONDS or len(_pending) >= VIEW_BUFFER_MAX_ARTICLES:
+        write_pending_views(cur, conn)
+    if now - _last_flush['at'] >= VIEW_FLUSH_INTERVAL_SECONDS:
+        _last_flush['at'] = now
+        flush_views(cur, conn)
+
+
+def write_due_views(cur, conn, now: Optional[float] = None) -> int:
+    '''
+    Запись буфера в конце любого вызова, если он старше VIEW_BUFFER_SECONDS
+    Returns: число записанных просмотров
+    '''
+    if not _pending:
+        return 0
+    now = now if now is not None else time.monotonic()
+    if now - _buffer['since'] < VIEW_BUFFER_SECONDS:
+        return 0
+    return write_pending_views(cur, conn)
+
+
+def write_pending_views(cur, conn) -> int:
+    '''
+    Буфер инстанса в журнал одной вставкой; при ошибке соединения просмотры возвращаются в буфер.
+    Ошибка данных повторится при каждой попытке, поэтому такие записи отбрасываются:
+    вне диапазона INTEGER - по отдельности, а если виновную не найти - вся пачка
+    Returns: число записанных просмотров
+    '''
+    if not _pending:
+        return 0
+    pending = dict(_pending)
+    _pending.clear()
+    try:
+        cur.execute('''
+            INSERT INTO knowledge_article_views (article_id, views)
+            SELECT * FROM unnest(%s::int[], %s::int[])
+        ''', (list(pending), list(pending.values())))
+        conn.commit()
+    except psycopg2.DataError as e:
+        conn.rollback()
+        valid = {a: c for a, c in pending.items() if _is_int4(a) and _is_int4(c)}
+        if len(valid) == len(pending):
+            valid = {}
+        print(f'knowledge views dropped: {len(pending) - len(valid)} articles, {e}', file=sys.stderr)
+        for article_id, count in valid.items():
+            _pending[article_id] = _pending.get(article_id, 0) + count
+        return 0
+    except Exception:
+        conn.rollback()
+        for article_id, count in pending.items():
+            _pending[article_id] = _pending.get(article_id, 0) + count
+        raise
+    return sum(pending.values())
+
+
+def flush_views(cur, conn, batch_size: int = VIEW_FLUSH_BATCH_SIZE) -> Dict[str, Any]:
+    '''
+    Журнал просмотров в knowledge_articles.views пачками: строки пачки удаляются
+    и суммируются по статье в той же транзакции, каждая пачка фиксируется отдельно.
+    Если сброс уже идёт в другом вызове, ничего не делает
+    Returns: {'flushed': строк журнала, 'articles': обновлено статей, 'skipped': занят ли сброс}
+    '''
+    flushed, articles = 0, 0
+    for _ in range(VIEW_FLUSH_MAX_BATCHES):
+        cur.execute('SELECT pg_try_advisory_xact_lock(hashtext(%s)) AS locked', (VIEW_FLUSH_LOCK_KEY,))
+        if not cur.fetchone()['locked']:
+            conn.rollback()
+            return {'flushed': flushed, 'articles': articles, 'skipped': True}
+
+        cur.execute('''
+            WITH batch AS (
+                DELETE FROM knowledge_article_views
+                WHERE id IN (SELECT id FROM knowledge_article_views ORDER BY id LIMIT %s)
+                RETURNING article_id, views
+            ), totals AS (
+                SELECT article_id, SUM(views) AS views FROM batch GROUP BY article_id
+            ), updated AS (
+                UPDATE knowledge_articles a SET views = COALESCE(a.views, 0) + totals.views
+                FROM totals
+                WHERE a.id = totals.article_id
+                RETURNING a.id
+            )
+            SELECT (SELECT COUNT(*) FROM batch) AS rows, (SELECT COUNT(*) FROM updated) AS articles
+        ''', (batch_size,))
+        result = cur.fetchone()
+        conn.commit()
+        flushed += result['rows']
+        articles += result['articles']
+        if result['rows'] < batch_size:
+            break
+    return {'flushed': flushed, 'articles': articles, 'skipped': False}
@@ -0,0 +1,42 @@
+'''
+Однократная настройка шардов chat-функции перед включением DATABASE_SHARD_URLS на функции:
+последовательности id таблиц чатов каждого шарда получают шаг N и остаток, равный номеру шарда
+(configure_shard), после чего выполняется та же проверка, что функция делает при старте (verify_shards).
+Шарды должны быть уже с миграциями и без трафика: вставки во время настройки могут получить id не своего шарда.
+Повторный запуск безопасен - последовательности продолжаются с ближайшего свободного id своего остатка.
+Запуск: DATABASE_SHARD_URLS=dsn0,dsn1,... python backend/configure_shards.py
+'''
+import os
+import sys
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chat'))
+
+from shards import SHARD_URLS_ENV, configure_shard, parse_shard_urls, verify_shards  # noqa: E402
+
+
+def main() -> int:
+    urls = parse_shard_urls()
+    if not urls:
+        print(f'{SHARD_URLS_ENV} is empty', file=sys.stderr)
+        return 1
+
+    for index, url in enumerate(urls):
+        conn = psycopg2.connect(url)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                configure_shard(cur, index, len(urls))
+            conn.commit()
+        finally:
+            conn.close()
+        print(f'shard {index}: sequences strided by {len(urls)}')
+
+    verify_shards(urls)
+    print('ok')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,27 @@
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+SCHEMA_CACHE_MAX_ENTRIES = 8
+STATS_TOP_QUERIES_LIMIT = 20
+STATS_TOP_QUERIES_MAX_LIMIT = 500
+
+_schema_cache: Dict[tuple, Dict[str, Any]] = {}
+
+# Заголовки собираются один раз на инстанс и не изменяются по месту
+OPTIONS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Max-Age': '86400'
+}
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для получения информации о структуре базы данных
@@ -16,20 +34,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': OPTIONS_HEADERS,
             'body': '',
             'isBase64Encoded': False
         }
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
+    headers = JSON_HEADERS
     
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
@@ -48,29 +58,47 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if method == 'GET':
             table_name = event.get('queryStringParameters', {}).get('table')
             schema_name = event.get('queryStringParameters', {}).get('schema', 'public')
+            all_tables = event.get('queryStringParameters', {}).get('all', '') == 'true'
+            action = event.get('queryStringParameters', {}).get('action', '')
+            
+            if action == 'stats':
+                try:
+                    top_limit = int(event.get('queryStringParameters', {}).get('limit') or STATS_TOP_QUERIES_LIMIT)
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'limit must be an integer'})
+                    }
+                top_limit = max(1, min(top_limit, STATS_TOP_QUERIES_MAX_LIMIT))
+                result = get_schema_stats(cur, schema_name, top_limit)
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps(result, indent=2)
+                }
+            
+            if all_tables:
+                result = get_schema_info(cur, schema_name)
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': json.dumps(result, indent=2)
+                }
             
             if not table_name:
                 return {
                     'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'table parameter is required'})
+                    'body': json.dumps({'error': 'table parameter is required (or all=true)'})
                 }
             
             # Get column information
-            cur.execute('''
-                SELECT 
-                    column_name,
-                    data_type,
-                    character_maximum_length,
-                    is_nullable,
-                    column_default
-                FROM information_schema.columns
-                WHERE table_schema = %s AND table_name = %s
-                ORDER BY ordinal_position
-            ''', (schema_name, table_name))
-            
-            columns = cur.fetchall()
+            columns = get_columns(cur, schema_name, table_name)
             
             # Get primary key constraints
             cur.execute('''
@@ -165,7 +193,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             result = {
                 'table_name': table_name,
                 'schema_name': schema_name,
-                'columns': [dict(col) for col in columns],
+                'columns': [{key: value for key, value in col.items() if key != 'table_name'} for col in columns],
                 'primary_keys': [dict(pk) for pk in primary_keys],
                 'foreign_keys': [dict(fk) for fk in foreign_keys],
                 'unique_constraints': [dict(uc) for uc in unique_constraints],
@@ -197,3 +225,299 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     finally:
         if conn:
             conn.close()
+
+
+def get_schema_fingerprint(cur, schema_name: str) -> str:
+    '''
+    Хеш каталога схемы: xmin строк pg_class, pg_attribute, pg_constraint и pg_index
+    меняется при любом DDL, поэтому хеш служит ключом кеша структуры
+    '''
+    cur.execute('''
+        SELECT md5(string_agg(entry, ',' ORDER BY entry)) AS fingerprint
+        FROM (
+            SELECT 'c' || c.oid || ':' || c.xmin AS entry
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s
+            UNION ALL
+            SELECT 'a' || a.attrelid || '.' || a.attnum || ':' || a.xmin
+            FROM pg_attribute a
+            JOIN pg_class c ON c.oid = a.attrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relkind = 'r' AND a.attnum > 0
+            UNION ALL
+            SELECT 'k' || con.oid || ':' || con.xmin
+            FROM pg_constraint con
+            JOIN pg_namespace n ON n.oid = con.connamespace
+            WHERE n.nspname = %s
+            UNION ALL
+            SELECT 'i' || ix.indexrelid || ':' || ix.xmin
+            FROM pg_index ix
+            JOIN pg_class c ON c.oid = ix.indrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s
+        ) entries
+    ''', (schema_name, schema_name, schema_name, schema_name))
+    return cur.fetchone()['fingerprint'] or ''
+
+
+def get_columns(cur, schema_name: str, table_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    '''
+    Колонки из pg_catalog для обоих режимов, чтобы data_type (format_type) совпадал
+    для одной таблицы и для всей схемы. Без table_name - только таблицы, с ним - любое
+    отношение, как в information_schema.columns.
+    data_type - имя типа, а не категория information_schema: 'text[]' вместо 'ARRAY',
+    имя перечисления вместо 'USER-DEFINED'
+    '''
+    relation = 'c.relname = %s' if table_name else "c.relkind IN ('r', 'p')"
+    cur.execute(f'''
+        SELECT 
+            c.relname AS table_name,
+            a.attname AS column_name,
+            format_type(a.atttypid, NULL) AS data_type,
+            CASE WHEN a.atttypid IN (1042, 1043) AND a.atttypmod > 0
+                 THEN a.atttypmod - 4 END AS character_maximum_length,
+            CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END AS is_nullable,
+            pg_get_expr(d.adbin, d.adrelid) AS column_default
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE n.nspname = %s
+            AND {relation}
+            AND a.attnum > 0
+            AND NOT a.attisdropped
+        ORDER BY c.relname, a.attnum
+    ''', (schema_name, table_name) if table_name else (schema_name,))
+    return cur.fetchall()
+
+
+def get_schema_info(cur, schema_name: str) -> Dict[str, Any]:
+    '''
+    Структура всех таблиц схемы тремя запросами к pg_catalog вместо шести
+    запросов information_schema на каждую таблицу. Результат кешируется
+    по отпечатку каталога
+    '''
+    fingerprint = get_schema_fingerprint(cur, schema_name)
+    cache_key = (schema_name, fingerprint)
+    
+    cached = _schema_cache.get(cache_key)
+    if cached:
+        return dict(cached, cached=True)
+    
+    tables: Dict[str, Dict[str, Any]] = {}
+    
+    def table_entry(name: str) -> Dict[str, Any]:
+        if name not in tables:
+            tables[name] = {
+                'table_name': name,
+                'schema_name': schema_name,
+                'columns': [],
+                'primary_keys': [],
+                'foreign_keys': [],
+                'unique_constraints': [],
+                'check_constraints': [],
+                'indexes': []
+            }
+        return tables[name]
+    
+    # Columns of every table
+    for row in get_columns(cur, schema_name):
+        entry = table_entry(row.pop('table_name'))
+        entry['columns'].append(dict(row))
+    
+    # Primary key, foreign key, unique and check constraints
+    cur.execute('''
+        SELECT 
+            c.relname AS table_name,
+            con.conname AS constraint_name,
+            con.contype,
+            a.attname AS column_name,
+            fc.relname AS foreign_table_name,
+            fa.attname AS foreign_column_name,
+            CASE WHEN con.contype = 'c' THEN substring(pg_get_constraintdef(con.oid) from 7) END AS check_clause
+        FROM pg_constraint con
+        JOIN pg_class c ON c.oid = con.conrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, fattnum, ord)
+            ON con.contype <> 'c'
+        LEFT JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+        LEFT JOIN pg_class fc ON fc.oid = con.confrelid
+        LEFT JOIN pg_attribute fa ON fa.attrelid = con.confrelid AND fa.attnum = k.fattnum
+        WHERE n.nspname = %s
+            AND con.contype IN ('p', 'f', 'u', 'c')
+        ORDER BY c.relname, con.conname, k.ord
+    ''', (schema_name,))
+    
+    for row in cur.fetchall():
+        entry = table_entry(row['table_name'])
+        if row['contype'] == 'p':
+            entry['primary_keys'].append({
+                'constraint_name': row['constraint_name'],
+                'constraint_type': 'PRIMARY KEY',
+                'column_name': row['column_name']
+            })
+        elif row['contype'] == 'f':
+            entry['foreign_keys'].append({
+                'constraint_name': row['constraint_name'],
+                'column_name': row['column_name'],
+                'foreign_table_name': row['foreign_table_name'],
+                'foreign_column_name': row['foreign_column_name']
+            })
+        elif row['contype'] == 'u':
+            entry['unique_constraints'].append({
+                'constraint_name': row['constraint_name'],
+                'column_name': row['column_name']
+            })
+        else:
+            entry['check_constraints'].append({
+                'constraint_name': row['constraint_name'],
+                'check_clause': row['check_clause']
+            })
+    
+    # Indexes
+    cur.execute('''
+        SELECT 
+            t.relname AS table_name,
+            i.relname AS index_name,
+            a.attname AS column_name,
+            ix.indisunique AS is_unique,
+            ix.indisprimary AS is_primary
+        FROM pg_class t
+        JOIN pg_index ix ON t.oid = ix.indrelid
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(ix.indkey)
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE t.relkind = 'r'
+            AND n.nspname = %s
+        ORDER BY t.relname, i.relname, a.attnum
+    ''', (schema_name,))
+    
+    for row in cur.fetchall():
+        entry = table_entry(row.pop('table_name'))
+        entry['indexes'].append(dict(row))
+    
+    result = {
+        'schema_name': schema_name,
+        'fingerprint': fingerprint,
+        'table_count': len(tables),
+        'tables': tables
+    }
+    
+    if len(_schema_cache) >= SCHEMA_CACHE_MAX_ENTRIES:
+        _schema_cache.clear()
+    _schema_cache[cache_key] = result
+    
+    return dict(result, cached=False)
+
+
+def _isoformat_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value.isoformat() if hasattr(value, 'isoformat') else value for key, value in row.items()}
+
+
+def get_schema_stats(cur, schema_name: str, top_limit: int) -> Dict[str, Any]:
+    '''
+    Статистика для планирования ёмкости: размеры и оценки строк таблиц,
+    мёртвые кортежи, seq/index сканы, использование индексов и
+    самые дорогие запросы из pg_stat_statements (если расширение доступно)
+    '''
+    # Table sizes, dead tuples and scan counters
+    cur.execute('''
+        SELECT 
+            c.relname AS table_name,
+            CASE WHEN c.reltuples < 0 THEN s.n_live_tup ELSE c.reltuples::bigint END AS row_estimate,
+            pg_total_relation_size(c.oid) AS total_bytes,
+            pg_relation_size(c.oid) AS table_bytes,
+            pg_indexes_size(c.oid) AS index_bytes,
+            COALESCE(pg_total_relation_size(c.reltoastrelid), 0) AS toast_bytes,
+            s.n_live_tup,
+            s.n_dead_tup,
+            CASE WHEN s.n_live_tup + s.n_dead_tup > 0
+                 THEN round(s.n_dead_tup::numeric / (s.n_live_tup + s.n_dead_tup), 4)::float
+                 ELSE 0 END AS dead_ratio,
+            s.seq_scan,
+            s.seq_tup_read,
+            COALESCE(s.idx_scan, 0) AS idx_scan,
+            COALESCE(s.idx_tup_fetch, 0) AS idx_tup_fetch,
+            s.n_tup_ins,
+            s.n_tup_upd,
+            s.n_tup_hot_upd,
+            s.n_tup_del,
+            s.last_vacuum,
+            s.last_autovacuum,
+            s.last_analyze,
+            s.last_autoanalyze
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'p')
+        ORDER BY pg_total_relation_size(c.oid) DESC
+    ''', (schema_name,))
+    tables = [_isoformat_row(row) for row in cur.fetchall()]
+    
+    # Index usage
+    cur.execute('''
+        SELECT 
+            s.relname AS table_name,
+            s.indexrelname AS index_name,
+            s.idx_scan,
+            s.idx_tup_read,
+            s.idx_tup_fetch,
+            pg_relation_size(s.indexrelid) AS index_bytes,
+            ix.indisunique AS is_unique,
+            ix.indisprimary AS is_primary,
+            s.idx_scan = 0 AND NOT ix.indisunique AS unused
+        FROM pg_stat_user_indexes s
+        JOIN pg_index ix ON ix.indexrelid = s.indexrelid
+        WHERE s.schemaname = %s
+        ORDER BY s.relname, s.idx_scan ASC
+    ''', (schema_name,))
+    indexes = [dict(row) for row in cur.fetchall()]
+    
+    top_queries = None
+    top_queries_error = None
+    cur.execute('''
+        SELECT a.attname
+        FROM pg_extension e
+        JOIN pg_depend d ON d.refobjid = e.oid AND d.deptype = 'e'
+        JOIN pg_class c ON c.oid = d.objid AND c.relname = 'pg_stat_statements'
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname IN ('total_exec_time', 'total_time')
+        WHERE e.extname = 'pg_stat_statements'
+    ''')
+    time_column = cur.fetchone()
+    
+    if time_column:
+        total_column = time_column['attname']
+        mean_column = 'mean_exec_time' if total_column == 'total_exec_time' else 'mean_time'
+        cur.execute('SAVEPOINT stats_statements')
+        try:
+            cur.execute(f'''
+                SELECT 
+                    queryid,
+                    left(query, 500) AS query,
+                    calls,
+                    round({total_column}::numeric, 2)::float AS total_time_ms,
+                    round({mean_column}::numeric, 3)::float AS mean_time_ms,
+                    rows,
+                    shared_blks_hit,
+                    shared_blks_read
+                FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                ORDER BY {total_column} DESC
+                LIMIT %s
+            ''', (top_limit,))
+            top_queries = [dict(row) for row in cur.fetchall()]
+            cur.execute('RELEASE SAVEPOINT stats_statements')
+        except psycopg2.Error as e:
+            cur.execute('ROLLBACK TO SAVEPOINT stats_statements')
+            top_queries_error = str(e).strip()
+    else:
+        top_queries_error = 'pg_stat_statements extension is not installed'
+    
+    return {
+        'schema_name': schema_name,
+        'tables': tables,
+        'indexes': indexes,
+        'top_queries': top_queries,
+        'top_queries_error': top_queries_error
+    }
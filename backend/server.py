@@ -0,0 +1,299 @@
+'''
+Самостоятельный HTTP-сервер для функций из backend/func2url.json (chat, get_db_info)
+Мастер загружает функции, открывает слушающий сокет и держит --workers процессов; соединения
+с БД и пулы создаются при первом запросе, то есть уже после fork, и у каждого процесса свои.
+Функция доступна по имени (/chat) и по пути своего URL из func2url.json (/a33a1e04-...),
+так что фронтенду достаточно сменить хост. HTTP-запрос превращается в event облачной платформы, ответ handler - в HTTP.
+  - keep-alive HTTP/1.1, простаивающее соединение закрывается через --keep-alive секунд;
+  - у функции с async_handler он выполняется на цикле процесса, синхронный handler - в единственном
+    потоке процесса: синхронный код функций, как и на платформе, не выполняется параллельно сам с собой;
+  - SIGTERM/SIGINT: перестать принимать соединения, закрыть простаивающие, дождаться текущих
+    запросов (не дольше --graceful-timeout), вызвать shutdown() функции, если он есть;
+  - упавший процесс мастер перезапускает.
+Модули внутри каталогов функций импортируются по голому имени и не должны совпадать между функциями.
+Запуск: DATABASE_URL=... python backend/server.py [--host 0.0.0.0] [--port 8000] [--workers N]
+'''
+import argparse
+import asyncio
+import base64
+import importlib.util
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from types import SimpleNamespace
+from typing import Dict, Any, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADER_LINE_BYTES = 64 * 1024
+RESPAWN_DELAY_SECONDS = 1.0
+
+
+def load_functions(func2url_path: str) -> Dict[str, SimpleNamespace]:
+    '''
+    Модули index функций под уникальными именами
+    Returns: {сегмент пути: функция}, по имени функции и по последнему сегменту её URL
+    '''
+    with open(func2url_path) as f:
+        func2url = json.load(f)
+
+    routes = {}
+    for name, url in func2url.items():
+        function_dir = os.path.join(BACKEND_DIR, name)
+        if function_dir not in sys.path:
+            sys.path.insert(0, function_dir)
+        spec = importlib.util.spec_from_file_location(f'{name}_index', os.path.join(function_dir, 'index.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        function = SimpleNamespace(
+            name=name,
+            handler=module.handler,
+            async_handler=getattr(module, 'async_handler', None),
+            shutdown=getattr(module, 'shutdown', None)
+        )
+        routes[name] = function
+        url_segment = urlsplit(url).path.strip('/').split('/')[-1]
+        if url_segment:
+            routes[url_segment] = function
+    return routes
+
+
+def build_event(method: str, target: str, headers: Dict[str, str], body: bytes, source_ip: str) -> Dict[str, Any]:
+    url = urlsplit(target)
+    try:
+        text, encoded = body.decode('utf-8'), False
+    except UnicodeDecodeError:
+        text, encoded = base64.b64encode(body).decode('ascii'), True
+    return {
+        'httpMethod': method,
+        'path': url.path,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(url.query, keep_blank_values=True)),
+        'body': text,
+        'isBase64Encoded': encoded,
+        'requestContext': {'identity': {'sourceIp': source_ip}}
+    }
+
+
+def encode_response(response: Dict[str, Any], keep_alive: bool) -> bytes:
+    status = int(response.get('statusCode', 200))
+    body = response.get('body') or ''
+    payload = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+    lines = [f'HTTP/1.1 {status} {reason}']
+    for name, value in (response.get('headers') or {}).items():
+        if name.lower() not in ('content-length', 'connection', 'transfer-encoding'):
+            lines.append(f'{name}: {value}')
+    lines.append(f'Content-Length: {len(payload)}')
+    lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload
+
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps({'error': message})
+    }
+
+
+class Worker:
+    '''
+    Один процесс сервера: asyncio-сервер на унаследованном сокете
+    '''
+
+    def __init__(self, routes: Dict[str, SimpleNamespace], options: argparse.Namespace):
+        self.routes = routes
+        self.options = options
+        self.stopping = asyncio.Event()
+        self.idle: set = set()
+        self.in_flight = 0
+
+    def stop(self) -> None:
+        self.stopping.set()
+        for writer in list(self.idle):
+            writer.close()
+
+    async def serve(self, sock: socket.socket) -> None:
+        server = await asyncio.start_server(self.serve_connection, sock=sock, limit=MAX_HEADER_LINE_BYTES)
+        await self.stopping.wait()
+        server.close()
+
+        deadline = time.monotonic() + self.options.graceful_timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        for function in {id(f): f for f in self.routes.values()}.values():
+            if function.shutdown:
+                try:
+                    await function.shutdown()
+                except Exception as e:
+                    print(f'{function.name}: shutdown failed: {e}', file=sys.stderr)
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info('peername')
+        peer_ip = peer[0] if isinstance(peer, tuple) else ''
+        self.idle.add(writer)
+        try:
+            while not self.stopping.is_set():
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.options.keep_alive)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                self.idle.discard(writer)
+                self.in_flight += 1
+                try:
+                    response, keep_alive = await self.handle_request(request_line, reader, peer_ip)
+                finally:
+                    self.in_flight -= 1
+                keep_alive = keep_alive and not self.stopping.is_set()
+                writer.write(encode_response(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+                self.idle.add(writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self.idle.discard(writer)
+            writer.close()
+
+    async def handle_request(self, request_line: bytes, reader: asyncio.StreamReader, peer_ip: str) -> tuple:
+        '''
+        Returns: (ответ в формате функции, можно ли продолжать соединение)
+        '''
+        method, target, version = request_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip(), value.strip()
+            headers[name] = f'{headers[name]}, {value}' if name in headers else value
+        lowered = {name.lower(): value for name, value in headers.items()}
+
+        connection = lowered.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+        if 'chunked' in lowered.get('transfer-encoding', '').lower():
+            return error_response(411, 'Content-Length required'), False
+        length = int(lowered.get('content-length') or 0)
+        if length > MAX_BODY_BYTES:
+            return error_response(413, 'Request body too large'), False
+        body = await reader.readexactly(length) if length else b''
+
+        function = self.routes.get(urlsplit(target).path.strip('/').split('/')[0])
+        if function is None:
+            return error_response(404, 'Function not found'), keep_alive
+
+        source_ip = peer_ip
+        if self.options.trust_forwarded and lowered.get('x-forwarded-for'):
+            source_ip = lowered['x-forwarded-for'].split(',')[0].strip()
+        event = build_event(method, target, headers, body, source_ip)
+        context = SimpleNamespace(request_id=uuid.uuid4().hex, function_name=function.name)
+        event['requestContext']['requestId'] = context.request_id
+        return await self.invoke(function, event, context), keep_alive
+
+    async def invoke(self, function: SimpleNamespace, event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        try:
+            if function.async_handler:
+                return await function.async_handler(event, context)
+            return await asyncio.get_running_loop().run_in_executor(None, function.handler, event, context)
+        except Exception as e:
+            print(f'{function.name}: {e!r}', file=sys.stderr)
+            return error_response(500, str(e))
+
+
+def run_worker(sock: socket.socket, routes: Dict[str, SimpleNamespace], options: argparse.Namespace) -> int:
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=1, thread_name_prefix='handler'))
+    worker = Worker(routes, options)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, worker.stop)
+    try:
+        loop.run_until_complete(worker.serve(sock))
+    finally:
+        loop.close()
+    return 0
+
+
+def spawn_worker(sock: socket.socket, routes: Dict[str, SimpleNamespace], options: argparse.Namespace) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = run_worker(sock, routes, options)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    return pid
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--keep-alive', type=float, default=75.0)
+    parser.add_argument('--graceful-timeout', type=float, default=30.0)
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--trust-forwarded', action='store_true',
+                        help='брать IP клиента из X-Forwarded-For (сервер за прокси)')
+    parser.add_argument('--func2url', default=os.path.join(BACKEND_DIR, 'func2url.json'))
+    options = parser.parse_args(argv)
+
+    sock = socket.create_server((options.host, options.port), backlog=options.backlog)
+    sock.set_inheritable(True)
+    routes = load_functions(options.func2url)
+    print(f'listening on {options.host}:{sock.getsockname()[1]} with {options.workers} workers', flush=True)
+
+    stopping = False
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    workers = {spawn_worker(sock, routes, options) for _ in range(options.workers)}
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            print(f'worker {pid} exited with status {status}, restarting', file=sys.stderr, flush=True)
+            time.sleep(RESPAWN_DELAY_SECONDS)
+            workers.add(spawn_worker(sock, routes, options))
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
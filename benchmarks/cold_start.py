@@ -0,0 +1,90 @@
+'''
+Cold-start harness для функций chat и get_db_info
+Каждый замер - свежий интерпретатор: время импорта модуля index, первого
+подключения к БД, первого и второго (тёплого) запроса.
+Запуск: DATABASE_URL=... python benchmarks/cold_start.py [--runs 7] [--no-check]
+Без DATABASE_URL измеряется только импорт. Код возврата 1 - превышен порог.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Пороги регрессии, мс (медиана по запускам) - от замеров исходного кода (0d6b2a5) с запасом на шум:
+# импорт chat 30 мс, get_db_info 30 мс; первый запрос get_db_info 19 мс.
+# Первый запрос chat (3 мс в 0d6b2a5) идёт чтением на asyncpg и добавляет ~40 мс на импорт
+# asyncio/asyncpg и создание пула - порог учитывает эту цену
+THRESHOLDS_MS = {
+    'chat': {'import': 40, 'first_request': 60},
+    'get_db_info': {'import': 40, 'first_request': 30}
+}
+
+FIRST_EVENTS = {
+    'chat': {'httpMethod': 'GET', 'queryStringParameters': {'action': 'list'}},
+    'get_db_info': {'httpMethod': 'GET', 'queryStringParameters': {'table': 'chats'}}
+}
+
+PROBE = r'''
+import json, os, sys, time
+function_dir, event = sys.argv[1], json.loads(sys.argv[2])
+sys.path.insert(0, function_dir)
+result = {}
+started = time.perf_counter()
+import index
+result['import'] = (time.perf_counter() - started) * 1000
+result['modules'] = len(sys.modules)
+if os.environ.get('DATABASE_URL'):
+    import psycopg2
+    started = time.perf_counter()
+    psycopg2.connect(os.environ['DATABASE_URL']).close()
+    result['first_connection'] = (time.perf_counter() - started) * 1000
+    for name in ('first_request', 'warm_request'):
+        started = time.perf_counter()
+        response = index.handler(dict(event), None)
+        result[name] = (time.perf_counter() - started) * 1000
+        result[name + '_status'] = response['statusCode']
+print(json.dumps(result))
+'''
+
+
+def probe(function: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, os.path.join(ROOT, 'backend', function), json.dumps(FIRST_EVENTS[function])],
+        check=True, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='0')
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--no-check', action='store_true')
+    args = parser.parse_args()
+
+    failed = False
+    for function in ('chat', 'get_db_info'):
+        probe(function)  # прогрев кеша байткода, в облаке .pyc уже есть
+        samples = [probe(function) for _ in range(args.runs)]
+        print(f'== {function} ({args.runs} runs, median)')
+        for metric in ('import', 'first_connection', 'first_request', 'warm_request', 'modules'):
+            values = [s[metric] for s in samples if metric in s]
+            if not values:
+                continue
+            median = statistics.median(values)
+            limit = THRESHOLDS_MS[function].get(metric)
+            verdict = ''
+            if limit is not None:
+                verdict = 'ok' if median <= limit else f'REGRESSION > {limit} ms'
+                failed = failed or median > limit
+            unit = '' if metric == 'modules' else ' ms'
+            print(f'  {metric:<17} {median:>9.2f}{unit}  {verdict}')
+
+    return 1 if failed and not args.no_check else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
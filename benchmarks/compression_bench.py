@@ -0,0 +1,79 @@
+'''
+Benchmark: размер и CPU сжатия ответов chat-функции на разных размерах тела
+Запуск: python benchmarks/compression_bench.py
+Тело - синтетический ответ allChats: {"chats": [...]} с N строками
+'''
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'chat'))
+
+from compression import COMPRESSION_MIN_BYTES, compress_response, get_encoders  # noqa: E402
+
+ROW_COUNTS = [1, 5, 20, 100, 1000, 10000, 50000]
+STATUSES = ['waiting', 'active', 'closed', 'postponed', 'escalated']
+OPERATORS = ['Иван Петров', 'Мария Сидорова', 'Алексей Козлов', None]
+
+
+def make_payload(rows: int) -> str:
+    rng = random.Random(rows)
+    chats = []
+    for i in range(rows):
+        chats.append({
+            'id': i + 1,
+            'status': rng.choice(STATUSES),
+            'assignedOperator': rng.choice(OPERATORS),
+            'clientName': f'Клиент {rng.randint(1, 100000)}',
+            'email': f'user{rng.randint(1, 100000)}@example.com',
+            'phone': f'+7999{rng.randint(1000000, 9999999)}',
+            'ipAddress': f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}',
+            'createdAt': f'2026-10-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00',
+            'updatedAt': f'2026-10-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00',
+            'assignedAt': None,
+            'deadline': None,
+            'extensionRequested': False,
+            'extensionDeadline': None,
+            'clientRatingScore': rng.choice([None, 1, 2, 3, 4, 5]),
+            'clientRatingComment': ''
+        })
+    return json.dumps({'chats': chats})
+
+
+def measure(encoder, data: bytes, repeat: int) -> tuple:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        compressed = encoder(data)
+    elapsed = (time.perf_counter() - started) / repeat
+    return len(compressed), elapsed
+
+
+def main() -> None:
+    encoders = list(get_encoders())
+    for level in (1, 9):
+        encoders.append((f'gzip-{level}', lambda data, level=level: gzip.compress(data, level, mtime=0)))
+
+    print(f'threshold COMPRESSION_MIN_BYTES = {COMPRESSION_MIN_BYTES}')
+    print(f'{"rows":>6} {"raw bytes":>11} {"encoding":>8} {"bytes":>10} {"ratio":>7} {"ms":>8} {"MB/s":>8}')
+    for rows in ROW_COUNTS:
+        data = make_payload(rows).encode('utf-8')
+        repeat = max(1, min(200, 2_000_000 // max(len(data), 1)))
+        for name, encoder in encoders:
+            size, elapsed = measure(encoder, data, repeat)
+            print(f'{rows:>6} {len(data):>11} {name:>8} {size:>10} {size / len(data):>7.3f} '
+                  f'{elapsed * 1000:>8.3f} {len(data) / elapsed / 1e6:>8.1f}')
+        # Тело на выходе compress_response: base64 сжатого или исходное, если сжатие не окупилось
+        body = data.decode('utf-8')
+        for name, _ in get_encoders():
+            response = compress_response({'headers': {'Accept-Encoding': name}},
+                                         {'statusCode': 200, 'headers': {}, 'body': body})
+            wire = len(response['body'])
+            print(f'{"":>6} {"":>11} {"wire " + name:>8} {wire:>10} {wire / len(data):>7.3f}'
+                  f'{"" if response.get("isBase64Encoded") else "  (raw)":>8}')
+
+
+if __name__ == '__main__':
+    main()
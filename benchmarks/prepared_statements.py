@@ -0,0 +1,96 @@
+'''
+Benchmark: текстовые запросы против PREPARE/EXECUTE для горячих запросов chat
+Запуск: DATABASE_URL=... python benchmarks/prepared_statements.py [--iterations 2000]
+Оба режима идут на одном соединении; CPU серверного процесса берётся из
+/proc/<pid>/stat backend-а (только для локального PostgreSQL), иначе не выводится.
+Пишущие запросы выполняются в транзакции, которая откатывается.
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'chat'))
+
+import db  # noqa: E402
+from queries import QUERIES  # noqa: E402
+
+
+def hot_queries(cur) -> dict:
+    cur.execute('SELECT id, assigned_operator FROM chats ORDER BY id LIMIT 1')
+    chat = cur.fetchone()
+    if not chat:
+        sys.exit('chats table is empty')
+    operator = chat['assigned_operator'] or 'Иван Петров'
+    return {
+        'listForOperator': (operator,),
+        'messages': (chat['id'],),
+        'activeChatCount': (operator,),
+        'nextWaitingChat': (),
+        'insertMessage': (chat['id'], 'client', 'bench', 'benchmark message'),
+        'touchChat': (chat['id'],),
+        'assignChat': (operator, datetime.utcnow() + timedelta(minutes=15), chat['id'])
+    }
+
+
+def backend_cpu_ms(pid: int):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) * 1000 / os.sysconf('SC_CLK_TCK')
+
+
+def run(cur, name: str, args: tuple, prepared: bool, iterations: int) -> tuple:
+    pid = cur.connection.get_backend_pid()
+    execute = db.execute_prepared if prepared else (lambda c, n, sql, a: c.execute(sql, a))
+    execute(cur, name, QUERIES[name], args)  # PREPARE и прогрев кешей вне замера
+    cur.fetchall() if cur.description else None
+
+    samples = []
+    cpu_before = backend_cpu_ms(pid)
+    for _ in range(iterations):
+        started = time.perf_counter()
+        execute(cur, name, QUERIES[name], args)
+        if cur.description:
+            cur.fetchall()
+        samples.append((time.perf_counter() - started) * 1e6)
+    cpu_after = backend_cpu_ms(pid)
+    cur.connection.rollback()
+
+    cpu = (cpu_after - cpu_before) * 1000 / iterations if cpu_before is not None else None
+    return statistics.median(samples), sorted(samples)[int(len(samples) * 0.95)], cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = db.get_connection(os.environ['DATABASE_URL'])
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    queries = hot_queries(cur)
+    conn.rollback()
+
+    print(f'{"query":<18} {"mode":<9} {"p50 us":>9} {"p95 us":>9} {"server cpu us":>14}')
+    for name, query_args in queries.items():
+        for prepared in (False, True):
+            p50, p95, cpu = run(cur, name, query_args, prepared, args.iterations)
+            cpu_text = f'{cpu:>14.1f}' if cpu is not None else f'{"n/a":>14}'
+            print(f'{name:<18} {"prepared" if prepared else "text":<9} {p50:>9.1f} {p95:>9.1f} {cpu_text}')
+
+    cur.close()
+    db.release_connection(conn)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except psycopg2.Error as e:
+        sys.exit(str(e))
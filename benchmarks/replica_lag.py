@@ -0,0 +1,134 @@
+'''
+Проверка маршрутизации чтений на реплику с read-your-writes на двух локальных PostgreSQL
+Поднимает primary и потоковую реплику с recovery_min_apply_delay (искусственное
+отставание) во временном каталоге, затем вызывает handler функции chat:
+  - запись возвращает X-Read-After-LSN;
+  - чтение с этим токеном, пока реплика отстаёт, уходит на primary и видит запись;
+  - чтение без токена обслуживает реплика (записи ещё нет);
+  - после применения WAL чтение с токеном обслуживает реплика;
+  - при остановленной реплике чтения уходят на primary.
+Запуск (не от root, initdb/pg_ctl/pg_basebackup в PATH или PG_BIN):
+  python benchmarks/replica_lag.py [--delay 3]
+'''
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'chat'))
+
+NEWS_DDL = '''
+    CREATE TABLE news (
+        id SERIAL PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        content TEXT NOT NULL,
+        author VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        published_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def pg(tool: str, *args: str) -> None:
+    binary = os.path.join(os.environ['PG_BIN'], tool) if os.environ.get('PG_BIN') else tool
+    subprocess.run([binary, *args], check=True, stdout=subprocess.DEVNULL)
+
+
+def start_cluster(root: str, delay: int) -> tuple:
+    primary, replica = os.path.join(root, 'primary'), os.path.join(root, 'replica')
+    pg('initdb', '-D', primary, '-U', 'postgres', '--auth=trust')
+    with open(os.path.join(primary, 'postgresql.conf'), 'a') as f:
+        f.write(f"listen_addresses = ''\nunix_socket_directories = '{root}'\nport = 55432\n"
+                "wal_level = replica\nmax_wal_senders = 4\n")
+    with open(os.path.join(primary, 'pg_hba.conf'), 'a') as f:
+        f.write('local replication all trust\n')
+    pg('pg_ctl', '-D', primary, '-l', os.path.join(root, 'primary.log'), '-w', 'start')
+
+    pg('pg_basebackup', '-D', replica, '-h', root, '-p', '55432', '-U', 'postgres', '-R')
+    with open(os.path.join(replica, 'postgresql.conf'), 'a') as f:
+        f.write(f"port = 55433\nrecovery_min_apply_delay = '{delay}s'\n")
+    pg('pg_ctl', '-D', replica, '-l', os.path.join(root, 'replica.log'), '-w', 'start')
+    return primary, replica
+
+
+def call(index, method: str, params: dict = None, body: dict = None, headers: dict = None) -> dict:
+    event = {'httpMethod': method, 'queryStringParameters': params or {}, 'headers': headers or {}}
+    if body is not None:
+        event['body'] = json.dumps(body)
+    return index.handler(event, None)
+
+
+def news_titles(response: dict) -> list:
+    return [item['title'] for item in json.loads(response['body'])['news']]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delay', type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='chat-replica-')
+    clusters = ()
+    failures = []
+
+    def check(name: str, ok: bool) -> None:
+        print(f'  {"ok  " if ok else "FAIL"} {name}')
+        if not ok:
+            failures.append(name)
+
+    try:
+        clusters = start_cluster(root, args.delay)
+        os.environ['DATABASE_URL'] = f'postgresql://postgres@/postgres?host={root}&port=55432'
+        os.environ['DATABASE_REPLICA_URL'] = f'postgresql://postgres@/postgres?host={root}&port=55433'
+
+        import psycopg2
+        with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cur:
+            cur.execute(NEWS_DDL)
+        time.sleep(args.delay + 1)
+
+        import db
+        import index
+
+        write = call(index, 'POST', body={'action': 'createNews', 'title': 'lsn', 'content': 'c', 'author': 'a'})
+        token = write['headers'].get(index.READ_AFTER_HEADER)
+        check('write returns LSN token', write['statusCode'] == 200 and bool(token))
+
+        lagging = db.get_replica_connection(os.environ['DATABASE_REPLICA_URL'], token) is None
+        check('replica is behind the token while apply is delayed', lagging)
+
+        fresh = call(index, 'GET', {'action': 'news'}, headers={index.READ_AFTER_HEADER: token})
+        check('read with token sees own write (primary)', 'lsn' in news_titles(fresh))
+
+        stale = call(index, 'GET', {'action': 'news'})
+        check('read without token is served by lagging replica', 'lsn' not in news_titles(stale))
+
+        deadline = time.monotonic() + args.delay * 5
+        while db.get_replica_connection(os.environ['DATABASE_REPLICA_URL'], token) is None:
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.2)
+        caught_up = db.get_replica_connection(os.environ['DATABASE_REPLICA_URL'], token)
+        check('replica catches up with the token', caught_up is not None)
+        if caught_up is not None:
+            db.release_connection(caught_up)
+        replica = call(index, 'GET', {'action': 'news'}, headers={index.READ_AFTER_HEADER: token})
+        check('read with token after catch-up sees own write', 'lsn' in news_titles(replica))
+
+        pg('pg_ctl', '-D', clusters[1], '-m', 'immediate', '-w', 'stop')
+        down = call(index, 'GET', {'action': 'news'})
+        check('replica down: read falls back to primary', down['statusCode'] == 200 and 'lsn' in news_titles(down))
+    finally:
+        for data_dir in reversed(clusters):
+            subprocess.run([os.path.join(os.environ.get('PG_BIN', ''), 'pg_ctl'), '-D', data_dir,
+                            '-m', 'immediate', 'stop'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+'''
+Benchmark: standalone-сервер (backend/server.py) против модели "вызов функции на запрос"
+Один и тот же GET к chat в трёх режимах:
+  - cold: новый интерпретатор на каждый запрос (холодный старт инстанса, import + подключение);
+  - warm: один процесс вызывает handler последовательно (тёплый инстанс, один запрос за раз);
+  - server: HTTP к серверу с --workers процессами, --clients клиентов с keep-alive и без него.
+Клиенты - отдельные процессы; на одной машине они делят CPU с сервером и БД.
+Запуск: DATABASE_URL=... python benchmarks/server_throughput.py [--workers 2] [--clients 8] [--seconds 5]
+'''
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CHAT_DIR = os.path.join(ROOT, 'backend', 'chat')
+
+COLD_PROBE = r'''
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import index
+print(index.handler(json.loads(sys.argv[2]), None)['statusCode'])
+'''
+
+
+def request_event(path: str) -> dict:
+    query = path.partition('?')[2]
+    params = dict(part.split('=', 1) for part in query.split('&') if '=' in part)
+    return {'httpMethod': 'GET', 'queryStringParameters': params, 'headers': {}}
+
+
+def summary(label: str, latencies: list, elapsed: float, errors: int = 0) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    note = f', {errors} errors' if errors else ''
+    print(f'  {label:<28} {len(latencies) / elapsed:8.0f} req/s  '
+          f'p50 {statistics.median(latencies) * 1000 if latencies else 0:7.2f} ms  p99 {p99 * 1000:7.2f} ms{note}')
+
+
+def run_cold(path: str, requests: int) -> None:
+    event = json.dumps(request_event(path))
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, '-c', COLD_PROBE, CHAT_DIR, event], check=True, capture_output=True)
+        latencies.append(time.perf_counter() - t)
+    summary('cold (process per request)', latencies, time.perf_counter() - started)
+
+
+def run_warm(path: str, seconds: float) -> None:
+    sys.path.insert(0, CHAT_DIR)
+    import index
+
+    event = request_event(path)
+    index.handler(dict(event), None)
+    latencies = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        t = time.perf_counter()
+        index.handler(dict(event), None)
+        latencies.append(time.perf_counter() - t)
+    summary('warm (one instance)', latencies, time.perf_counter() - started)
+
+
+def client(port: int, path: str, seconds: float, keep_alive: bool, results) -> None:
+    latencies, errors = [], 0
+    conn = None
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        t = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            conn.request('GET', path, headers={} if keep_alive else {'Connection': 'close'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+            if not keep_alive or response.getheader('Connection') == 'close':
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - t)
+    results.put((latencies, errors))
+
+
+def run_server(port: int, path: str, clients: int, seconds: float, keep_alive: bool, label: str) -> None:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=client, args=(port, path, seconds, keep_alive, results))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    # Каждый клиент отмеряет seconds после своего запуска, старт процессов в замер не входит
+    summary(label, [l for latencies, _ in collected for l in latencies], seconds, sum(e for _, e in collected))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--path', default='/chat?action=list')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--cold-requests', type=int, default=20)
+    args = parser.parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+
+    print(f'GET {args.path}')
+    run_cold(args.path, args.cold_requests)
+    run_warm(args.path, args.seconds)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'backend', 'server.py'), '--host', '127.0.0.1',
+         '--port', str(port), '--workers', str(args.workers)],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        server.stdout.readline()
+        label = f'server {args.workers}w x {args.clients}c'
+        run_server(port, args.path, args.clients, args.seconds, True, label + ' keep-alive')
+        run_server(port, args.path, args.clients, args.seconds, False, label + ' new conn')
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
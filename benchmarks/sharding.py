@@ -0,0 +1,324 @@
+'''
+Шардирование чатов на нескольких локальных PostgreSQL: проверки маршрутизации и масштабирование записи
+Поднимает N кластеров во временном каталоге (первый служит и DATABASE_URL), создаёт схему
+чатов, настраивает последовательности шардов и вызывает handler функции chat:
+  - чат создаётся на шарде IP клиента, а его id указывает на тот же шард;
+  - сообщения и чтение переписки уходят на шард чата;
+  - list и allChats собирают чаты со всех шардов в порядке updated_at;
+  - постраничный clients проходит всех клиентов всех шардов без повторов;
+  - назначение учитывает активные чаты оператора на всех шардах.
+Затем sendMessage из нескольких процессов (как отдельные инстансы функции) на одном
+кластере без шардирования и на N шардах; выводится число записей в секунду.
+Запуск (не от root, initdb/pg_ctl в PATH или PG_BIN):
+  python benchmarks/sharding.py [--shards 3] [--workers 6] [--seconds 5] [--chats 1000]
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'chat'))
+
+BASE_PORT = 55440
+
+# Таблицы, которых касаются проверяемые действия, в виде после всех миграций
+SCHEMA_DDL = '''
+    CREATE TABLE clients (
+        id SERIAL PRIMARY KEY,
+        ip_address VARCHAR(45) NOT NULL UNIQUE,
+        name VARCHAR(255),
+        email VARCHAR(255),
+        phone VARCHAR(50),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_clients_last_seen_id ON clients(last_seen DESC, id DESC);
+    CREATE TABLE chats (
+        id SERIAL PRIMARY KEY,
+        client_id INTEGER REFERENCES clients(id),
+        status VARCHAR(50) DEFAULT 'waiting',
+        assigned_operator VARCHAR(100),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        assigned_at TIMESTAMP,
+        deadline TIMESTAMP,
+        extension_requested BOOLEAN DEFAULT FALSE,
+        extension_deadline TIMESTAMP,
+        client_name VARCHAR(255),
+        phone VARCHAR(50),
+        email VARCHAR(255),
+        ip_address VARCHAR(45)
+    );
+    CREATE INDEX idx_chats_client_open ON chats(client_id) WHERE status <> 'closed';
+    CREATE INDEX idx_chats_updated ON chats(updated_at DESC);
+    CREATE TABLE messages (
+        id SERIAL PRIMARY KEY,
+        chat_id INTEGER REFERENCES chats(id),
+        sender_type VARCHAR(20) NOT NULL,
+        sender_name VARCHAR(255),
+        message_text TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_messages_chat ON messages(chat_id);
+    CREATE TABLE client_ratings (
+        id SERIAL PRIMARY KEY,
+        chat_id INTEGER,
+        score INTEGER NOT NULL,
+        comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE ratings (
+        id SERIAL PRIMARY KEY,
+        chat_id INTEGER REFERENCES chats(id),
+        operator_name VARCHAR(100) NOT NULL,
+        rated_by VARCHAR(100) NOT NULL,
+        score INTEGER NOT NULL,
+        comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE qc_archive (
+        id SERIAL PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        operator_name VARCHAR(100),
+        qc_name VARCHAR(100),
+        rating_score INTEGER,
+        rating_comment TEXT,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE chat_events (
+        seq BIGSERIAL PRIMARY KEY,
+        tx_id XID8 NOT NULL DEFAULT pg_current_xact_id(),
+        event_type VARCHAR(50) NOT NULL,
+        chat_id INTEGER,
+        payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE employees (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(100) UNIQUE NOT NULL,
+        password_hash TEXT,
+        password VARCHAR(255),
+        name VARCHAR(255) NOT NULL,
+        role VARCHAR(50) DEFAULT 'operator',
+        status VARCHAR(50) DEFAULT 'offline',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE employee_roles (
+        id SERIAL PRIMARY KEY,
+        employee_id INTEGER NOT NULL REFERENCES employees(id),
+        role VARCHAR(50) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (employee_id, role)
+    );
+    CREATE SEQUENCE cache_versions_seq;
+    CREATE TABLE cache_versions (
+        name VARCHAR(100) PRIMARY KEY,
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE UNLOGGED TABLE operator_presence (
+        operator_name VARCHAR(255) PRIMARY KEY,
+        last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE UNLOGGED TABLE rate_limit_buckets (
+        bucket_key VARCHAR(200) PRIMARY KEY,
+        tokens DOUBLE PRECISION NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+
+def pg(tool: str, *args: str) -> None:
+    binary = os.path.join(os.environ['PG_BIN'], tool) if os.environ.get('PG_BIN') else tool
+    subprocess.run([binary, *args], check=True, stdout=subprocess.DEVNULL)
+
+
+def start_clusters(root: str, count: int) -> tuple:
+    data_dirs, urls = [], []
+    for index in range(count):
+        data_dir = os.path.join(root, f'shard{index}')
+        pg('initdb', '-D', data_dir, '-U', 'postgres', '--auth=trust')
+        with open(os.path.join(data_dir, 'postgresql.conf'), 'a') as f:
+            f.write(f"listen_addresses = ''\nunix_socket_directories = '{root}'\nport = {BASE_PORT + index}\n")
+        pg('pg_ctl', '-D', data_dir, '-l', os.path.join(root, f'shard{index}.log'), '-w', 'start')
+        data_dirs.append(data_dir)
+        urls.append(f'postgresql://postgres@/postgres?host={root}&port={BASE_PORT + index}')
+    return data_dirs, urls
+
+
+def reset_schema(urls: list) -> None:
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from shards import configure_shard
+
+    for index, url in enumerate(urls):
+        with psycopg2.connect(url) as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+            cur.execute(SCHEMA_DDL)
+            cur.execute("INSERT INTO cache_versions (name, version) VALUES ('employees', nextval('cache_versions_seq'))")
+            if len(urls) > 1:
+                configure_shard(cur, index, len(urls))
+        conn.close()
+
+
+def call(index, method: str, params: dict = None, body: dict = None) -> dict:
+    event = {'httpMethod': method, 'queryStringParameters': params or {}, 'headers': {}}
+    if body is not None:
+        event['body'] = json.dumps(body)
+    response = index.handler(event, None)
+    return {'statusCode': response['statusCode'], **json.loads(response['body'])}
+
+
+def start_chats(index, count: int, prefix: str) -> list:
+    chat_ids = []
+    for n in range(count):
+        ip_address = f'{prefix}.{n // 250}.{n % 250}'
+        response = call(index, 'POST', body={'action': 'startChat', 'ipAddress': ip_address, 'name': f'client {n}'})
+        chat_ids.append((ip_address, response['chatId']))
+    return chat_ids
+
+
+def check_routing(index, urls: list, check) -> None:
+    import psycopg2
+    from shards import chat_shard, client_shard
+
+    chats = start_chats(index, 60, '10.1')
+    on_ip_shard = all(chat_shard(chat_id, len(urls)) == client_shard(ip, len(urls)) for ip, chat_id in chats)
+    check('chat id maps to the shard of its client IP', on_ip_shard)
+
+    stored = True
+    for ip_address, chat_id in chats:
+        url = urls[chat_shard(chat_id, len(urls))]
+        with psycopg2.connect(url) as conn, conn.cursor() as cur:
+            cur.execute('SELECT ip_address FROM chats WHERE id = %s', (chat_id,))
+            row = cur.fetchone()
+            stored = stored and row is not None and row[0] == ip_address
+        conn.close()
+    check('chat row is stored on the computed shard', stored)
+    check('chats are spread over all shards', len({chat_shard(c, len(urls)) for _, c in chats}) == len(urls))
+
+    chat_id = chats[7][1]
+    sent = call(index, 'POST', body={'action': 'sendMessage', 'chatId': chat_id, 'message': 'hello', 'senderType': 'client'})
+    messages = call(index, 'GET', {'action': 'messages', 'chatId': str(chat_id)})
+    check('message is written and read on the chat shard',
+          sent['statusCode'] == 200 and [m['text'] for m in messages['messages']] == ['hello'])
+
+    for action in ('list', 'allChats'):
+        listed = call(index, 'GET', {'action': action})['chats']
+        updated = [chat['updatedAt'] for chat in listed]
+        check(f'{action} gathers chats from all shards', {c['id'] for c in listed} == {c for _, c in chats})
+        check(f'{action} is merged in updated_at order', updated == sorted(updated, reverse=True))
+    check('list puts the chat with a new message first', call(index, 'GET', {'action': 'list'})['chats'][0]['id'] == chat_id)
+
+    seen, cursor = [], None
+    while True:
+        params = {'action': 'clients', 'limit': '7', **({'cursor': cursor} if cursor else {})}
+        page = call(index, 'GET', params)
+        seen += [client['ipAddress'] for client in page['clients']]
+        cursor = page['nextCursor']
+        if not cursor:
+            break
+    check('clients pages cover every shard without repeats', sorted(seen) == sorted(ip for ip, _ in chats))
+
+    with psycopg2.connect(urls[0]) as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO employees (username, name) VALUES ('op', 'Оператор')")
+    conn.close()
+    call(index, 'POST', body={'action': 'updateOperatorStatus', 'operatorName': 'Оператор', 'status': 'online'})
+    start_chats(index, 3, '10.2')
+    active = [c for c in call(index, 'GET', {'action': 'list'})['chats'] if c['assignedOperator'] == 'Оператор']
+    check('operator gets at most MAX_ACTIVE_CHATS across shards', len(active) == index.MAX_ACTIVE_CHATS)
+
+
+def write_worker(env: dict, chat_ids: list, seconds: float, results) -> None:
+    os.environ.update(env)
+    import index
+
+    sent = limited = 0
+    deadline = time.monotonic() + seconds
+    position = 0
+    while time.monotonic() < deadline:
+        chat_id = chat_ids[position % len(chat_ids)]
+        position += 1
+        event = {'httpMethod': 'POST', 'queryStringParameters': {}, 'headers': {},
+                 'body': json.dumps({'action': 'sendMessage', 'chatId': chat_id, 'message': 'bench', 'senderType': 'client'})}
+        status = index.handler(event, None)['statusCode']
+        if status == 200:
+            sent += 1
+        elif status == 429:
+            limited += 1
+    results.put((sent, limited))
+
+
+def measure_writes(env: dict, chat_ids: list, workers: int, seconds: float) -> tuple:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=write_worker, args=(env, chat_ids[n::workers], seconds, results))
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(t[0] for t in totals) / seconds, sum(t[1] for t in totals)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=6)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--chats', type=int, default=1000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='chat-shards-')
+    data_dirs = []
+    failures = []
+
+    def check(name: str, ok: bool) -> None:
+        print(f'  {"ok  " if ok else "FAIL"} {name}')
+        if not ok:
+            failures.append(name)
+
+    try:
+        data_dirs, urls = start_clusters(root, args.shards)
+        os.environ['DATABASE_URL'] = urls[0]
+        os.environ['DATABASE_SHARD_URLS'] = ','.join(urls)
+        reset_schema(urls)
+
+        import index
+        print(f'routing ({args.shards} shards)')
+        check_routing(index, urls, check)
+
+        print(f'sendMessage throughput, {args.workers} processes, {args.seconds:g} s')
+        configurations = [
+            ('1 database', {'DATABASE_URL': urls[0], 'DATABASE_SHARD_URLS': ''}, urls[:1]),
+            (f'{args.shards} shards', {'DATABASE_URL': urls[0], 'DATABASE_SHARD_URLS': ','.join(urls)}, urls)
+        ]
+        baseline = None
+        for label, env, shard_set in configurations:
+            reset_schema(shard_set)
+            os.environ.update(env)
+            chat_ids = [chat_id for _, chat_id in start_chats(index, args.chats, '10.3')]
+            rate, limited = measure_writes(env, chat_ids, args.workers, args.seconds)
+            baseline = baseline or rate
+            note = f', {limited} rate-limited' if limited else ''
+            print(f'  {label:>12}: {rate:8.0f} writes/s  x{rate / baseline:.2f}{note}')
+    finally:
+        for data_dir in data_dirs:
+            subprocess.run([os.path.join(os.environ.get('PG_BIN', ''), 'pg_ctl'), '-D', data_dir,
+                            '-m', 'immediate', 'stop'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2 @@
+-- Хеши паролей PBKDF2 длиннее исходных значений, расширяем колонку
+ALTER TABLE employees ALTER COLUMN password_hash TYPE TEXT;
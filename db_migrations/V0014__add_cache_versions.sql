@@ -0,0 +1,12 @@
+-- Версии кешей, общие для всех тёплых инстансов функции
+CREATE SEQUENCE IF NOT EXISTS cache_versions_seq;
+
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name, version)
+VALUES ('employees', nextval('cache_versions_seq'))
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,3 @@
+-- Индексы для выборки смен по диапазону дат и поступлений чатов по времени
+CREATE INDEX IF NOT EXISTS idx_shifts_date ON shifts(shift_date, start_time);
+CREATE INDEX IF NOT EXISTS idx_chats_created_at ON chats(created_at);
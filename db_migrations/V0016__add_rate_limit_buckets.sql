@@ -0,0 +1,7 @@
+-- Общие бакеты ограничения частоты запросов; UNLOGGED - состояние не критично при сбое,
+-- fillfactor оставляет место для HOT-обновлений
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    bucket_key VARCHAR(200) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITH (fillfactor = 70);
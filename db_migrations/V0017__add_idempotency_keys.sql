@@ -0,0 +1,11 @@
+-- Ответы на запросы с ключом идемпотентности; повтор возвращает сохранённый ответ
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idem_key CHAR(64) PRIMARY KEY,
+    request_hash CHAR(64) NOT NULL,
+    status_code SMALLINT,
+    response_body TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at);
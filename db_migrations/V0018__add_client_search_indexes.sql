@@ -0,0 +1,15 @@
+-- Поиск клиентов по подстроке имени, email, телефона и IP через триграммы
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_clients_name_trgm ON clients USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clients_email_trgm ON clients USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clients_phone_trgm ON clients USING gin (phone gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clients_ip_trgm ON clients USING gin (ip_address gin_trgm_ops);
+
+-- Keyset-пагинация по (last_seen, id); NULL в last_seen выпадал бы из сравнения кортежей
+UPDATE clients SET last_seen = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE last_seen IS NULL;
+ALTER TABLE clients ALTER COLUMN last_seen SET NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_clients_last_seen_id ON clients(last_seen DESC, id DESC);
+
+-- Счётчик открытых чатов клиента
+CREATE INDEX IF NOT EXISTS idx_chats_client_open ON chats(client_id) WHERE status <> 'closed';
@@ -0,0 +1,6 @@
+-- Присутствие операторов по heartbeat; UNLOGGED - после сбоя операторы просто отметятся заново,
+-- last_seen_at без индекса и fillfactor с запасом - обновления идут как HOT
+CREATE UNLOGGED TABLE IF NOT EXISTS operator_presence (
+    operator_name VARCHAR(255) PRIMARY KEY,
+    last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITH (fillfactor = 50);
@@ -0,0 +1,5 @@
+-- Индексы для выборок политик хранения: зависшие ожидающие и давно закрытые чаты,
+-- корпоративные сообщения по дате
+CREATE INDEX IF NOT EXISTS idx_chats_waiting_updated ON chats(updated_at) WHERE status = 'waiting';
+CREATE INDEX IF NOT EXISTS idx_chats_closed_updated ON chats(updated_at) WHERE status = 'closed';
+CREATE INDEX IF NOT EXISTS idx_corporate_messages_created ON corporate_messages(created_at);
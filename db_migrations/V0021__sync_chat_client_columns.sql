@@ -0,0 +1,16 @@
+-- Копия данных клиента в chats той же ширины, что и в clients (увеличение VARCHAR без перезаписи таблицы)
+ALTER TABLE chats ALTER COLUMN client_name TYPE VARCHAR(255);
+ALTER TABLE chats ALTER COLUMN email TYPE VARCHAR(255);
+ALTER TABLE chats ALTER COLUMN phone TYPE VARCHAR(50);
+
+-- Дозаполнение чатов, созданных после V0005 без копии данных клиента
+UPDATE chats c
+SET client_name = cl.name, email = cl.email, phone = cl.phone, ip_address = cl.ip_address
+FROM clients cl
+WHERE c.client_id = cl.id
+  AND (c.client_name, c.email, c.phone, c.ip_address) IS DISTINCT FROM (cl.name, cl.email, cl.phone, cl.ip_address);
+
+-- Покрывающий индекс листингов чатов по updated_at: строки отдаются без сортировки и без чтения таблицы
+CREATE INDEX IF NOT EXISTS idx_chats_updated_covering ON chats(updated_at DESC)
+    INCLUDE (id, status, assigned_operator, created_at, assigned_at, deadline, extension_requested,
+             extension_deadline, client_name, email, phone, ip_address);
@@ -0,0 +1,16 @@
+-- Очередь проверки QC: закрытые чаты по выборке и с низкой оценкой клиента;
+-- проверенные удаляются, так что размер таблицы - объём непроверенной работы
+CREATE TABLE IF NOT EXISTS qc_queue (
+    id SERIAL PRIMARY KEY,
+    chat_id INTEGER NOT NULL UNIQUE REFERENCES chats(id),
+    operator_name VARCHAR(100),
+    reason VARCHAR(20) NOT NULL,
+    priority SMALLINT NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    claimed_by VARCHAR(100),
+    claimed_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_qc_queue_pending ON qc_queue(priority DESC, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_qc_queue_claimed ON qc_queue(claimed_by, claimed_at) WHERE status = 'claimed';
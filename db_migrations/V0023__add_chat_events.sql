@@ -0,0 +1,14 @@
+-- Журнал изменений чатов (outbox): строки пишутся в транзакции самого изменения и не меняются.
+-- tx_id - транзакция записи: читатель отдаёт события в порядке (tx_id, seq) только из транзакций
+-- старше xmin своего снимка, поэтому поздно зафиксированная транзакция не окажется позади курсора
+CREATE TABLE IF NOT EXISTS chat_events (
+    seq BIGSERIAL PRIMARY KEY,
+    tx_id XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    event_type VARCHAR(50) NOT NULL,
+    chat_id INTEGER,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_events_tx_seq ON chat_events(tx_id, seq);
+CREATE INDEX IF NOT EXISTS idx_chat_events_chat ON chat_events(chat_id);
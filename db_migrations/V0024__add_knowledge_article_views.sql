@@ -0,0 +1,9 @@
+-- Журнал просмотров статей базы знаний: только INSERT, без блокировок строк статей.
+-- Периодический сброс суммирует пачку и увеличивает knowledge_articles.views одним UPDATE на статью;
+-- views не индексируется, чтобы эти обновления оставались HOT
+CREATE TABLE IF NOT EXISTS knowledge_article_views (
+    id BIGSERIAL PRIMARY KEY,
+    article_id INTEGER NOT NULL,
+    views INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
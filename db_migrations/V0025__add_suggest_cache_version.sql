@@ -0,0 +1,5 @@
+-- Версия индекса подсказок по базе знаний и шаблонам Jira; строка нужна заранее,
+-- чтобы первое изменение уже блокировало её и получало предыдущую версию
+INSERT INTO cache_versions (name, version)
+VALUES ('suggest', nextval('cache_versions_seq'))
+ON CONFLICT (name) DO NOTHING;
@@ -4,6 +4,7 @@ import { Input } from '@/components/ui/input';
 import { Avatar, AvatarFallback } from '@/components/ui/avatar';
 import { ScrollArea } from '@/components/ui/scroll-area';
 import Icon from '@/components/ui/icon';
+import { chatFetch } from '@/lib/chatApi';
 
 const CHAT_API_URL = 'https://functions.poehali.dev/a33a1e04-98e5-4c92-8585-2a7f74db1d36';
 
@@ -40,6 +41,8 @@ const getClientIP = async (): Promise<string> => {
 const ClientChat = ({ user, onLogout }: ClientChatProps) => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [newMessage, setNewMessage] = useState('');
+  // Ключ идемпотентности набранного сообщения: повторная отправка после ошибки идёт с тем же ключом
+  const [messageId, setMessageId] = useState<string | null>(null);
   const [chatId, setChatId] = useState<number | null>(null);
   const [ipAddress, setIpAddress] = useState<string>('');
   const [loading, setLoading] = useState(true);
@@ -50,7 +53,7 @@ const ClientChat = ({ user, onLogout }: ClientChatProps) => {
       setIpAddress(ip);
 
       try {
-        const response = await fetch(CHAT_API_URL, {
+        const response = await chatFetch(CHAT_API_URL, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -67,7 +70,7 @@ const ClientChat = ({ user, onLogout }: ClientChatProps) => {
         const data = await response.json();
         setChatId(data.chatId);
 
-        const messagesResponse = await fetch(
+        const messagesResponse = await chatFetch(
           `${CHAT_API_URL}?action=messages&chatId=${data.chatId}`
         );
         const messagesData = await messagesResponse.json();
@@ -99,7 +102,7 @@ const ClientChat = ({ user, onLogout }: ClientChatProps) => {
 
     const interval = setInterval(async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=messages&chatId=${chatId}`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=messages&chatId=${chatId}`);
         const data = await response.json();
 
         const loadedMessages = data.messages.map((msg: any) => ({
@@ -126,8 +129,11 @@ const ClientChat = ({ user, onLogout }: ClientChatProps) => {
     e.preventDefault();
     if (!newMessage.trim() || !chatId) return;
 
+    const clientMessageId = messageId ?? crypto.randomUUID();
+    setMessageId(clientMessageId);
+
     try {
-      await fetch(CHAT_API_URL, {
+      const response = await chatFetch(CHAT_API_URL, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -138,10 +144,15 @@ const ClientChat = ({ user, onLogout }: ClientChatProps) => {
           senderType: 'client',
           senderName: user.name,
           message: newMessage,
+          clientMessageId,
         }),
       });
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
 
       setNewMessage('');
+      setMessageId(null);
     } catch (error) {
       console.error('Failed to send message:', error);
     }
@@ -224,7 +235,10 @@ const ClientChat = ({ user, onLogout }: ClientChatProps) => {
             type="text"
             placeholder="Введите сообщение..."
             value={newMessage}
-            onChange={(e) => setNewMessage(e.target.value)}
+            onChange={(e) => {
+              setNewMessage(e.target.value);
+              setMessageId(null);
+            }}
             className="flex-1"
           />
           <Button type="submit" size="icon" className="shrink-0">
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import { Avatar, AvatarFallback } from '@/components/ui/avatar';
 import { Badge } from '@/components/ui/badge';
@@ -13,13 +13,18 @@ import { Alert, AlertDescription } from '@/components/ui/alert';
 import { Separator } from '@/components/ui/separator';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import Icon from '@/components/ui/icon';
+import { chatFetch } from '@/lib/chatApi';
 
 const CHAT_API_URL = 'https://functions.poehali.dev/a33a1e04-98e5-4c92-8585-2a7f74db1d36';
 
+const clientSearchQuery = (search: string) =>
+  search.trim() ? `&q=${encodeURIComponent(search.trim())}` : '';
+
 interface User {
   name: string;
   role: 'operator' | 'okk' | 'admin' | 'editor' | 'jira_operator';
   roles?: string[];
+  token?: string;
 }
 
 interface EmployeeDashboardProps {
@@ -43,6 +48,10 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
   const [messageText, setMessageText] = useState('');
   const [employees, setEmployees] = useState<any[]>([]);
   const [clients, setClients] = useState<any[]>([]);
+  const [clientSearch, setClientSearch] = useState('');
+  const [clientsCursor, setClientsCursor] = useState<string | null>(null);
+  const clientsExpanded = useRef(false);
+  const clientsSearched = useRef(false);
   const [newChatNotifications, setNewChatNotifications] = useState<number[]>([]);
   const [knowledgeArticles, setKnowledgeArticles] = useState<any[]>([]);
   const [isEditingArticle, setIsEditingArticle] = useState(false);
@@ -121,7 +130,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
   useEffect(() => {
     const updateStatus = async () => {
       try {
-        await fetch(CHAT_API_URL, {
+        await chatFetch(CHAT_API_URL, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
@@ -138,10 +147,30 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     updateStatus();
   }, [operatorStatus, user.name]);
 
+  useEffect(() => {
+    if (operatorStatus !== 'online') return;
+
+    // Без heartbeat оператор через PRESENCE_TTL_SECONDS считается ушедшим, его чаты возвращаются в очередь
+    const sendHeartbeat = async () => {
+      try {
+        await chatFetch(CHAT_API_URL, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', 'X-Auth-Token': user.token || '' },
+          body: JSON.stringify({ action: 'heartbeat', operatorName: user.name }),
+        });
+      } catch (error) {
+        console.error('Failed to send heartbeat:', error);
+      }
+    };
+
+    const interval = setInterval(sendHeartbeat, 15000);
+    return () => clearInterval(interval);
+  }, [operatorStatus, user.name]);
+
   useEffect(() => {
     const fetchChats = async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=list&operatorName=${user.name}`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=list&operatorName=${user.name}`);
         const data = await response.json();
         
         const formattedChats = data.chats.map((chat: any) => ({
@@ -193,12 +222,37 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     }
   }, []);
 
+  useEffect(() => {
+    const include = [
+      hasAccess('employeeManagement') && 'employees',
+      hasAccess('clientsDatabase') && 'clients',
+    ].filter(Boolean);
+    if (include.length === 0) return;
+
+    // Первичная загрузка справочников одним вызовом вместо отдельного запроса на каждый
+    const fetchBootstrap = async () => {
+      try {
+        const response = await chatFetch(`${CHAT_API_URL}?action=bootstrap&include=${include.join(',')}`);
+        const { results } = await response.json();
+        if (results.employees?.statusCode === 200) setEmployees(results.employees.body.employees);
+        if (results.clients?.statusCode === 200) {
+          setClients(results.clients.body.clients);
+          setClientsCursor(results.clients.body.nextCursor);
+        }
+      } catch (error) {
+        console.error('Failed to bootstrap dashboard:', error);
+      }
+    };
+
+    fetchBootstrap();
+  }, []);
+
   useEffect(() => {
     if (!hasAccess('employeeManagement')) return;
     
     const fetchEmployees = async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=employees`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=employees`);
         const data = await response.json();
         setEmployees(data.employees);
       } catch (error) {
@@ -206,7 +260,6 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
       }
     };
 
-    fetchEmployees();
     const interval = setInterval(fetchEmployees, 5000);
     return () => clearInterval(interval);
   }, []);
@@ -214,27 +267,49 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
   useEffect(() => {
     if (!hasAccess('clientsDatabase')) return;
     
-    const fetchClients = async () => {
+    const fetchClients = async (refresh: boolean) => {
+      // Автообновление не сбрасывает догруженные страницы
+      if (refresh && clientsExpanded.current) return;
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=clients`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=clients${clientSearchQuery(clientSearch)}`);
         const data = await response.json();
+        clientsExpanded.current = false;
         setClients(data.clients);
+        setClientsCursor(data.nextCursor);
       } catch (error) {
         console.error('Failed to fetch clients:', error);
       }
     };
 
-    fetchClients();
-    const interval = setInterval(fetchClients, 10000);
-    return () => clearInterval(interval);
-  }, []);
+    // Первую страницу при открытии панели отдаёт bootstrap, дальше - поиск с задержкой ввода
+    const timeout = clientsSearched.current ? setTimeout(() => fetchClients(false), 300) : undefined;
+    const interval = setInterval(() => fetchClients(true), 10000);
+    return () => {
+      clearTimeout(timeout);
+      clearInterval(interval);
+    };
+  }, [clientSearch]);
+
+  const loadMoreClients = async () => {
+    if (!clientsCursor) return;
+    try {
+      const cursor = `&cursor=${encodeURIComponent(clientsCursor)}`;
+      const response = await chatFetch(`${CHAT_API_URL}?action=clients${clientSearchQuery(clientSearch)}${cursor}`);
+      const data = await response.json();
+      clientsExpanded.current = true;
+      setClients(prev => [...prev, ...data.clients]);
+      setClientsCursor(data.nextCursor);
+    } catch (error) {
+      console.error('Failed to load more clients:', error);
+    }
+  };
 
   useEffect(() => {
     if (activeTab !== 'knowledge' && activeTab !== 'news') return;
     
     const fetchKnowledge = async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=knowledge`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=knowledge`);
         const data = await response.json();
         setKnowledgeArticles(data.articles || []);
       } catch (error) {
@@ -251,7 +326,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     
     const fetchShifts = async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=shifts`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=shifts`);
         const data = await response.json();
         setShifts(data.shifts);
       } catch (error) {
@@ -267,7 +342,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     
     const fetchTemplates = async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=jiraTemplates`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=jiraTemplates`);
         const data = await response.json();
         setJiraTemplates(data.templates || []);
       } catch (error) {
@@ -283,7 +358,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     
     const fetchArchive = async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=qcArchive`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=qcArchive`);
         const data = await response.json();
         setQcArchive(data.archive || []);
       } catch (error) {
@@ -298,7 +373,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     if (!messageText.trim()) return;
     
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -312,7 +387,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
 
       setMessageText('');
       
-      const response = await fetch(`${CHAT_API_URL}?action=messages&chatId=${chatId}`);
+      const response = await chatFetch(`${CHAT_API_URL}?action=messages&chatId=${chatId}`);
       const data = await response.json();
       const loadedMessages = data.messages.map((msg: any) => ({
         id: msg.id,
@@ -334,7 +409,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     setNewChatNotifications(prev => prev.filter(id => id !== chatId));
 
     try {
-      const response = await fetch(`${CHAT_API_URL}?action=messages&chatId=${chatId}`);
+      const response = await chatFetch(`${CHAT_API_URL}?action=messages&chatId=${chatId}`);
       const data = await response.json();
 
       const loadedMessages = data.messages.map((msg: any) => ({
@@ -354,7 +429,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
 
   const handleEmployeeStatusChange = async (employeeName: string, newStatus: string) => {
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -374,7 +449,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
 
   const handleCloseChat = async (chatId: number, reason: string) => {
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -395,7 +470,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
 
   const handlePostponeChat = async (chatId: number, date: string, time: string) => {
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -419,7 +494,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
 
   const handleEscalateChat = async (chatId: number) => {
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -440,7 +515,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
 
   const handleExtendChat = async (chatId: number) => {
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -455,7 +530,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
 
   const handleAcceptChat = async (chatId: number) => {
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -475,7 +550,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
   const handleSaveArticle = async () => {
     try {
       if (currentArticle.id) {
-        await fetch(CHAT_API_URL, {
+        await chatFetch(CHAT_API_URL, {
           method: 'PUT',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
@@ -487,7 +562,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
           }),
         });
       } else {
-        await fetch(CHAT_API_URL, {
+        await chatFetch(CHAT_API_URL, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
@@ -500,7 +575,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
         });
       }
 
-      const response = await fetch(`${CHAT_API_URL}?action=knowledge`);
+      const response = await chatFetch(`${CHAT_API_URL}?action=knowledge`);
       const data = await response.json();
       setKnowledgeArticles(data.articles);
       setIsEditingArticle(false);
@@ -513,7 +588,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
   const handleSaveShift = async () => {
     try {
       if (currentShift.id) {
-        await fetch(CHAT_API_URL, {
+        await chatFetch(CHAT_API_URL, {
           method: 'PUT',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
@@ -527,7 +602,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
           }),
         });
       } else {
-        await fetch(CHAT_API_URL, {
+        await chatFetch(CHAT_API_URL, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
@@ -541,7 +616,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
         });
       }
 
-      const response = await fetch(`${CHAT_API_URL}?action=shifts`);
+      const response = await chatFetch(`${CHAT_API_URL}?action=shifts`);
       const data = await response.json();
       setShifts(data.shifts);
       setIsEditingShift(false);
@@ -560,7 +635,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     }
     
     try {
-      await fetch(CHAT_API_URL, {
+      await chatFetch(CHAT_API_URL, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -573,8 +648,8 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
         }),
       });
 
-      await fetch(CHAT_API_URL, {
-        method: 'POST',
+      await chatFetch(CHAT_API_URL, {
+        method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           action: 'archiveQcRating',
@@ -590,29 +665,32 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
       setRatingComment('');
       setSelectedRatingChat(null);
 
-      const response = await fetch(`${CHAT_API_URL}?action=closedChats`);
-      const data = await response.json();
-      setClosedChats(data.chats);
+      await claimQcItems();
     } catch (error) {
       console.error('Failed to submit rating:', error);
     }
   };
 
+  // Тикеты на проверку выдаёт серверная очередь QC: уже взятые проверяющим плюс новые
+  const claimQcItems = async () => {
+    try {
+      const response = await chatFetch(CHAT_API_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action: 'claimQcItems', qcName: user.name }),
+      });
+      const data = await response.json();
+      setClosedChats(data.items || []);
+    } catch (error) {
+      console.error('Failed to claim QC items:', error);
+    }
+  };
+
   useEffect(() => {
     if (!hasAccess('qcPortal')) return;
-    
-    const fetchClosedChats = async () => {
-      try {
-        const response = await fetch(`${CHAT_API_URL}?action=closedChats`);
-        const data = await response.json();
-        setClosedChats(data.chats);
-      } catch (error) {
-        console.error('Failed to fetch closed chats:', error);
-      }
-    };
 
     if (activeTab === 'qcPortal') {
-      fetchClosedChats();
+      claimQcItems();
     }
   }, [activeTab]);
 
@@ -621,7 +699,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
     
     const fetchRatings = async () => {
       try {
-        const response = await fetch(`${CHAT_API_URL}?action=ratings&operatorName=${user.name}`);
+        const response = await chatFetch(`${CHAT_API_URL}?action=ratings&operatorName=${user.name}`);
         const data = await response.json();
         setRatings(data.ratings);
       } catch (error) {
@@ -1139,9 +1217,9 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                                         onClick={async () => {
                                           try {
                                             if (hasRole) {
-                                              await fetch(CHAT_API_URL, {
-                                                method: 'POST',
-                                                headers: { 'Content-Type': 'application/json' },
+                                              await chatFetch(CHAT_API_URL, {
+                                                method: 'PUT',
+                                                headers: { 'Content-Type': 'application/json', 'X-Auth-Token': user.token || '' },
                                                 body: JSON.stringify({
                                                   action: 'removeEmployeeRole',
                                                   employeeId: employee.id,
@@ -1149,9 +1227,9 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                                                 })
                                               });
                                             } else {
-                                              await fetch(CHAT_API_URL, {
-                                                method: 'POST',
-                                                headers: { 'Content-Type': 'application/json' },
+                                              await chatFetch(CHAT_API_URL, {
+                                                method: 'PUT',
+                                                headers: { 'Content-Type': 'application/json', 'X-Auth-Token': user.token || '' },
                                                 body: JSON.stringify({
                                                   action: 'addEmployeeRole',
                                                   employeeId: employee.id,
@@ -1159,7 +1237,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                                                 })
                                               });
                                             }
-                                            const response = await fetch(`${CHAT_API_URL}?action=employees`);
+                                            const response = await chatFetch(`${CHAT_API_URL}?action=employees`);
                                             const data = await response.json();
                                             setEmployees(data.employees);
                                           } catch (error) {
@@ -1667,8 +1745,8 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                       <Button onClick={async () => {
                         try {
                           const action = currentTemplate?.id ? 'updateJiraTemplate' : 'createJiraTemplate';
-                          await fetch(CHAT_API_URL, {
-                            method: 'POST',
+                          await chatFetch(CHAT_API_URL, {
+                            method: 'PUT',
                             headers: { 'Content-Type': 'application/json' },
                             body: JSON.stringify({
                               action,
@@ -1679,7 +1757,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                           });
                           setIsEditingTemplate(false);
                           setCurrentTemplate(null);
-                          const response = await fetch(`${CHAT_API_URL}?action=jiraTemplates`);
+                          const response = await chatFetch(`${CHAT_API_URL}?action=jiraTemplates`);
                           const data = await response.json();
                           setJiraTemplates(data.templates);
                         } catch (error) {
@@ -1728,12 +1806,12 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                                   size="sm"
                                   onClick={async () => {
                                     if (confirm('Удалить шаблон?')) {
-                                      await fetch(CHAT_API_URL, {
-                                        method: 'POST',
+                                      await chatFetch(CHAT_API_URL, {
+                                        method: 'PUT',
                                         headers: { 'Content-Type': 'application/json' },
                                         body: JSON.stringify({ action: 'deleteJiraTemplate', templateId: template.id })
                                       });
-                                      const response = await fetch(`${CHAT_API_URL}?action=jiraTemplates`);
+                                      const response = await chatFetch(`${CHAT_API_URL}?action=jiraTemplates`);
                                       const data = await response.json();
                                       setJiraTemplates(data.templates);
                                     }
@@ -1832,6 +1910,15 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                 </CardTitle>
               </CardHeader>
               <CardContent>
+                <Input
+                  className="mb-4"
+                  placeholder="Поиск по имени, email, телефону или IP"
+                  value={clientSearch}
+                  onChange={(e) => {
+                    clientsSearched.current = true;
+                    setClientSearch(e.target.value);
+                  }}
+                />
                 <ScrollArea className="h-[600px]">
                   <div className="space-y-3">
                     {clients.map((client: any) => (
@@ -1861,9 +1948,18 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                             <Label className="text-xs text-muted-foreground">Последнее обращение</Label>
                             <p className="text-sm">{new Date(client.lastSeen).toLocaleString('ru-RU')}</p>
                           </div>
+                          <div>
+                            <Label className="text-xs text-muted-foreground">Открытые чаты</Label>
+                            <p className="text-sm">{client.openChats ?? 0}</p>
+                          </div>
                         </div>
                       </div>
                     ))}
+                    {clientsCursor && (
+                      <Button variant="outline" className="w-full" onClick={loadMoreClients}>
+                        Показать ещё
+                      </Button>
+                    )}
                     {clients.length === 0 && (
                       <div className="text-center py-12 text-muted-foreground">
                         <Icon name="Database" size={48} className="mx-auto mb-3 opacity-30" />
@@ -1891,7 +1987,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                     <Icon name="Menu" size={20} />
                   </Button>
                   <Icon name="ClipboardCheck" size={20} />
-                  QC Портал - Закрытые тикеты
+                  QC Портал - Тикеты на проверку
                 </CardTitle>
                 <CardDescription>
                   Оценка качества обработки обращений
@@ -1912,6 +2008,11 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                                 <h4 className="font-semibold">{chat.clientName || 'Клиент'}</h4>
                                 <p className="text-xs text-muted-foreground">ID тикета: {chat.id}</p>
                               </div>
+                              {chat.reason === 'lowRating' && (
+                                <Badge variant="outline" className="bg-red-500/10 text-red-600">
+                                  Низкая оценка клиента
+                                </Badge>
+                              )}
                             </div>
                             <div className="grid grid-cols-2 gap-3 text-sm mb-3">
                               <div>
@@ -1997,7 +2098,7 @@ const EmployeeDashboard = ({ user, onLogout }: EmployeeDashboardProps) => {
                     {closedChats.length === 0 && (
                       <div className="text-center py-12 text-muted-foreground">
                         <Icon name="ClipboardCheck" size={48} className="mx-auto mb-3 opacity-30" />
-                        <p>Нет закрытых тикетов</p>
+                        <p>Нет тикетов на проверку</p>
                       </div>
                     )}
                   </div>
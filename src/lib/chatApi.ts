@@ -0,0 +1,18 @@
+const READ_AFTER_HEADER = 'X-Read-After-LSN';
+
+// LSN последней записи: GET с ним не уйдёт на отстающую реплику
+let readAfterLsn: string | null = null;
+
+export async function chatFetch(url: string, init: RequestInit = {}): Promise<Response> {
+  const method = (init.method || 'GET').toUpperCase();
+  const target = method === 'GET' && readAfterLsn
+    ? `${url}${url.includes('?') ? '&' : '?'}readAfterLsn=${encodeURIComponent(readAfterLsn)}`
+    : url;
+
+  const response = await fetch(target, init);
+  const lsn = response.headers.get(READ_AFTER_HEADER);
+  if (lsn) {
+    readAfterLsn = lsn;
+  }
+  return response;
+}
@@ -14,6 +14,7 @@ interface User {
   email?: string;
   role: UserRole;
   roles?: string[];
+  token?: string;
 }
 
 const Index = () => {
@@ -26,14 +27,19 @@ const Index = () => {
 
   const handleEmployeeLogin = async (username: string, password: string) => {
     try {
-      const response = await fetch(`https://functions.poehali.dev/a33a1e04-98e5-4c92-8585-2a7f74db1d36?action=login&username=${encodeURIComponent(username)}&password=${encodeURIComponent(password)}`);
+      const response = await fetch('https://functions.poehali.dev/a33a1e04-98e5-4c92-8585-2a7f74db1d36', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action: 'login', username, password })
+      });
       const data = await response.json();
       
       if (data.success && data.employee) {
         setUser({ 
           name: data.employee.name, 
           role: data.employee.role as UserRole,
-          roles: data.employee.roles || [data.employee.role]
+          roles: data.employee.roles || [data.employee.role],
+          token: data.token
         });
       } else {
         alert('Неверный логин или пароль');